@@ -3,7 +3,11 @@ import sys, os
 sys.path.insert(0, "cactus/python/src")
 os.environ["CACTUS_NO_CLOUD_TELE"] = "1"
 
+import argparse
 import json
+import time
+import main
+import scoring
 from main import generate_hybrid
 
 
@@ -395,29 +399,256 @@ def compute_f1(predicted_calls, expected_calls):
     return 2 * precision * recall / (precision + recall)
 
 
-def run_benchmark(benchmarks=None):
-    """Run all benchmark cases and print results."""
+def _run_case(generate, case):
+    """Run one case through `generate` and score it into a result row."""
+    result = generate(case["messages"], case["tools"])
+    f1 = compute_f1(result["function_calls"], case["expected_calls"])
+    # Score-routed results carry a route_class; teach the router the true F1.
+    main._score_router_feedback(result, f1)
+    row = {
+        "name": case["name"],
+        "difficulty": case["difficulty"],
+        "total_time_ms": result["total_time_ms"],
+        "f1": f1,
+        "source": result.get("source", "unknown"),
+        "cached": bool(result.get("cache_hit")),
+        "policy_tag": result.get("policy_tag", ""),
+        "stage_timings_ms": result.get("stage_timings_ms", {}),
+        "predicted": result["function_calls"],
+        "expected": case["expected_calls"],
+    }
+    if "trace" in result:
+        row["trace"] = result["trace"]
+    return row
+
+
+def _start_run():
+    """Each run is one scored batch: restart the score router's per-tier totals
+    (its per-class F1/latency estimates carry over)."""
+    main._SCORE_ROUTER.reset_tiers()
+
+
+def _failed_case(case, source, time_ms=0.0):
+    """Result row for a case that timed out or crashed in its worker."""
+    return {
+        "name": case["name"],
+        "difficulty": case["difficulty"],
+        "total_time_ms": time_ms,
+        "f1": 0.0,
+        "source": source,
+        "cached": False,
+        "policy_tag": "",
+        "stage_timings_ms": {},
+        "predicted": [],
+        "expected": case["expected_calls"],
+    }
+
+
+def _progress(r):
+    cached = " (cached)" if r.get("cached") else ""
+    return f"F1={r['f1']:.2f} | {r['total_time_ms']:.0f}ms | {r['source']}{cached}"
+
+
+############## Parallel runner ##############
+
+_WORKER_GENERATE = None
+
+
+class _CaseTimeout(BaseException):
+    """Raised by the case alarm. A BaseException, like KeyboardInterrupt, so
+    the broad `except Exception` blocks in strategies and cloud fallback
+    cannot swallow it and keep a timed-out case running."""
+
+
+def _on_case_alarm(signum, frame):
+    raise _CaseTimeout()
+
+
+def _init_worker(strategy_module, tracing=False):
+    """Process-pool initializer: each worker imports its own copy of the strategy (and model session)."""
+    global _WORKER_GENERATE
+    import importlib
+    import signal
+
+    os.environ["CACTUS_NO_CLOUD_TELE"] = "1"
+    main._ENABLE_TRACING = tracing
+    _WORKER_GENERATE = importlib.import_module(strategy_module).generate_hybrid
+    if hasattr(signal, "SIGALRM"):
+        signal.signal(signal.SIGALRM, _on_case_alarm)
+
+
+def _run_case_in_worker(case, timeout_s):
+    """Worker entry point. The alarm fires once control is back in Python,
+    so a case stuck inside one native call ends when that call returns."""
+    import signal
+
+    use_alarm = bool(timeout_s) and hasattr(signal, "setitimer")
+    start = time.perf_counter()
+    if use_alarm:
+        signal.setitimer(signal.ITIMER_REAL, timeout_s)
+    try:
+        return _run_case(_WORKER_GENERATE, case)
+    except _CaseTimeout:
+        return _failed_case(case, "timeout", (time.perf_counter() - start) * 1000)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def run_parallel(strategy_module="main", benchmarks=None, workers=None, timeout_s=None):
+    """Run cases on a pool of worker processes; rows come back in case order.
+
+    Workers are spawned rather than forked so none of them inherits a model
+    handle from the parent. A case that exceeds `timeout_s` scores as source
+    "timeout"; one whose worker raises or dies scores as "error" without
+    taking the rest of the run down.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    import multiprocessing
+
     if benchmarks is None:
         benchmarks = BENCHMARKS
-
     total = len(benchmarks)
-    results = []
-    for i, case in enumerate(benchmarks, 1):
-        print(f"[{i}/{total}] Running: {case['name']} ({case['difficulty']})...", end=" ", flush=True)
-        result = generate_hybrid(case["messages"], case["tools"])
-        f1 = compute_f1(result["function_calls"], case["expected_calls"])
-        source = result.get("source", "unknown")
-        print(f"F1={f1:.2f} | {result['total_time_ms']:.0f}ms | {source}")
-        results.append({
-            "name": case["name"],
-            "difficulty": case["difficulty"],
-            "total_time_ms": result["total_time_ms"],
-            "f1": f1,
-            "source": source,
-            "predicted": result["function_calls"],
-            "expected": case["expected_calls"],
-        })
+    results = [None] * total
+    pool = ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count() or 1,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(strategy_module, main._ENABLE_TRACING),
+    )
+    with pool:
+        futures = {pool.submit(_run_case_in_worker, case, timeout_s): i for i, case in enumerate(benchmarks)}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            case = benchmarks[i]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                results[i] = _failed_case(case, f"error ({type(e).__name__})")
+            print(f"[{done}/{total}] {case['name']} ({case['difficulty']}) {_progress(results[i])}", flush=True)
+    return results
 
+
+############## Latency histograms ##############
+
+class LatencyHistogram:
+    """HDR-style latency histogram with microsecond resolution.
+
+    Values below `2 * sub_buckets` us are counted exactly; above that each
+    power-of-two range is split into `sub_buckets` linear buckets, so any
+    reported percentile is within 1/sub_buckets (<1% at the default of 128)
+    of the true value, from sub-millisecond fast paths to multi-second cloud
+    fallbacks, at a fixed memory cost.
+    """
+
+    def __init__(self, sub_buckets=128):
+        self.sub_buckets = sub_buckets
+        self.counts = {}
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def _bucket(self, us):
+        shift = max(0, us.bit_length() - self.sub_buckets.bit_length())
+        return (us >> shift) << shift, (1 << shift) - 1
+
+    def record(self, ms):
+        lower, _ = self._bucket(max(0, int(round(ms * 1000))))
+        self.counts[lower] = self.counts.get(lower, 0) + 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, pct):
+        """Highest value equivalent to the nearest-rank `pct` sample, in ms."""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(round(pct / 100.0 * self.count)))
+        seen = 0
+        for lower in sorted(self.counts):
+            seen += self.counts[lower]
+            if seen >= rank:
+                _, width = self._bucket(lower)
+                return min(self.max_ms, (lower + width) / 1000.0)
+        return self.max_ms
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max_ms,
+            "buckets_us": {str(lower): n for lower, n in sorted(self.counts.items())},
+        }
+
+
+def latency_histograms(results):
+    """{group: LatencyHistogram} over total time per difficulty, source and
+    policy tag (prefix before "::"), plus one per pipeline stage."""
+    groups = {}
+
+    def _record(group, ms):
+        groups.setdefault(group, LatencyHistogram()).record(ms)
+
+    for r in results:
+        _record("overall", r["total_time_ms"])
+        _record(f"difficulty:{r['difficulty']}", r["total_time_ms"])
+        _record(f"source:{r['source']}", r["total_time_ms"])
+        if r.get("policy_tag"):
+            _record(f"policy:{r['policy_tag'].split('::')[0]}", r["total_time_ms"])
+        for stage, ms in (r.get("stage_timings_ms") or {}).items():
+            _record(f"stage:{stage}", ms)
+    return groups
+
+
+def print_latency_report(results):
+    groups = latency_histograms(results)
+    order = ["overall"] + [f"difficulty:{d}" for d in ("easy", "medium", "hard")]
+    order += sorted(g for g in groups if g not in order)
+    print(f"\n--- Latency (ms) ---")
+    print(f"  {'Group':<36} | {'n':>3} | {'p50':>8} | {'p90':>8} | {'p99':>8} | {'max':>8}")
+    print(f"  {'-'*36}-+-{'-'*3}-+-{'-'*8}-+-{'-'*8}-+-{'-'*8}-+-{'-'*8}")
+    for group in order:
+        h = groups.get(group)
+        if h is None:
+            continue
+        print(f"  {group:<36} | {h.count:>3} | {h.percentile(50):>8.2f} | {h.percentile(90):>8.2f} | {h.percentile(99):>8.2f} | {h.max_ms:>8.2f}")
+    return groups
+
+
+def write_json_report(results, path, strategy="main"):
+    """Machine-readable companion to the markdown logs in benchmark_runs/."""
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "strategy": strategy,
+        "score": compute_total_score(results),
+        "latency": {group: h.to_dict() for group, h in sorted(latency_histograms(results).items())},
+        "cases": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {path}")
+    return report
+
+
+def write_chrome_trace(results, path):
+    """Write the span trees of traced results as one Chrome trace, one process row per case."""
+    events = []
+    for pid, r in enumerate(results, 1):
+        if not r.get("trace"):
+            continue
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"{pid:02d} {r['name']}"}})
+        events.extend(main._chrome_trace_events(r["trace"], pid=pid))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    print(f"Wrote {path}")
+
+
+def print_results(results):
+    """Print the results table, per-difficulty summary and total score; return the score."""
     print("\n=== Benchmark Results ===\n")
     print(f"  {'#':>2} | {'Difficulty':<10} | {'Name':<28} | {'Time (ms)':>10} | {'F1':>5} | Source")
     print(f"  {'--':>2}-+-{'-'*10}-+-{'-'*28}-+-{'-'*10}-+-{'-'*5}-+-{'-'*20}")
@@ -442,13 +673,51 @@ def run_benchmark(benchmarks=None):
     cloud_total = len(results) - on_device_total
     print(f"  {'overall':<8} avg F1={avg_f1:.2f}  avg time={avg_time:.2f}ms  total time={total_time:.2f}ms")
     print(f"           on-device={on_device_total}/{len(results)} ({100*on_device_total/len(results):.0f}%)  cloud={cloud_total}/{len(results)} ({100*cloud_total/len(results):.0f}%)")
+    cached_total = sum(1 for r in results if r.get("cached"))
+    if cached_total:
+        computed = [r for r in results if not r.get("cached")]
+        computed_avg = sum(r["total_time_ms"] for r in computed) / len(computed) if computed else 0.0
+        print(f"           cached={cached_total}/{len(results)}  computed avg time={computed_avg:.2f}ms")
+
+    print_latency_report(results)
 
     # Total score
     score = compute_total_score(results)
     print(f"\n{'='*50}")
     print(f"  TOTAL SCORE: {score:.1f}%")
     print(f"{'='*50}")
+    return score
+
 
+def run_benchmark(benchmarks=None, workers=1, timeout_s=None, json_path=None, trace_path=None):
+    """Run all benchmark cases and print results.
+
+    With `workers` > 1 the cases run on a process pool (see run_parallel);
+    the table is the same either way. `json_path` also writes a JSON report,
+    `trace_path` turns on tracing and writes a Chrome trace.
+    """
+    if trace_path:
+        main._ENABLE_TRACING = True
+    if benchmarks is None:
+        benchmarks = BENCHMARKS
+
+    total = len(benchmarks)
+    _start_run()
+    if workers > 1:
+        results = run_parallel("main", benchmarks, workers=workers, timeout_s=timeout_s)
+    else:
+        results = []
+        for i, case in enumerate(benchmarks, 1):
+            print(f"[{i}/{total}] Running: {case['name']} ({case['difficulty']})...", end=" ", flush=True)
+            r = _run_case(generate_hybrid, case)
+            print(_progress(r))
+            results.append(r)
+
+    print_results(results)
+    if json_path:
+        write_json_report(results, json_path)
+    if trace_path:
+        write_chrome_trace(results, trace_path)
     return results
 
 
@@ -456,9 +725,9 @@ def compute_total_score(results):
     """
     Compute a total score from 0-100% as a weighted sum across difficulty levels.
 
-    Components (per difficulty level):
-      - F1 score (50%): accuracy of tool calls
-      - Time score (25%): faster is better, capped at 500ms baseline
+    Components (per difficulty level, see scoring.py):
+      - F1 score (60%): accuracy of tool calls
+      - Time score (15%): faster is better, capped at 500ms baseline
       - On-device ratio (25%): higher on-device usage is better
 
     Difficulty weights:
@@ -466,11 +735,8 @@ def compute_total_score(results):
       - medium: 30%
       - hard: 50%
     """
-    difficulty_weights = {"easy": 0.20, "medium": 0.30, "hard": 0.50}
-    time_baseline_ms = 500  # anything under this gets full marks
-
     total_score = 0
-    for difficulty, weight in difficulty_weights.items():
+    for difficulty, weight in scoring.DIFFICULTY_WEIGHTS.items():
         group = [r for r in results if r["difficulty"] == difficulty]
         if not group:
             continue
@@ -479,13 +745,73 @@ def compute_total_score(results):
         avg_time = sum(r["total_time_ms"] for r in group) / len(group)
         on_device_ratio = sum(1 for r in group if r["source"] == "on-device") / len(group)
 
-        time_score = max(0, 1 - avg_time / time_baseline_ms)
-
-        level_score = (0.60 * avg_f1) + (0.15 * time_score) + (0.25 * on_device_ratio)
-        total_score += weight * level_score
+        total_score += weight * scoring.level_score(avg_f1, avg_time, on_device_ratio)
 
     return total_score * 100
 
 
+def run_prefix_cache_benchmark(benchmarks=None, repeats=3):
+    """Compare on-device prefill vs decode time with and without prefix reuse.
+
+    Each single-intent case is sent `repeats` times in a row so the cached
+    (system prompt, tools) prefix has a chance to be reused by the pool.
+    """
+    if benchmarks is None:
+        benchmarks = BENCHMARKS
+    cases = [c for c in benchmarks if not main._is_multi_action(main._messages_to_user_text(c["messages"]))]
+
+    saved = main._ENABLE_PREFIX_CACHE
+    rows = []
+    try:
+        for enabled in (False, True):
+            main._ENABLE_PREFIX_CACHE = enabled
+            main._MODEL_POOL.prefix_hits = 0
+            main._MODEL_POOL.prefix_misses = 0
+            samples = []
+            for case in cases:
+                user_text = main._messages_to_user_text(case["messages"])
+                for _ in range(repeats):
+                    samples.append(main._call_cactus_single(user_text, case["tools"]))
+            rows.append((
+                "prefix cache" if enabled else "no cache",
+                samples,
+                main._MODEL_POOL.prefix_hits,
+                main._MODEL_POOL.prefix_misses,
+            ))
+    finally:
+        main._ENABLE_PREFIX_CACHE = saved
+
+    print("\n=== Prefix Cache Benchmark ===\n")
+    print(f"  {'Mode':<12} | {'Calls':>5} | {'Prefill (ms)':>12} | {'Decode (ms)':>11} | {'Prefill tok':>11} | {'Total (ms)':>10} | Hits")
+    print(f"  {'-'*12}-+-{'-'*5}-+-{'-'*12}-+-{'-'*11}-+-{'-'*11}-+-{'-'*10}-+-{'-'*9}")
+    for label, samples, hits, misses in rows:
+        n = max(1, len(samples))
+        prefill = sum(r.get("prefill_ms", 0.0) for r in samples) / n
+        decode = sum(r.get("decode_ms", 0.0) for r in samples) / n
+        tokens = sum(r.get("prefill_tokens", 0) for r in samples) / n
+        total = sum(r.get("total_time_ms", 0.0) for r in samples) / n
+        print(f"  {label:<12} | {len(samples):>5} | {prefill:>12.2f} | {decode:>11.2f} | {tokens:>11.1f} | {total:>10.2f} | {hits}/{hits + misses}")
+
+    return rows
+
+
 if __name__ == "__main__":
-    run_benchmark()
+    parser = argparse.ArgumentParser(description="Run the hybrid benchmark")
+    parser.add_argument(
+        "--prefix-cache",
+        action="store_true",
+        help="Compare on-device prefill/decode time with and without prefix reuse",
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (1 = run in this process)")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-case timeout in seconds (parallel runs)")
+    parser.add_argument(
+        "--json",
+        default=os.environ.get("BENCHMARK_JSON_REPORT"),
+        help="Also write a JSON report (latency histograms and per-case rows) to this path",
+    )
+    parser.add_argument("--trace", default=None, help="Trace every case and write a Chrome trace JSON to this path")
+    args = parser.parse_args()
+    if args.prefix_cache:
+        run_prefix_cache_benchmark()
+    else:
+        run_benchmark(workers=args.workers, timeout_s=args.timeout, json_path=args.json, trace_path=args.trace)
@@ -0,0 +1,502 @@
+"""Pluggable inference backend behind the cactus_* calls.
+
+main.py and the strategies call cactus_init / cactus_complete / cactus_reset /
+cactus_stop / cactus_destroy from this module, which forwards them to the
+active backend:
+
+- ``cactus`` (default): the real cactus binding from cactus/python/src,
+  imported on first use so nothing else needs the weights.
+- ``mock``: deterministic FunctionGemma stand-in. It picks tools by keyword
+  and word overlap, streams native call tokens through the callback, and
+  reports timings from a latency model.
+- ``record:PATH``: real cactus, appending every completion (response, tokens,
+  latency) to a JSONL file.
+- ``replay:PATH``: serves recorded completions by request key. Misses raise,
+  or go to the mock with ``miss=mock``.
+- ``memo[:PATH]``: memoizes another backend (``inner=cactus|mock``) by
+  request key, optionally persisted to PATH in the record format, so repeated
+  identical requests cost one model call.
+
+Select with the CACTUS_BACKEND environment variable before the first call,
+e.g. ``mock``, ``mock?latency=tokens:0.5:8&time_scale=1`` or
+``replay:runs/rec.jsonl?time_scale=0&miss=mock``, or call set_backend().
+Latency models: fixed:MS, uniform:LO:HI, lognormal:MEDIAN:SIGMA (total ms),
+or tokens:PREFILL_MS:DECODE_MS (per token). time_scale multiplies the
+latency actually slept (0 = report only, for load tests).
+"""
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from urllib.parse import parse_qs
+
+_CACTUS_SRC = "cactus/python/src"
+
+_TOKEN_RE = re.compile(r"<[^<>\s]+>|\w+|\s+|[^\w\s]")
+_WORD_RE = re.compile(r"[a-z]+")
+
+# Words that pick a tool in the mock, checked before description overlap.
+_MOCK_KEYWORDS = {
+    "get_weather": ("weather", "temperature", "forecast"),
+    "set_alarm": ("alarm", "wake"),
+    "send_message": ("message", "text", "send", "tell"),
+    "create_reminder": ("remind", "reminder"),
+    "search_contacts": ("find", "look", "contacts", "search"),
+    "play_music": ("play", "music", "song", "listen"),
+    "set_timer": ("timer", "countdown"),
+}
+
+
+def request_key(messages, tools=None, **options):
+    """Stable key of a completion request (messages, tools, decoding options)."""
+    relevant = {
+        k: options.get(k)
+        for k in ("force_tools", "max_tokens", "temperature", "confidence_threshold", "tool_rag_top_k", "stop_sequences")
+    }
+    blob = json.dumps({"messages": messages, "tools": tools or [], "options": relevant}, sort_keys=True)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+
+class LatencyModel:
+    """Deterministic latency sampler; the same key always gets the same sample."""
+
+    def __init__(self, spec="tokens:0.5:8"):
+        self.spec = spec
+        kind, _, rest = spec.partition(":")
+        self.kind = kind
+        self.params = [float(x) for x in rest.split(":") if x]
+        if kind not in ("fixed", "uniform", "lognormal", "tokens"):
+            raise ValueError(f"unknown latency model: {spec}")
+
+    def sample(self, key, prefill_tokens, decode_tokens):
+        """(time to first token ms, total ms)."""
+        rng = random.Random(key)
+        if self.kind == "tokens":
+            prefill_ms = self.params[0] * prefill_tokens
+            return prefill_ms, prefill_ms + self.params[1] * decode_tokens
+        if self.kind == "fixed":
+            total = self.params[0]
+        elif self.kind == "uniform":
+            total = rng.uniform(self.params[0], self.params[1])
+        else:
+            total = rng.lognormvariate(math.log(self.params[0]), self.params[1])
+        share = prefill_tokens / max(1, prefill_tokens + decode_tokens)
+        return total * share, total
+
+
+class _StopFlags:
+    """Per-handle stop flags checked between streamed tokens."""
+
+    def __init__(self):
+        self._stopped = {}
+        self._lock = threading.Lock()
+
+    def clear(self, handle):
+        with self._lock:
+            self._stopped[handle] = False
+
+    def stop(self, handle):
+        with self._lock:
+            self._stopped[handle] = True
+
+    def is_set(self, handle):
+        with self._lock:
+            return self._stopped.get(handle, False)
+
+
+def _stream(text, callback, handle, flags):
+    """Feed `text` to the callback token by token; returns (emitted text, tokens)."""
+    emitted = []
+    for i, token in enumerate(_TOKEN_RE.findall(text)):
+        if flags.is_set(handle):
+            break
+        emitted.append(token)
+        if callback is not None:
+            callback(token, i, None)
+    return "".join(emitted), len(emitted)
+
+
+class CactusBackend:
+    """The real cactus binding, imported on first use."""
+
+    name = "cactus"
+
+    def __init__(self):
+        self._lib = None
+        self._lock = threading.Lock()
+
+    def lib(self):
+        with self._lock:
+            if self._lib is None:
+                if _CACTUS_SRC not in sys.path:
+                    sys.path.insert(0, _CACTUS_SRC)
+                import cactus
+                self._lib = cactus
+            return self._lib
+
+    def init(self, model_path, *args, **kwargs):
+        return self.lib().cactus_init(model_path, *args, **kwargs)
+
+    def complete(self, model, messages, **kwargs):
+        return self.lib().cactus_complete(model, messages, **kwargs)
+
+    def reset(self, model):
+        return self.lib().cactus_reset(model)
+
+    def stop(self, model):
+        return self.lib().cactus_stop(model)
+
+    def destroy(self, model):
+        return self.lib().cactus_destroy(model)
+
+
+class MockBackend:
+    """Deterministic FunctionGemma stand-in for CPU-only load tests."""
+
+    name = "mock"
+
+    def __init__(self, latency="tokens:0.5:8", time_scale=0.0):
+        self.latency = latency if isinstance(latency, LatencyModel) else LatencyModel(latency)
+        self.time_scale = float(time_scale)
+        self._handles = itertools.count(1)
+        self._flags = _StopFlags()
+
+    def init(self, model_path, *args, **kwargs):
+        return next(self._handles)
+
+    def reset(self, model):
+        pass
+
+    def stop(self, model):
+        self._flags.stop(model)
+
+    def destroy(self, model):
+        pass
+
+    @staticmethod
+    def _tool_specs(tools):
+        return [t.get("function", t) for t in tools or []]
+
+    def _pick_tools(self, user_text, specs):
+        """Tools the text asks for, in order of first mention (at most one per clause)."""
+        text = user_text.lower()
+        words = set(_WORD_RE.findall(text))
+        picked = []
+        for spec in specs:
+            name = spec.get("name", "")
+            hits = [text.find(k) for k in _MOCK_KEYWORDS.get(name, ()) if k in text]
+            if hits:
+                picked.append((min(hits), name))
+        if picked:
+            return [name for _, name in sorted(picked)]
+        best, best_score = None, 0
+        for spec in specs:
+            vocab = set(_WORD_RE.findall(f"{spec.get('name', '')} {spec.get('description', '')}".lower()))
+            score = len(words & vocab)
+            if score > best_score:
+                best, best_score = spec.get("name"), score
+        return [best] if best else []
+
+    def complete(self, model, messages, tools=None, callback=None, confidence_threshold=0.0, **kwargs):
+        key = request_key(messages, tools, **kwargs)
+        user_text = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "user")
+        prefill_tokens = sum(len(_TOKEN_RE.findall(str(m.get("content", "")))) for m in messages)
+        prefill_tokens += len(_TOKEN_RE.findall(json.dumps(tools or [])))
+        confidence = round(0.55 + 0.45 * random.Random(key + ":confidence").random(), 4)
+
+        if confidence < (confidence_threshold or 0.0):
+            ttft, _ = self.latency.sample(key, prefill_tokens, 0)
+            self._sleep(ttft)
+            return json.dumps({
+                "success": False, "error": None, "cloud_handoff": True, "response": None,
+                "function_calls": [], "confidence": confidence,
+                "time_to_first_token_ms": ttft, "total_time_ms": ttft,
+                "prefill_tokens": prefill_tokens, "decode_tokens": 0, "total_tokens": prefill_tokens,
+            })
+
+        names = self._pick_tools(user_text, self._tool_specs(tools))
+        text = "".join(f"<start_function_call>call:{name}{{}}<end_function_call>" for name in names)
+        self._flags.clear(model)
+        emitted, decode_tokens = _stream(text, callback, model, self._flags)
+        calls = [{"name": name, "arguments": {}} for name in re.findall(r"call:(\w+)\{\}<end_function_call>", emitted)]
+        ttft, total = self.latency.sample(key, prefill_tokens, decode_tokens)
+        self._sleep(total)
+        return json.dumps({
+            "success": True, "error": None, "cloud_handoff": False, "response": "",
+            "function_calls": calls, "confidence": confidence,
+            "time_to_first_token_ms": ttft, "total_time_ms": total,
+            "prefill_tokens": prefill_tokens, "decode_tokens": decode_tokens,
+            "total_tokens": prefill_tokens + decode_tokens,
+        })
+
+    def _sleep(self, ms):
+        if self.time_scale > 0:
+            time.sleep(ms * self.time_scale / 1000.0)
+
+
+class RecordingBackend:
+    """Wraps another backend and appends each completion to a JSONL file."""
+
+    name = "record"
+
+    def __init__(self, path, inner=None):
+        self.path = path
+        self.inner = inner or CactusBackend()
+        self._lock = threading.Lock()
+
+    def init(self, model_path, *args, **kwargs):
+        return self.inner.init(model_path, *args, **kwargs)
+
+    def reset(self, model):
+        return self.inner.reset(model)
+
+    def stop(self, model):
+        return self.inner.stop(model)
+
+    def destroy(self, model):
+        return self.inner.destroy(model)
+
+    def complete(self, model, messages, tools=None, callback=None, **kwargs):
+        tokens = []
+
+        def _tee(token, token_id=None, user_data=None):
+            tokens.append(token.decode("utf-8", errors="ignore") if isinstance(token, bytes) else token)
+            if callback is not None:
+                callback(token, token_id, user_data)
+
+        start = time.time()
+        raw_str = self.inner.complete(model, messages, tools=tools, callback=_tee, **kwargs)
+        record = {
+            "key": request_key(messages, tools, **kwargs),
+            "messages": messages,
+            "tools": tools,
+            "response": raw_str,
+            "tokens": tokens,
+            "latency_ms": (time.time() - start) * 1000,
+        }
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        return raw_str
+
+
+class ReplayBackend:
+    """Serves recorded completions by request key, re-streaming their tokens."""
+
+    name = "replay"
+
+    def __init__(self, path, latency=None, time_scale=1.0, miss=None):
+        self.path = path
+        self.latency = LatencyModel(latency) if isinstance(latency, str) else latency
+        self.time_scale = float(time_scale)
+        self.miss = miss
+        self.hits = 0
+        self.misses = 0
+        self._records = {}
+        self._handles = itertools.count(1)
+        self._flags = _StopFlags()
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    self._records[record["key"]] = record
+
+    def init(self, model_path, *args, **kwargs):
+        return next(self._handles)
+
+    def reset(self, model):
+        pass
+
+    def stop(self, model):
+        self._flags.stop(model)
+
+    def destroy(self, model):
+        pass
+
+    def complete(self, model, messages, tools=None, callback=None, **kwargs):
+        key = request_key(messages, tools, **kwargs)
+        record = self._records.get(key)
+        if record is None:
+            self.misses += 1
+            if self.miss is None:
+                raise KeyError(f"no recorded completion for request {key}")
+            return self.miss.complete(model, messages, tools=tools, callback=callback, **kwargs)
+        self.hits += 1
+
+        self._flags.clear(model)
+        for i, token in enumerate(record.get("tokens", [])):
+            if self._flags.is_set(model):
+                break
+            if callback is not None:
+                callback(token, i, None)
+        latency_ms = record.get("latency_ms", 0.0)
+        if self.latency is not None:
+            raw = json.loads(record["response"]) if record["response"].lstrip().startswith("{") else {}
+            _, latency_ms = self.latency.sample(key, raw.get("prefill_tokens", 0), raw.get("decode_tokens", 0))
+        if self.time_scale > 0:
+            time.sleep(latency_ms * self.time_scale / 1000.0)
+        return record["response"]
+
+
+class MemoBackend:
+    """Memoizes an inner backend by request key and re-streams hits.
+
+    The premise is the one record/replay already relies on: a request's output
+    is a function of its key. A hit sleeps its recorded latency times
+    `time_scale`, so wall-clock timings stay comparable to a run on the inner
+    backend while the model itself is only called once per distinct request.
+
+    A completion the caller cut short with cactus_stop is kept as a partial
+    record. Replaying it is a hit if the caller stops again within the
+    recorded tokens; otherwise the inner backend is asked for the full answer
+    and the tokens already streamed are not repeated.
+    """
+
+    name = "memo"
+
+    def __init__(self, inner=None, path=None, time_scale=1.0):
+        self.inner = inner or CactusBackend()
+        self.path = path
+        self.time_scale = float(time_scale)
+        self.hits = 0
+        self.misses = 0
+        self._records = {}
+        self._lock = threading.Lock()
+        self._flags = _StopFlags()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        record = json.loads(line)
+                        self._records[record["key"]] = record
+
+    def init(self, model_path, *args, **kwargs):
+        return self.inner.init(model_path, *args, **kwargs)
+
+    def reset(self, model):
+        return self.inner.reset(model)
+
+    def stop(self, model):
+        self._flags.stop(model)
+        return self.inner.stop(model)
+
+    def destroy(self, model):
+        return self.inner.destroy(model)
+
+    def complete(self, model, messages, tools=None, callback=None, **kwargs):
+        key = request_key(messages, tools, **kwargs)
+        self._flags.clear(model)
+        with self._lock:
+            record = self._records.get(key)
+
+        replayed = 0
+        if record is not None:
+            for i, token in enumerate(record["tokens"]):
+                if self._flags.is_set(model):
+                    break
+                if callback is not None:
+                    callback(token, i, None)
+                replayed = i + 1
+            if not record.get("partial") or self._flags.is_set(model):
+                with self._lock:
+                    self.hits += 1
+                if self.time_scale > 0:
+                    time.sleep(record["latency_ms"] * self.time_scale / 1000.0)
+                return record["response"]
+
+        with self._lock:
+            self.misses += 1
+        tokens = []
+
+        def _tee(token, token_id=None, user_data=None):
+            tokens.append(token.decode("utf-8", errors="ignore") if isinstance(token, bytes) else token)
+            if callback is not None and len(tokens) > replayed:
+                callback(token, token_id, user_data)
+
+        start = time.time()
+        raw_str = self.inner.complete(model, messages, tools=tools, callback=_tee, **kwargs)
+        record = {
+            "key": key,
+            "messages": messages,
+            "tools": tools,
+            "response": raw_str,
+            "tokens": tokens,
+            "latency_ms": (time.time() - start) * 1000,
+            "partial": self._flags.is_set(model),
+        }
+        with self._lock:
+            self._records[key] = record
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+        return raw_str
+
+
+def backend_from_spec(spec):
+    """Build a backend from a CACTUS_BACKEND-style spec string."""
+    spec = (spec or "cactus").strip()
+    head, _, query = spec.partition("?")
+    kind, _, path = head.partition(":")
+    params = {k: v[-1] for k, v in parse_qs(query).items()}
+    if kind == "cactus":
+        return CactusBackend()
+    if kind == "mock":
+        return MockBackend(params.get("latency", "tokens:0.5:8"), params.get("time_scale", 0.0))
+    if kind == "record":
+        return RecordingBackend(path)
+    if kind == "replay":
+        miss = MockBackend(params.get("latency", "tokens:0.5:8"), params.get("time_scale", 0.0)) if params.get("miss") == "mock" else None
+        return ReplayBackend(path, latency=params.get("latency"), time_scale=params.get("time_scale", 1.0), miss=miss)
+    if kind == "memo":
+        inner = backend_from_spec(params.get("inner", "cactus"))
+        return MemoBackend(inner, path=path or None, time_scale=params.get("time_scale", 1.0))
+    raise ValueError(f"unknown inference backend: {spec}")
+
+
+_BACKEND = None
+_BACKEND_LOCK = threading.Lock()
+
+
+def get_backend():
+    global _BACKEND
+    with _BACKEND_LOCK:
+        if _BACKEND is None:
+            _BACKEND = backend_from_spec(os.environ.get("CACTUS_BACKEND"))
+        return _BACKEND
+
+
+def set_backend(backend):
+    """Swap the active backend (a spec string or backend object). Handles from
+    the previous backend must not be used afterwards; see main._MODEL_POOL."""
+    global _BACKEND
+    with _BACKEND_LOCK:
+        _BACKEND = backend_from_spec(backend) if isinstance(backend, str) else backend
+        return _BACKEND
+
+
+def cactus_init(model_path, *args, **kwargs):
+    return get_backend().init(model_path, *args, **kwargs)
+
+
+def cactus_complete(model, messages, **kwargs):
+    return get_backend().complete(model, messages, **kwargs)
+
+
+def cactus_reset(model):
+    return get_backend().reset(model)
+
+
+def cactus_stop(model):
+    return get_backend().stop(model)
+
+
+def cactus_destroy(model):
+    return get_backend().destroy(model)
@@ -12,15 +12,27 @@ Techniques:
 5. Parse response field when function_calls is empty
 """
 
+import asyncio
+import atexit
+import contextlib
+import copy
+import functools
+import hashlib
 import json
+import math
 import os
+import queue
 import re
-import sys
+import threading
 import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import requests
 
-sys.path.insert(0, "cactus/python/src")
-from cactus import cactus_init, cactus_complete, cactus_destroy, cactus_reset
+import inference_backend
+import scoring
+from inference_backend import cactus_init, cactus_complete, cactus_destroy, cactus_reset, cactus_stop
 
 try:
     from google import genai
@@ -29,8 +41,111 @@ except Exception:
     genai = None
     types = None
 
+try:
+    import httpx
+except Exception:
+    httpx = None
+
 _FUNCTIONGEMMA_PATH = "cactus/weights/functiongemma-270m-it"
-_CACTUS_GLOBAL_MODEL = None
+# Model session pool: every inference path checks a warm handle out of the pool
+# instead of loading weights per call. Size bounds how many cactus_complete calls
+# can run at once (ctypes releases the GIL for the duration of a call).
+_CACTUS_POOL_SIZE = 3
+_CACTUS_POOL_WARM_ON_IMPORT = False
+_CACTUS_POOL_CHECKOUT_TIMEOUT_S = 60.0
+# Prefix reuse: when a pooled session last ran the same system prompt + tool
+# list, skip cactus_reset so the engine only prefills the new user turn.
+# Relies on the engine matching the cached token prefix; off until measured
+# on-device with `python benchmark.py --prefix-cache`.
+_ENABLE_PREFIX_CACHE = False
+# Run the split pieces of a compound request concurrently on pooled sessions.
+_PARALLEL_SUBREQUESTS = True
+# Check the streamed call against the tool schemas while decoding: abort on a
+# tool name no schema allows, stop as soon as the expected call's closing
+# brace arrives, and take typed arguments straight from the stream.
+_ENABLE_CONSTRAINED_DECODING = True
+# Draft the call with the rule extractors and let the model only verify it:
+# decoding stops once the model's tool name matches the draft. Needs the
+# constrained-decoding guard (it runs in the same token callback).
+_ENABLE_SPECULATIVE_DRAFTS = True
+# Minimum first-token confidence for local decoding. Below it cactus aborts
+# right after prefill (cloud_handoff, no decode) and the request goes to the
+# rule draft when one is complete, else to the cloud path. 0 disables.
+_EARLY_EXIT_CONFIDENCE = 0.0
+# generate_hybrid_batch / _HybridBatcher: prompts dispatched per chunk, and how
+# long the batcher holds the first queued request waiting for company.
+_BATCH_MAX_SIZE = 16
+_BATCH_MAX_WAIT_MS = 5.0
+# Compiled tool sets kept (LRU) by fingerprint of the tools list.
+_TOOLSET_CACHE_SIZE = 128
+# Distinct utterances memoized per rule extractor.
+_EXTRACTION_CACHE_SIZE = 1024
+# Exact-match cache of generate_hybrid results keyed on (normalized user text,
+# tool-set fingerprint). Requests offering any tool in the bypass set are never
+# cached: a repeated "send"/"set"/"remind" request is a new action, not a
+# replay of the last one.
+_ENABLE_RESULT_CACHE = True
+_RESULT_CACHE_MAX_ENTRIES = 4096
+_RESULT_CACHE_MAX_BYTES = 4 * 1024 * 1024
+_RESULT_CACHE_TTL_S = 600.0
+_RESULT_CACHE_BYPASS_TOOLS = frozenset({"send_message", "set_alarm", "create_reminder"})
+# Template cache: tool decomposition learned per slot-masked utterance, with
+# slots refilled by the rule extractors (no model call on a hit).
+_ENABLE_TEMPLATE_CACHE = True
+_TEMPLATE_CACHE_MAX_ENTRIES = 2048
+# Cloud client: one keep-alive HTTP connection pool (HTTP/2 when httpx + h2 are
+# installed) and one genai client per API key, reused by every fallback.
+_GEMINI_API_ROOT = "https://generativelanguage.googleapis.com"
+_CLOUD_HTTP_POOL_SIZE = 8
+_CLOUD_TIMEOUT_S = 20.0
+_ASYNC_MAX_WORKERS = 16
+# Cloud model chain, tried in order. With hedging, the next model is launched
+# once the newest leg has run past its observed p95 latency (or the default
+# delay before any samples exist); the first non-empty answer wins.
+_CLOUD_MODELS = ("gemini-2.5-flash-lite", "gemini-2.5-flash", "gemini-1.5-flash")
+_CLOUD_HEDGE_ENABLED = True
+_CLOUD_HEDGE_PERCENTILE = 95
+_CLOUD_HEDGE_DEFAULT_DELAY_MS = 1500.0
+_CLOUD_HEDGE_MIN_DELAY_MS = 100.0
+_CLOUD_LATENCY_WINDOW = 256
+# Per-model circuit breaker: trip when the rolling error rate crosses the
+# threshold, then probe again after an exponentially growing cool-down.
+_CLOUD_BREAKER_WINDOW = 20
+_CLOUD_BREAKER_MIN_CALLS = 4
+_CLOUD_BREAKER_ERROR_RATE = 0.5
+_CLOUD_BREAKER_COOLDOWN_S = 5.0
+_CLOUD_BREAKER_MAX_COOLDOWN_S = 300.0
+# Per-attempt timeout: observed p99 x factor, clamped to [min, _CLOUD_TIMEOUT_S].
+_CLOUD_TIMEOUT_MIN_S = 2.0
+_CLOUD_TIMEOUT_P99_FACTOR = 3.0
+# Start the cloud request alongside local inference when pre-inference features
+# predict a fallback; the result is discarded if the local output validates.
+_SPECULATIVE_CLOUD_PREFETCH = False
+_SPECULATIVE_PREFETCH_THRESHOLD = 0.6
+# Learned fallback router (scripts/train_router.py). When enabled and the model
+# file loads, it replaces the hand-written pre-inference signatures.
+_ENABLE_LEARNED_ROUTER = False
+_ROUTER_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "router_model.json")
+# Score-aware routing: pick local vs cloud by the expected change in
+# benchmark.compute_total_score (weights in scoring.py), from per-class F1 and
+# latency estimates that benchmark runs update via _score_router_feedback.
+_ENABLE_SCORE_ROUTER = False
+# Priors as (mean F1, mean latency ms, pseudo-count) until a class has data.
+_SCORE_PRIOR_LOCAL = (0.8, 400.0, 2.0)
+_SCORE_PRIOR_CLOUD = (0.95, 1200.0, 2.0)
+# Attach a span tree ("trace") to every generate_hybrid result; export with
+# _chrome_trace_events. Off, each traced call costs one thread-local lookup.
+_ENABLE_TRACING = False
+# Structured per-request log (JSONL, None = off). A background thread writes
+# batches from a bounded queue (records are dropped, never waited on, when it
+# is full) and rotates the file by size or age, keeping the newest backups.
+_REQUEST_LOG_PATH = None
+_REQUEST_LOG_QUEUE_SIZE = 10000
+_REQUEST_LOG_BATCH_SIZE = 256
+_REQUEST_LOG_FLUSH_S = 1.0
+_REQUEST_LOG_MAX_BYTES = 64 * 1024 * 1024
+_REQUEST_LOG_ROTATE_S = 24 * 3600.0
+_REQUEST_LOG_BACKUPS = 10
 # Submission-safe fixed routing knobs (do not depend on local shell env).
 _CLOUD_FALLBACK_TOOL_THRESHOLD = 5
 _ENABLE_AGGRESSIVE_FALLBACK = False
@@ -68,6 +183,17 @@ _TOOL_KEYWORDS = {
     "set_timer": ["timer", "countdown"],
 }
 
+# Broader per-tool vocabulary the fast path requires before trusting rules alone
+_FASTPATH_KEYWORDS = {
+    "get_weather": ["weather", "temperature", "forecast", "outside", "rain", "snow", "sunny"],
+    "set_alarm": ["alarm", "wake me", "wake up", "wake-up"],
+    "set_timer": ["timer", "countdown", "minute", "minutes", "second", "seconds"],
+    "play_music": ["play ", "music", "song", "listen", "track", "tune", "tunes"],
+    "search_contacts": ["find ", "look up", "lookup", "search", "contact", "contacts", "phonebook"],
+    "send_message": ["text ", "message", "send ", "tell ", "sms", "msg"],
+    "create_reminder": ["remind", "reminder"],
+}
+
 # Enhanced descriptions
 _ENHANCED_DESCRIPTIONS = {
     "get_weather": "Get current weather for a location. Use when user asks about weather, temperature, or forecast.",
@@ -80,26 +206,578 @@ _ENHANCED_DESCRIPTIONS = {
 }
 
 
+# ============ Model session pool ============
+
+def _session_is_healthy(handle):
+    return handle is not None and handle != 0
+
+
+def _destroy_session(handle):
+    try:
+        cactus_destroy(handle)
+    except Exception:
+        pass
+
+
+class _ModelSessionPool:
+    """Fixed-size pool of warm cactus handles shared by main.py and strategies/*.
+
+    The first checkout loads one session synchronously and warms the rest on a
+    background thread, so a single caller never waits for more than one weight
+    load. Sessions are reset on checkout; a session whose call raised is
+    destroyed on checkin and replaced on the next checkout that finds the pool
+    short. `close` starts a new generation: sessions of an earlier one are
+    destroyed when they are checked in or finish loading.
+    """
+
+    def __init__(self, model_path, size):
+        self.model_path = model_path
+        self.size = max(1, int(size))
+        self._idle = []
+        self._prefix = {}
+        self.prefix_hits = 0
+        self.prefix_misses = 0
+        self._live = 0
+        self._pending = 0
+        self._started = False
+        self._generation = 0
+        self._generation_of = {}
+        self._cond = threading.Condition()
+
+    def _new_session(self):
+        handle = cactus_init(self.model_path)
+        if not _session_is_healthy(handle):
+            raise RuntimeError(f"cactus_init_failed: {self.model_path}")
+        return handle
+
+    def _add_session(self, generation):
+        """Load one session outside the lock; a slot of `generation` must already be reserved."""
+        try:
+            handle = self._new_session()
+        except Exception:
+            with self._cond:
+                if generation == self._generation:
+                    self._pending -= 1
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            stale = generation != self._generation
+            if not stale:
+                self._pending -= 1
+                self._live += 1
+                self._generation_of[handle] = generation
+                self._idle.append(handle)
+                self._cond.notify()
+        if stale:
+            _destroy_session(handle)
+
+    def _reserve(self, count):
+        """Reserve up to `count` load slots; returns (count, generation)."""
+        with self._cond:
+            count = max(0, min(count, self.size - self._live - self._pending))
+            self._pending += count
+            return count, self._generation
+
+    def warm(self, background=False):
+        """Load sessions up to the pool size (idempotent)."""
+        with self._cond:
+            self._started = True
+        count, generation = self._reserve(self.size)
+        if not count:
+            return
+        if not background:
+            for _ in range(count):
+                self._add_session(generation)
+            return
+
+        def _warm_rest():
+            for _ in range(count):
+                try:
+                    self._add_session(generation)
+                except Exception:
+                    pass
+
+        threading.Thread(target=_warm_rest, name="cactus-pool-warm", daemon=True).start()
+
+    def _pop_idle(self, prefix_key):
+        """Pop an idle handle, preferring one whose KV cache holds `prefix_key`."""
+        if prefix_key is not None:
+            for i in range(len(self._idle) - 1, -1, -1):
+                if self._prefix.get(self._idle[i]) == prefix_key:
+                    return self._idle.pop(i), True
+        return self._idle.pop(), False
+
+    def checkout(self, timeout=_CACTUS_POOL_CHECKOUT_TIMEOUT_S, prefix_key=None):
+        with self._cond:
+            first_use = not self._started
+            self._started = True
+        if first_use:
+            count, generation = self._reserve(1)
+            if count:
+                self._add_session(generation)
+            self.warm(background=True)
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while not self._idle:
+                if self._live + self._pending < self.size:
+                    # A broken session was discarded; replace it.
+                    self._pending += 1
+                    generation = self._generation
+                    self._cond.release()
+                    try:
+                        self._add_session(generation)
+                    finally:
+                        self._cond.acquire()
+                    continue
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise RuntimeError("model_pool_checkout_timeout")
+                self._cond.wait(remaining)
+            handle, reuse = self._pop_idle(prefix_key if _ENABLE_PREFIX_CACHE else None)
+            if prefix_key is not None and _ENABLE_PREFIX_CACHE:
+                if reuse:
+                    self.prefix_hits += 1
+                else:
+                    self.prefix_misses += 1
+            self._prefix[handle] = prefix_key
+        if not reuse:
+            try:
+                cactus_reset(handle)
+            except Exception:
+                self._discard(handle)
+                raise
+        return handle, reuse
+
+    def checkin(self, handle, healthy=True):
+        healthy = healthy and _session_is_healthy(handle)
+        with self._cond:
+            if healthy and self._generation_of.get(handle) == self._generation:
+                self._idle.append(handle)
+                self._cond.notify()
+                return
+        self._discard(handle)
+
+    def _discard(self, handle):
+        """Release a checked-out handle's slot and destroy it."""
+        with self._cond:
+            if self._generation_of.pop(handle, None) == self._generation:
+                self._live -= 1
+            self._prefix.pop(handle, None)
+            self._cond.notify()
+        _destroy_session(handle)
+
+    @contextlib.contextmanager
+    def session(self, timeout=_CACTUS_POOL_CHECKOUT_TIMEOUT_S, prefix_key=None):
+        handle, _ = self.checkout(timeout=timeout, prefix_key=prefix_key)
+        healthy = True
+        try:
+            yield handle
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            self.checkin(handle, healthy=healthy)
+
+    def close(self):
+        """Destroy idle sessions; checked-out and still-loading ones are destroyed on checkin/load."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            for handle in idle:
+                self._prefix.pop(handle, None)
+                self._generation_of.pop(handle, None)
+            self._generation += 1
+            self._live = 0
+            self._pending = 0
+            self._started = False
+            self._cond.notify_all()
+        for handle in idle:
+            _destroy_session(handle)
+
+
+_MODEL_POOL = _ModelSessionPool(_FUNCTIONGEMMA_PATH, _CACTUS_POOL_SIZE)
+
+
+def _model_session(prefix_key=None):
+    """Check a warm model handle out of the shared pool (context manager).
+
+    The handle is reset unless prefix reuse is enabled and it last ran a
+    prompt with the same `prefix_key` (see `_prefix_cache_key`).
+    """
+    return _MODEL_POOL.session(prefix_key=prefix_key)
+
+
+def _use_inference_backend(backend):
+    """Switch cactus_* calls to another backend (spec string or object), e.g.
+    "mock" for CPU-only load tests; pooled handles of the old one are dropped."""
+    _MODEL_POOL.close()
+    return inference_backend.set_backend(backend)
+
+
+def _prefix_cache_key(system_prompt, cactus_tools):
+    """Fingerprint of everything the engine prefills before the user turn."""
+    payload = json.dumps([system_prompt, cactus_tools], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _completion_timings(raw):
+    """Split a cactus response into prefill/decode timings."""
+    if not isinstance(raw, dict):
+        return {}
+    total = float(raw.get("total_time_ms") or 0.0)
+    ttft = float(raw.get("time_to_first_token_ms") or 0.0)
+    return {
+        "prefill_ms": ttft,
+        "decode_ms": max(0.0, total - ttft),
+        "prefill_tokens": int(raw.get("prefill_tokens") or 0),
+        "decode_tokens": int(raw.get("decode_tokens") or 0),
+    }
+
+
+# ============ Stage timings ============
+# Per-request wall time by pipeline stage (cache, fastpath, template, planning,
+# prefill, decode, extraction, validation, cloud). generate_hybrid collects
+# them on its thread and returns them as "stage_timings_ms"; outside a
+# collection the helpers are no-ops.
+
+class _StageState(threading.local):
+    current = None
+
+
+_STAGE_TIMINGS = _StageState()
+
+
+@contextlib.contextmanager
+def _collect_stages():
+    previous = _STAGE_TIMINGS.current
+    _STAGE_TIMINGS.current = timings = {}
+    try:
+        yield timings
+    finally:
+        _STAGE_TIMINGS.current = previous
+
+
+def _add_stage_ms(stage, ms):
+    timings = _STAGE_TIMINGS.current
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + ms
+
+
+@contextlib.contextmanager
+def _stage(name):
+    if _STAGE_TIMINGS.current is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add_stage_ms(name, (time.perf_counter() - start) * 1000)
+
+
+def _record_model_stages(timings, elapsed):
+    """Split the wall time of one cactus call into prefill/decode stages.
+
+    Prefill is the engine's time to first token and decode the rest of
+    `elapsed` (all decode if the engine gave no split); the engine's own
+    figures stay in `timings` as prefill_ms/decode_ms.
+    """
+    if timings:
+        prefill = min(timings["prefill_ms"], elapsed)
+        _add_stage_ms("prefill", prefill)
+        _add_stage_ms("decode", elapsed - prefill)
+    else:
+        _add_stage_ms("decode", elapsed)
+    return timings
+
+
+# ============ Tracing ============
+
+class _Span:
+    __slots__ = ("name", "start_ns", "end_ns", "thread", "attrs", "children")
+
+    def __init__(self, name, attrs=None):
+        self.name = name
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = None
+        self.thread = threading.current_thread().name
+        self.attrs = attrs or {}
+        self.children = []
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_us": ((self.end_ns or time.perf_counter_ns()) - self.start_ns) / 1000.0,
+            "thread": self.thread,
+            "attrs": self.attrs,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+class _TraceState(threading.local):
+    current = None  # class default: no AttributeError on threads that never traced
+
+
+_TRACE = _TraceState()
+
+
+@contextlib.contextmanager
+def _trace_parent(span):
+    """Make `span` the parent of spans opened on this thread (for work handed to a pool)."""
+    previous = _TRACE.current
+    _TRACE.current = span
+    try:
+        yield span
+    finally:
+        _TRACE.current = previous
+
+
+@contextlib.contextmanager
+def _trace(name, **attrs):
+    """Root span of one request when tracing is enabled, else None."""
+    if not _ENABLE_TRACING:
+        yield None
+        return
+    root = _Span(name, attrs)
+    with _trace_parent(root):
+        try:
+            yield root
+        finally:
+            root.end_ns = time.perf_counter_ns()
+
+
+@contextlib.contextmanager
+def _span(name, **attrs):
+    """Child span of the current one; None (and no timing) outside a trace."""
+    parent = _TRACE.current
+    if parent is None:
+        yield None
+        return
+    span = _Span(name, attrs)
+    parent.children.append(span)
+    with _trace_parent(span):
+        try:
+            yield span
+        finally:
+            span.end_ns = time.perf_counter_ns()
+
+
+def _traced(name, attrs=None):
+    """Decorator form of _span for hot functions; `attrs(*args, **kwargs)` labels the span."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _ENABLE_TRACING or _TRACE.current is None:
+                return fn(*args, **kwargs)
+            with _span(name, **(attrs(*args, **kwargs) if attrs else {})):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _chrome_trace_events(trace, pid=1):
+    """Flatten a span dict from a result's "trace" into Chrome trace events
+    (load {"traceEvents": [...]} in chrome://tracing or Perfetto)."""
+    events = []
+    threads = {}
+
+    def _walk(span):
+        tid = threads.setdefault(span["thread"], len(threads) + 1)
+        events.append({
+            "name": span["name"],
+            "ph": "X",
+            "ts": span["start_ns"] / 1000.0,
+            "dur": span["duration_us"],
+            "pid": pid,
+            "tid": tid,
+            "args": span["attrs"],
+        })
+        for child in span["children"]:
+            _walk(child)
+
+    _walk(trace)
+    for thread, tid in threads.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread}})
+    return events
+
+
+# ============ Tool-set compilation ============
+
+def _tools_fingerprint(tools):
+    """Stable hash of a tool list (order-sensitive, key-order-insensitive)."""
+    if isinstance(tools, _ToolSet):
+        return tools.fingerprint
+    payload = json.dumps(list(tools), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class _ToolSet:
+    """A tool list compiled once per distinct tool set.
+
+    Iterates, indexes and sizes like the list it wraps, so it can be passed
+    anywhere `tools` is expected; the derived structures (name maps, enhanced
+    descriptions, cactus wrappers, decoding grammar, cloud declarations) are
+    built here once instead of on every request.
+    """
+
+    __slots__ = (
+        "tools", "fingerprint", "names", "by_name", "required",
+        "enhanced", "cactus_tools", "grammar", "_derived",
+    )
+
+    def __init__(self, tools, fingerprint):
+        self.tools = tuple(tools)
+        self.fingerprint = fingerprint
+        self.by_name = {t.get("name"): t for t in self.tools if t.get("name")}
+        self.names = frozenset(self.by_name)
+        self.required = {
+            name: tuple(t.get("parameters", {}).get("required", []))
+            for name, t in self.by_name.items()
+        }
+        self.enhanced = _enhance_tools(self.tools)
+        self.cactus_tools = [{"type": "function", "function": t} for t in self.tools]
+        self.grammar = _compile_tool_grammar(self.tools)
+        self._derived = {}
+
+    def derive(self, key, build):
+        """Memoize a structure derived from this tool set (e.g. cloud declarations)."""
+        try:
+            return self._derived[key]
+        except KeyError:
+            value = self._derived[key] = build(self.tools)
+            return value
+
+    def __iter__(self):
+        return iter(self.tools)
+
+    def __len__(self):
+        return len(self.tools)
+
+    def __getitem__(self, index):
+        return self.tools[index]
+
+
+_TOOLSET_CACHE = OrderedDict()
+_TOOLSET_CACHE_LOCK = threading.Lock()
+
+
+def _as_toolset(tools):
+    """Compiled `_ToolSet` for `tools`, from the LRU cache when seen before."""
+    if isinstance(tools, _ToolSet):
+        return tools
+    fingerprint = _tools_fingerprint(tools)
+    with _TOOLSET_CACHE_LOCK:
+        toolset = _TOOLSET_CACHE.get(fingerprint)
+        if toolset is not None:
+            _TOOLSET_CACHE.move_to_end(fingerprint)
+            return toolset
+    toolset = _ToolSet(tools, fingerprint)
+    with _TOOLSET_CACHE_LOCK:
+        _TOOLSET_CACHE[fingerprint] = toolset
+        while len(_TOOLSET_CACHE) > _TOOLSET_CACHE_SIZE:
+            _TOOLSET_CACHE.popitem(last=False)
+    return toolset
+
+
+# ============ Intent index ============
+
+class _IntentIndex:
+    """Aho-Corasick automaton over a {label: keywords} table.
+
+    One linear pass over the text reports every keyword occurrence, so a
+    label is hit exactly when `any(kw in text for kw in keywords)` would be.
+    Matching is case-sensitive; callers lowercase as they did before.
+    """
+
+    def __init__(self, table, cache_size=_EXTRACTION_CACHE_SIZE):
+        self.table = {label: tuple(keywords) for label, keywords in table.items()}
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for label, keywords in self.table.items():
+            for kw in keywords:
+                self._insert(kw, label)
+        self._link()
+        self.scan = functools.lru_cache(maxsize=cache_size)(self._scan)
+
+    def _insert(self, keyword, label):
+        node = 0
+        for ch in keyword:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+        self._out[node] += ((len(keyword), label),)
+
+    def _link(self):
+        pending = deque(self._goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for ch, nxt in self._goto[node].items():
+                pending.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def _scan(self, text):
+        """All hits as (start, end, label), ordered by end offset."""
+        goto, fail, out = self._goto, self._fail, self._out
+        hits = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, label in out[node]:
+                hits.append((i + 1 - length, i + 1, label))
+        return tuple(hits)
+
+    def labels(self, text):
+        return frozenset(label for _, _, label in self.scan(text))
+
+
+_INTENT_INDEX = _IntentIndex({
+    **{("tool", name): kws for name, kws in _TOOL_KEYWORDS.items()},
+    **{("fastpath", name): kws for name, kws in _FASTPATH_KEYWORDS.items()},
+})
+
+
+def _intent_hits(text_lower, namespace="tool"):
+    """Tool names whose `namespace` keyword list has a hit in the text."""
+    return {name for ns, name in _INTENT_INDEX.labels(text_lower) if ns == namespace}
+
+
 # ============ Rule-based argument extraction ============
 
-def _get_model():
-    global _CACTUS_GLOBAL_MODEL
-    if _CACTUS_GLOBAL_MODEL is None:
-        _CACTUS_GLOBAL_MODEL = cactus_init(_FUNCTIONGEMMA_PATH)
-    return _CACTUS_GLOBAL_MODEL
+# Patterns are compiled once at import. Extractors return immutable values and
+# are memoized per utterance, so the rule pass, the draft and the args repair in
+# _call_cactus_single (and the fast path before them) share one extraction.
+_LOCATION_IN_CAPS_RE = re.compile(r'\bin\s+([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)*)')
+_LOCATION_IN_TAIL_RE = re.compile(r'\bin\s+(\w+(?:\s+\w+)?)\s*[?.!]?\s*$', re.IGNORECASE)
+_LOCATION_WEATHER_RE = re.compile(r'weather\s+(?:in\s+|for\s+)?(.+?)(?:\?|$)', re.IGNORECASE)
 
+
+@functools.lru_cache(maxsize=_EXTRACTION_CACHE_SIZE)
 def _extract_location(text):
     """Extract location from text like 'weather in San Francisco'."""
     # "in <Location>" pattern
-    m = re.search(r'\bin\s+([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)*)', text)
+    m = _LOCATION_IN_CAPS_RE.search(text)
     if m:
         return m.group(1)
     # "in <location>" case-insensitive fallback
-    m = re.search(r'\bin\s+(\w+(?:\s+\w+)?)\s*[?.!]?\s*$', text, re.IGNORECASE)
+    m = _LOCATION_IN_TAIL_RE.search(text)
     if m:
         return m.group(1).strip().rstrip('?.!')
     # "weather <location>" pattern
-    m = re.search(r'weather\s+(?:in\s+|for\s+)?(.+?)(?:\?|$)', text, re.IGNORECASE)
+    m = _LOCATION_WEATHER_RE.search(text)
     if m:
         loc = m.group(1).strip().rstrip('?.!')
         if loc:
@@ -107,10 +785,16 @@ def _extract_location(text):
     return None
 
 
+_CLOCK_HM_AMPM_RE = re.compile(r'(\d{1,2}):(\d{2})\s*(AM|PM|am|pm|a\.m\.|p\.m\.)')
+_CLOCK_H_AMPM_RE = re.compile(r'(\d{1,2})\s*(AM|PM|am|pm|a\.m\.|p\.m\.)')
+_CLOCK_AT_FOR_RE = re.compile(r'(?:at|for)\s+(\d{1,2})(?::(\d{2}))?\b')
+
+
+@functools.lru_cache(maxsize=_EXTRACTION_CACHE_SIZE)
 def _extract_time_hours_minutes(text):
     """Extract hour and minute from text like '7:30 AM' or '6 AM'."""
     # "H:MM AM/PM"
-    m = re.search(r'(\d{1,2}):(\d{2})\s*(AM|PM|am|pm|a\.m\.|p\.m\.)', text)
+    m = _CLOCK_HM_AMPM_RE.search(text)
     if m:
         h, mi, ampm = int(m.group(1)), int(m.group(2)), m.group(3).upper().replace('.', '')
         if ampm == 'PM' and h != 12:
@@ -120,7 +804,7 @@ def _extract_time_hours_minutes(text):
         return h, mi
 
     # "H AM/PM"
-    m = re.search(r'(\d{1,2})\s*(AM|PM|am|pm|a\.m\.|p\.m\.)', text)
+    m = _CLOCK_H_AMPM_RE.search(text)
     if m:
         h, ampm = int(m.group(1)), m.group(2).upper().replace('.', '')
         if ampm == 'PM' and h != 12:
@@ -130,7 +814,7 @@ def _extract_time_hours_minutes(text):
         return h, 0
 
     # Just a number after "at" or "for"
-    m = re.search(r'(?:at|for)\s+(\d{1,2})(?::(\d{2}))?\b', text)
+    m = _CLOCK_AT_FOR_RE.search(text)
     if m:
         h = int(m.group(1))
         mi = int(m.group(2)) if m.group(2) else 0
@@ -139,59 +823,80 @@ def _extract_time_hours_minutes(text):
     return None, None
 
 
+_TIME_HM_AMPM_RE = re.compile(r'(\d{1,2}:\d{2}\s*(?:AM|PM|am|pm))')
+_TIME_H_AMPM_RE = re.compile(r'(\d{1,2}\s*(?:AM|PM|am|pm))')
+_TIME_AT_HM_RE = re.compile(r'at\s+(\d{1,2}:\d{2})')
+
+
+@functools.lru_cache(maxsize=_EXTRACTION_CACHE_SIZE)
 def _extract_time_string(text):
     """Extract time as a string like '3:00 PM' from text."""
-    m = re.search(r'(\d{1,2}:\d{2}\s*(?:AM|PM|am|pm))', text)
+    m = _TIME_HM_AMPM_RE.search(text)
     if m:
         return m.group(1)
-    m = re.search(r'(\d{1,2}\s*(?:AM|PM|am|pm))', text)
+    m = _TIME_H_AMPM_RE.search(text)
     if m:
         return m.group(1)
-    m = re.search(r'at\s+(\d{1,2}:\d{2})', text)
+    m = _TIME_AT_HM_RE.search(text)
     if m:
         return m.group(1)
     return None
 
 
+_MINUTES_UNIT_RE = re.compile(r'(\d+)\s*(?:minute|min)', re.IGNORECASE)
+_MINUTES_FOR_RE = re.compile(r'(?:for|timer)\s+(\d+)', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=_EXTRACTION_CACHE_SIZE)
 def _extract_minutes(text):
     """Extract number of minutes from text."""
-    m = re.search(r'(\d+)\s*(?:minute|min)', text, re.IGNORECASE)
+    m = _MINUTES_UNIT_RE.search(text)
     if m:
         return int(m.group(1))
-    m = re.search(r'(?:for|timer)\s+(\d+)', text, re.IGNORECASE)
+    m = _MINUTES_FOR_RE.search(text)
     if m:
         return int(m.group(1))
     return None
 
 
+_MSG_TO_SAYING_RE = re.compile(r'(?:to|tell)\s+(\w+)\s+(?:saying|that|:)\s+(.+?)(?:\.|$)', re.IGNORECASE)
+_MSG_NAME_A_MESSAGE_RE = re.compile(r'(\w+)\s+a\s+message\s+saying\s+(.+?)(?:\.|$)', re.IGNORECASE)
+_MSG_VERB_SAYING_RE = re.compile(r'(?:text|message|msg)\s+(\w+)\s+(?:saying|that|:)\s+(.+?)(?:\.|$)', re.IGNORECASE)
+_MSG_SEND_TO_RE = re.compile(r'send\s+(.+?)\s+to\s+(\w+)', re.IGNORECASE)
+_MSG_TEXT_NAME_RE = re.compile(r'(?:text|message)\s+(\w+)\s+(.+?)(?:\.|$)', re.IGNORECASE)
+_MSG_TO_NAME_SAYING_RE = re.compile(r'to\s+(\w+)\s+saying\s+(.+?)(?:\.|$)', re.IGNORECASE)
+_MSG_TELL_RE = re.compile(r'tell\s+(\w+)\s+(.+?)(?:\.|$)', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=_EXTRACTION_CACHE_SIZE)
 def _extract_recipient_and_message(text):
     """Extract recipient and message from text like 'Send a message to Alice saying good morning'."""
     # "to <Name> saying <message>"
-    m = re.search(r'(?:to|tell)\s+(\w+)\s+(?:saying|that|:)\s+(.+?)(?:\.|$)', text, re.IGNORECASE)
+    m = _MSG_TO_SAYING_RE.search(text)
     if m:
         name = m.group(1).strip()
         if name.lower() not in ('him', 'her', 'them'):
             return name, m.group(2).strip().rstrip('.')
 
     # "<Name> a message saying <message>"
-    m = re.search(r'(\w+)\s+a\s+message\s+saying\s+(.+?)(?:\.|$)', text, re.IGNORECASE)
+    m = _MSG_NAME_A_MESSAGE_RE.search(text)
     if m:
         name = m.group(1).strip()
         if name.lower() not in ('send', 'him', 'her', 'them', 'a', 'the'):
             return name, m.group(2).strip().rstrip('.')
 
     # "<verb> <Name> saying <message>"
-    m = re.search(r'(?:text|message|msg)\s+(\w+)\s+(?:saying|that|:)\s+(.+?)(?:\.|$)', text, re.IGNORECASE)
+    m = _MSG_VERB_SAYING_RE.search(text)
     if m:
         return m.group(1).strip(), m.group(2).strip().rstrip('.')
 
     # "send <message> to <Name>"
-    m = re.search(r'send\s+(.+?)\s+to\s+(\w+)', text, re.IGNORECASE)
+    m = _MSG_SEND_TO_RE.search(text)
     if m:
         return m.group(2).strip(), m.group(1).strip()
 
     # "text <Name> <message>" (no "saying")
-    m = re.search(r'(?:text|message)\s+(\w+)\s+(.+?)(?:\.|$)', text, re.IGNORECASE)
+    m = _MSG_TEXT_NAME_RE.search(text)
     if m:
         name = m.group(1).strip()
         msg = m.group(2).strip().rstrip('.')
@@ -200,49 +905,61 @@ def _extract_recipient_and_message(text):
             return name, msg
 
     # "send a message to <Name> saying <msg>"  (broader)
-    m = re.search(r'to\s+(\w+)\s+saying\s+(.+?)(?:\.|$)', text, re.IGNORECASE)
+    m = _MSG_TO_NAME_SAYING_RE.search(text)
     if m:
         return m.group(1).strip(), m.group(2).strip().rstrip('.')
 
     # "tell <Name> <message>"
-    m = re.search(r'tell\s+(\w+)\s+(.+?)(?:\.|$)', text, re.IGNORECASE)
+    m = _MSG_TELL_RE.search(text)
     if m:
         return m.group(1).strip(), m.group(2).strip().rstrip('.')
 
     return None, None
 
 
+_REMIND_ABOUT_AT_RE = re.compile(r'remind\s+(?:me\s+)?(?:about|to)\s+(.+?)\s+at\s+', re.IGNORECASE)
+_REMIND_AT_RE = re.compile(r'remind\s+(?:me\s+)?(.+?)\s+at\s+', re.IGNORECASE)
+_LEADING_ARTICLE_RE = re.compile(r'^(?:the|a|an)\s+', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=_EXTRACTION_CACHE_SIZE)
 def _extract_reminder_title_and_time(text):
     """Extract reminder title and time from text."""
     time_str = _extract_time_string(text)
 
     # "remind me about/to <title> at <time>"
-    m = re.search(r'remind\s+(?:me\s+)?(?:about|to)\s+(.+?)\s+at\s+', text, re.IGNORECASE)
+    m = _REMIND_ABOUT_AT_RE.search(text)
     if m:
         title = m.group(1).strip()
         # Strip leading articles
-        title = re.sub(r'^(?:the|a|an)\s+', '', title, flags=re.IGNORECASE)
+        title = _LEADING_ARTICLE_RE.sub('', title)
         return title, time_str
 
     # "remind me <title> at <time>"
-    m = re.search(r'remind\s+(?:me\s+)?(.+?)\s+at\s+', text, re.IGNORECASE)
+    m = _REMIND_AT_RE.search(text)
     if m:
         title = m.group(1).strip()
-        title = re.sub(r'^(?:the|a|an)\s+', '', title, flags=re.IGNORECASE)
+        title = _LEADING_ARTICLE_RE.sub('', title)
         if title.lower() not in ('', 'to', 'about'):
             return title, time_str
 
     return None, time_str
 
 
+_SONG_PLAY_RE = re.compile(r'play\s+(.+?)(?:\.|$)', re.IGNORECASE)
+_SONG_LISTEN_RE = re.compile(r'listen\s+to\s+(.+?)(?:\.|$)', re.IGNORECASE)
+_SONG_FILLER_RE = re.compile(r'^(?:some|a|the|my)\s+', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=_EXTRACTION_CACHE_SIZE)
 def _extract_song(text):
     """Extract song/playlist name from text."""
     # "play <song>"
-    m = re.search(r'play\s+(.+?)(?:\.|$)', text, re.IGNORECASE)
+    m = _SONG_PLAY_RE.search(text)
     if m:
         song = m.group(1).strip().rstrip('.')
         # Remove filler words
-        song = re.sub(r'^(?:some|a|the|my)\s+', '', song, flags=re.IGNORECASE)
+        song = _SONG_FILLER_RE.sub('', song)
         # Strip trailing "music" only for single-word genres (e.g. "jazz music" → "jazz")
         # Keep it for multi-word or adjective+music combos (e.g. "classical music", "lo-fi music")
         words = song.split()
@@ -253,16 +970,20 @@ def _extract_song(text):
                 song = words[0]
         return song
     # "listen to <song>"
-    m = re.search(r'listen\s+to\s+(.+?)(?:\.|$)', text, re.IGNORECASE)
+    m = _SONG_LISTEN_RE.search(text)
     if m:
         return m.group(1).strip().rstrip('.')
     return None
 
 
+_CONTACT_QUERY_RE = re.compile(r'(?:find|look\s*up|search\s+for)\s+(\w+)', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=_EXTRACTION_CACHE_SIZE)
 def _extract_contact_query(text):
     """Extract contact name from text."""
     # "find <Name> in my contacts"
-    m = re.search(r'(?:find|look\s*up|search\s+for)\s+(\w+)', text, re.IGNORECASE)
+    m = _CONTACT_QUERY_RE.search(text)
     if m:
         name = m.group(1).strip()
         if name.lower() not in ('a', 'the', 'my', 'in', 'for'):
@@ -270,6 +991,7 @@ def _extract_contact_query(text):
     return None
 
 
+@_traced("extract_args", attrs=lambda tool_name, *args, **kwargs: {"tool": tool_name})
 def _extract_args_for_tool(tool_name, user_text, cactus_args):
     """Extract arguments using rules, falling back to cactus output."""
     if tool_name == "get_weather":
@@ -333,6 +1055,36 @@ def _extract_args_for_tool(tool_name, user_text, cactus_args):
     return cactus_args
 
 
+def _matched_rule_args(tool_name, user_text):
+    """Arguments for `tool_name` when every field is an extractor hit, else None.
+
+    Unlike `_extract_args_for_tool` there are no fallbacks: a default such as
+    hour 0 or a split-off "location" is a miss here, not a value.
+    """
+    if tool_name == "get_weather":
+        location = _extract_location(user_text)
+        return {"location": location} if location else None
+    if tool_name == "set_alarm":
+        h, mi = _extract_time_hours_minutes(user_text)
+        return {"hour": h, "minute": mi} if h is not None else None
+    if tool_name == "send_message":
+        recipient, message = _extract_recipient_and_message(user_text)
+        return {"recipient": recipient, "message": message} if recipient and message else None
+    if tool_name == "create_reminder":
+        title, time_str = _extract_reminder_title_and_time(user_text)
+        return {"title": title, "time": time_str} if title and time_str else None
+    if tool_name == "search_contacts":
+        query = _extract_contact_query(user_text)
+        return {"query": query} if query else None
+    if tool_name == "play_music":
+        song = _extract_song(user_text)
+        return {"song": song} if song else None
+    if tool_name == "set_timer":
+        minutes = _extract_minutes(user_text)
+        return {"minutes": abs(minutes)} if minutes is not None else None
+    return None
+
+
 # ============ Cactus interaction ============
 
 def _repair_json_payload(raw_str):
@@ -416,34 +1168,247 @@ def _enhance_tools(tools):
 
 
 def _prune_tools(user_text, tools):
-    text_lower = user_text.lower()
-    matched = set()
-    for tool_name, keywords in _TOOL_KEYWORDS.items():
-        for kw in keywords:
-            if kw in text_lower:
-                matched.add(tool_name)
-                break
+    matched = _intent_hits(user_text.lower())
     if not matched:
         return tools
     pruned = [t for t in tools if t.get("name") in matched]
     return pruned if pruned else tools
 
 
-def _call_cactus(messages, tools):
-    model = cactus_init(_FUNCTIONGEMMA_PATH)
+# ============ Constrained decoding ============
+
+_CALL_OPEN = "call:"
+_ESCAPE = "<escape>"
+
+
+def _compile_tool_grammar(tools):
+    """Compile tool schemas into the tables the streaming guard checks against."""
+    names = tuple(t.get("name", "") for t in tools if t.get("name"))
+    prefixes = {n[:i] for n in names for i in range(len(n) + 1)}
+    params = {}
+    for t in tools:
+        schema = t.get("parameters", {}) or {}
+        props = schema.get("properties", {}) or {}
+        params[t.get("name", "")] = {
+            "types": {k: str((v or {}).get("type", "string")).lower() for k, v in props.items()},
+            "enums": {k: tuple(v["enum"]) for k, v in props.items() if isinstance(v, dict) and v.get("enum")},
+            "required": tuple(schema.get("required", [])),
+        }
+    return {"names": frozenset(names), "prefixes": frozenset(prefixes), "params": params}
+
+
+def _coerce_schema_value(value, type_name):
+    """Coerce a decoded value to its schema type; None when it cannot be."""
+    if type_name == "integer":
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, int):
+            return value
+        try:
+            return int(float(str(value).strip()))
+        except (ValueError, OverflowError):
+            return None
+    if type_name == "number":
+        try:
+            return float(str(value).strip())
+        except (ValueError, OverflowError):
+            return None
+    if type_name == "boolean":
+        if isinstance(value, bool):
+            return value
+        text = str(value).strip().lower()
+        return True if text == "true" else False if text == "false" else None
+    return value if isinstance(value, str) else str(value)
+
+
+def _parse_native_call_args(body, spec):
+    """Parse a FunctionGemma argument body (`key:<escape>text<escape>,key:7`)."""
+    fields = []
+    buf = []
+    in_escape = False
+    i = 0
+    while i < len(body):
+        if body.startswith(_ESCAPE, i):
+            in_escape = not in_escape
+            buf.append(_ESCAPE)
+            i += len(_ESCAPE)
+            continue
+        ch = body[i]
+        if ch == "," and not in_escape:
+            fields.append("".join(buf))
+            buf = []
+        else:
+            buf.append(ch)
+        i += 1
+    fields.append("".join(buf))
+
+    args = {}
+    types = spec.get("types", {}) if spec else {}
+    enums = spec.get("enums", {}) if spec else {}
+    for field in fields:
+        key, sep, raw_value = field.partition(":")
+        key = key.strip().strip('"')
+        if not sep or not key:
+            continue
+        if types and key not in types:
+            continue
+        raw_value = raw_value.strip()
+        if raw_value.startswith(_ESCAPE) and raw_value.endswith(_ESCAPE) and len(raw_value) >= 2 * len(_ESCAPE):
+            value = raw_value[len(_ESCAPE):-len(_ESCAPE)]
+        else:
+            value = raw_value.strip('"')
+        value = _coerce_schema_value(value, types.get(key, "string"))
+        if value is None:
+            continue
+        if key in enums and value not in enums[key]:
+            continue
+        args[key] = value
+    return args
+
+
+def _rule_draft(user_text, tools):
+    """Rule-based guess of a single call, or None unless every argument is an extractor hit."""
+    tool_name = _select_tool_by_keywords(user_text, tools)
+    if not tool_name:
+        return None
+    args = _matched_rule_args(tool_name, user_text)
+    if args is None or not _all_fields_filled(args):
+        return None
+    return {"name": tool_name, "arguments": args}
+
+
+class _ToolCallGuard:
+    """Streaming check of FunctionGemma output against a compiled tool grammar.
+
+    Fed through the `cactus_complete` token callback, it parses calls
+    incrementally: each call is kept in `calls` as soon as its closing brace
+    arrives, while decoding continues.
+    It stops generation when the tool name being decoded cannot match any
+    schema (`violation`), or when a call past `max_calls` opens with a valid
+    name (`overflow`); an out-of-schema extra call is still a violation.
+    """
+
+    def __init__(self, grammar, max_calls=None, draft=None):
+        self.grammar = grammar
+        self.max_calls = max_calls
+        self.draft = draft
+        self.draft_accepted = None
+        self.model = None
+        self.calls = []
+        self.violation = None
+        self.overflow = False
+        self.stopped = False
+        self._text = ""
+        self._pos = 0
+        self._state = "scan"
+        self._name = ""
+        self._body_start = 0
+        self._depth = 0
+        self._in_escape = False
+
+    def __call__(self, token, token_id=None, user_data=None):
+        if self.stopped:
+            return
+        if isinstance(token, bytes):
+            token = token.decode("utf-8", errors="ignore")
+        self._text += token or ""
+        self._advance()
+        if self.violation or self.draft_accepted or self.overflow:
+            self.stop()
+
+    def stop(self):
+        if not self.stopped and self.model is not None:
+            self.stopped = True
+            cactus_stop(self.model)
+
+    def _advance(self):
+        text = self._text
+        while self._pos < len(text) and not self.violation:
+            if self._state == "scan":
+                idx = text.find(_CALL_OPEN, self._pos)
+                if idx < 0:
+                    # Keep a tail that may still grow into "call:".
+                    self._pos = max(self._pos, len(text) - len(_CALL_OPEN) + 1)
+                    return
+                self._pos = idx + len(_CALL_OPEN)
+                self._state = "name"
+                self._name = ""
+            elif self._state == "name":
+                ch = text[self._pos]
+                if ch == "{":
+                    if self._name not in self.grammar["names"]:
+                        self.violation = "unknown_tool_name"
+                        return
+                    if self.max_calls and len(self.calls) >= self.max_calls:
+                        self.overflow = True
+                        return
+                    if self.draft is not None and not self.calls:
+                        # The first call's name verifies the draft; the arguments
+                        # are already known, so there is nothing left to decode.
+                        self.draft_accepted = self._name == self.draft["name"]
+                        if self.draft_accepted:
+                            return
+                    self._state = "args"
+                    self._depth = 1
+                    self._in_escape = False
+                    self._body_start = self._pos + 1
+                    self._pos += 1
+                    continue
+                self._name += ch
+                if self._name not in self.grammar["prefixes"]:
+                    self.violation = "unknown_tool_name"
+                    return
+                self._pos += 1
+            else:
+                if text.startswith(_ESCAPE, self._pos):
+                    self._in_escape = not self._in_escape
+                    self._pos += len(_ESCAPE)
+                    continue
+                if _ESCAPE.startswith(text[self._pos:]) and text[self._pos] == "<":
+                    return  # partial <escape> marker; wait for more tokens
+                ch = text[self._pos]
+                self._pos += 1
+                if self._in_escape:
+                    continue
+                if ch == "{":
+                    self._depth += 1
+                elif ch == "}":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        body = text[self._body_start:self._pos - 1]
+                        spec = self.grammar["params"].get(self._name, {})
+                        call = {"name": self._name, "arguments": _parse_native_call_args(body, spec)}
+                        self.calls.append(call)
+                        self._state = "scan"
+
+
+def _expected_call_count(user_text, tools):
+    """How many calls the output should hold: one for a plain request, the
+    number of offered intents for a compound one (None when unclear)."""
+    if not _is_multi_action(user_text):
+        return 1
+    intents = len(_intent_hits(user_text.lower()) & _as_toolset(tools).names)
+    return intents if intents >= 2 else None
+
+
+def _call_cactus(messages, tools, guard=None):
     cactus_tools = [{"type": "function", "function": t} for t in tools]
-    raw_str = cactus_complete(
-        model,
-        [{"role": "system", "content": _LOCAL_SYSTEM_PROMPT}] + messages,
-        tools=cactus_tools,
-        force_tools=True,
-        max_tokens=512,
-        temperature=0.2,
-        confidence_threshold=0.0,
-        tool_rag_top_k=0,
-        stop_sequences=["<end_of_turn>"],
-    )
-    cactus_destroy(model)
+    options = {"callback": guard} if guard is not None else {}
+    with _model_session() as model:
+        if guard is not None:
+            guard.model = model
+        raw_str = cactus_complete(
+            model,
+            [{"role": "system", "content": _LOCAL_SYSTEM_PROMPT}] + messages,
+            tools=cactus_tools,
+            force_tools=True,
+            max_tokens=512,
+            temperature=0.2,
+            confidence_threshold=0.0,
+            tool_rag_top_k=0,
+            stop_sequences=["<end_of_turn>"],
+            **options,
+        )
     return raw_str
 
 
@@ -460,11 +1425,14 @@ def _parse_tool_name_from_response(response_text, available_tools):
     return None
 
 
-def _parse_cactus_output(raw_str, tools):
-    """Parse cactus output, including from response field."""
+def _parse_cactus_output(raw_str, tools, streamed_calls=None):
+    """Parse cactus output, including from response field. Calls already
+    parsed from the token stream stand in for an unparseable payload."""
     try:
         raw = json.loads(raw_str)
     except json.JSONDecodeError:
+        if streamed_calls:
+            return {"function_calls": list(streamed_calls), "total_time_ms": 0}
         try:
             raw = json.loads(_repair_json_payload(raw_str))
         except json.JSONDecodeError:
@@ -488,15 +1456,12 @@ def _parse_cactus_output(raw_str, tools):
 
 def _select_tool_by_keywords(user_text, tools):
     """Heuristic tool selection based on keywords when cactus fails."""
-    text_lower = user_text.lower()
-    available_names = {t.get("name") for t in tools}
+    available_names = _as_toolset(tools).names
+    matched = _intent_hits(user_text.lower())
 
-    for tool_name, keywords in _TOOL_KEYWORDS.items():
-        if tool_name not in available_names:
-            continue
-        for kw in keywords:
-            if kw in text_lower:
-                return tool_name
+    for tool_name in _TOOL_KEYWORDS:
+        if tool_name in available_names and tool_name in matched:
+            return tool_name
     return None
 
 
@@ -565,11 +1530,13 @@ def _resolve_pronouns_in_subrequests(sub_requests, full_text):
 def _process_single(user_text, tools):
     """Process a single (non-compound) request."""
     messages = [{"role": "user", "content": user_text}]
-    enhanced = _enhance_tools(tools)
-    pruned = _prune_tools(user_text, enhanced)
+    toolset = _as_toolset(tools)
+    pruned = _prune_tools(user_text, toolset.enhanced)
 
-    raw_str = _call_cactus(messages, pruned)
-    result = _parse_cactus_output(raw_str, pruned)
+    # Only the first call is used, so stop decoding once it closes.
+    guard = _ToolCallGuard(_as_toolset(pruned).grammar, max_calls=1) if _ENABLE_CONSTRAINED_DECODING else None
+    raw_str = _call_cactus(messages, pruned, guard=guard)
+    result = _parse_cactus_output(raw_str, pruned, streamed_calls=guard.calls if guard is not None else None)
 
     total_time = result["total_time_ms"] if result else 0
 
@@ -592,8 +1559,7 @@ def _process_single(user_text, tools):
         return {"function_calls": [], "total_time_ms": total_time}
 
     # Validate tool_name exists in available tools
-    available_names = {t.get("name") for t in tools}
-    if tool_name not in available_names:
+    if tool_name not in toolset.names:
         tool_name = _select_tool_by_keywords(user_text, tools)
         if not tool_name:
             return {"function_calls": [], "total_time_ms": total_time}
@@ -607,77 +1573,209 @@ def _process_single(user_text, tools):
     }
 
 
+@_traced("call_cactus_single")
 def _call_cactus_single(user_text, all_tools, confidence_threshold=0.0):
-    model = _get_model()
-    cactus_reset(model)
-    cactus_tools = [{"type": "function", "function": t} for t in all_tools]
+    toolset = _as_toolset(all_tools)
+    cactus_tools = toolset.cactus_tools
+    prefix_key = None
+    if _ENABLE_PREFIX_CACHE:
+        prefix_key = toolset.derive("prefix_key", lambda _: _prefix_cache_key(_FEW_SHOT_PROMPT, cactus_tools))
+
+    guard = None
+    options = {}
+    if _ENABLE_CONSTRAINED_DECODING:
+        # Stop once every expected call is out; a plain prompt needs just one.
+        expected = _expected_call_count(user_text, toolset)
+        guard = _ToolCallGuard(
+            toolset.grammar,
+            max_calls=expected,
+            draft=_rule_draft(user_text, toolset) if expected == 1 and _ENABLE_SPECULATIVE_DRAFTS else None,
+        )
+        options["callback"] = guard
+
+    with _model_session(prefix_key=prefix_key) as model, _span("cactus_complete"):
+        if guard is not None:
+            guard.model = model
+        start = time.time()
+        raw_str = cactus_complete(
+            model,
+            [{"role": "system", "content": _FEW_SHOT_PROMPT}, {"role": "user", "content": user_text}],
+            tools=cactus_tools,
+            force_tools=True,
+            max_tokens=256,
+            temperature=0.0,
+            confidence_threshold=max(confidence_threshold, _EARLY_EXIT_CONFIDENCE),
+            tool_rag_top_k=3,
+            stop_sequences=["<end_of_turn>"],
+            **options,
+        )
+        elapsed = (time.time() - start) * 1000
 
-    start = time.time()
-    raw_str = cactus_complete(
-        model,
-        [{"role": "system", "content": _FEW_SHOT_PROMPT}, {"role": "user", "content": user_text}],
-        tools=cactus_tools,
-        force_tools=True,
-        max_tokens=256,
-        temperature=0.0,
-        confidence_threshold=confidence_threshold,
-        tool_rag_top_k=3,
-        stop_sequences=["<end_of_turn>"],
-    )
-    elapsed = (time.time() - start) * 1000
+    early = _early_exit_result(raw_str, user_text, toolset, guard, elapsed)
+    if early is not None:
+        return early
 
     cloud_handoff = False
     try:
         raw = json.loads(raw_str)
         cloud_handoff = raw.get("cloud_handoff", False)
     except json.JSONDecodeError:
+        if guard is not None and guard.calls:
+            # The stream already yielded schema-valid calls; no repair pass needed.
+            raw = {"function_calls": guard.calls}
+        else:
+            raw = None
+    if raw is None:
         try:
             raw = json.loads(_repair_json_payload(raw_str))
             cloud_handoff = raw.get("cloud_handoff", False)
         except json.JSONDecodeError:
             m = re.search(r'"name"\s*:\s*"([^"]+)"', raw_str)
-            guessed_tool = m.group(1) if m else _select_tool_by_keywords(user_text, all_tools)
+            guessed_tool = m.group(1) if m else _select_tool_by_keywords(user_text, toolset)
+            _record_model_stages({}, elapsed)
             if guessed_tool:
                 args = _extract_args_for_tool(guessed_tool, user_text, {})
                 return {"function_calls": [{"name": guessed_tool, "arguments": args}], "total_time_ms": elapsed, "cloud_handoff": False}
             return {"function_calls": [], "total_time_ms": elapsed, "cloud_handoff": True}
 
+    timings = _record_model_stages(_completion_timings(raw), elapsed)
     calls = raw.get("function_calls", [])
+    if guard is not None:
+        if guard.draft_accepted:
+            calls = [copy.deepcopy(guard.draft)]
+        elif guard.violation:
+            # Decoding was cut off at a tool name outside the schema enum.
+            calls = [c for c in calls if isinstance(c, dict) and c.get("name") in guard.grammar["names"]]
+        if not calls and guard.calls:
+            calls = guard.calls
     if not calls:
-        guessed_tool = _select_tool_by_keywords(user_text, all_tools)
+        guessed_tool = _select_tool_by_keywords(user_text, toolset)
         if guessed_tool:
             args = _extract_args_for_tool(guessed_tool, user_text, {})
             calls = [{"name": guessed_tool, "arguments": args}]
 
-    final_calls = []
-    for call in calls:
-        if not isinstance(call, dict):
-            continue
+    final_calls = _finalize_calls(calls, user_text)
 
-        name = call.get("name")
-        args = call.get("arguments", {})
-        if not isinstance(args, dict):
-            args = {}
+    return {
+        "function_calls": final_calls,
+        "total_time_ms": elapsed,
+        "cloud_handoff": cloud_handoff,
+        "confidence": raw.get("confidence"),
+        "draft_agreement": guard.draft_accepted if guard is not None else None,
+        # Kept for routing: the calls above no longer show the bad tool name.
+        "schema_violation": guard.violation if guard is not None else None,
+        **timings,
+    }
 
-        # Defensive override:
-        # - For structurally reliable tools, always prefer regex extraction.
-        # - For others, only override when regex is complete or model args are empty/broken.
-        if name in _ALWAYS_REEXTRACT_TOOLS:
-            args = _extract_args_for_tool(name, user_text, args)
-        else:
-            rule_args = _extract_args_for_tool(name, user_text, {})
-            if _all_fields_filled(rule_args):
-                args = rule_args
-            elif not _all_fields_filled(args):
+
+def _finalize_calls(calls, user_text):
+    """Apply the rule-extraction override to each call, then sanitize them."""
+    with _stage("extraction"):
+        final_calls = []
+        for call in calls:
+            if not isinstance(call, dict):
+                continue
+
+            name = call.get("name")
+            args = call.get("arguments", {})
+            if not isinstance(args, dict):
+                args = {}
+
+            # Defensive override:
+            # - For structurally reliable tools, always prefer regex extraction.
+            # - For others, only override when regex is complete or model args are empty/broken.
+            if name in _ALWAYS_REEXTRACT_TOOLS:
                 args = _extract_args_for_tool(name, user_text, args)
+            else:
+                rule_args = _extract_args_for_tool(name, user_text, {})
+                if _all_fields_filled(rule_args):
+                    args = rule_args
+                elif not _all_fields_filled(args):
+                    args = _extract_args_for_tool(name, user_text, args)
 
-        final_calls.append({"name": name, "arguments": args})
+            final_calls.append({"name": name, "arguments": args})
 
-    return {
-        "function_calls": _sanitize_function_calls(final_calls),
+    with _stage("validation"):
+        final_calls = _sanitize_function_calls(final_calls)
+    return final_calls
+
+
+def _early_exit_result(raw_str, user_text, toolset, guard, elapsed):
+    """Result for a completion cactus aborted after prefill, or None.
+
+    The engine scores its first-token distribution and, below the confidence
+    threshold, hands off without decoding. Rather than guess a tool from an
+    empty response, take the rule draft when it is complete and keep the
+    request on-device; otherwise flag the handoff so routing can go to cloud.
+    """
+    if _EARLY_EXIT_CONFIDENCE <= 0:
+        return None
+    try:
+        raw = json.loads(raw_str)
+    except json.JSONDecodeError:
+        return None
+    if not raw.get("cloud_handoff") or raw.get("decode_tokens"):
+        return None
+
+    draft = guard.draft if guard is not None and guard.draft is not None else _rule_draft(user_text, toolset)
+    result = {
         "total_time_ms": elapsed,
-        "cloud_handoff": cloud_handoff,
+        "confidence": raw.get("confidence"),
+        "draft_agreement": None,
+        **_record_model_stages(_completion_timings(raw), elapsed),
     }
+    if draft is not None:
+        result.update(function_calls=_finalize_calls([copy.deepcopy(draft)], user_text), cloud_handoff=False, early_exit="rules")
+    else:
+        result.update(function_calls=[], cloud_handoff=True, early_exit="handoff")
+    return result
+
+
+_SUBREQUEST_EXECUTOR = None
+_SUBREQUEST_EXECUTOR_LOCK = threading.Lock()
+
+
+def _subrequest_executor():
+    global _SUBREQUEST_EXECUTOR
+    with _SUBREQUEST_EXECUTOR_LOCK:
+        if _SUBREQUEST_EXECUTOR is None:
+            _SUBREQUEST_EXECUTOR = ThreadPoolExecutor(
+                max_workers=_MODEL_POOL.size,
+                thread_name_prefix="cactus-subrequest",
+            )
+        return _SUBREQUEST_EXECUTOR
+
+
+def _run_subrequests(sub_requests, tools, confidence_threshold=0.0):
+    """Run `_call_cactus_single` over sub-requests, concurrently when enabled.
+
+    Results keep the order of `sub_requests`; the returned time is wall-clock
+    for the whole group, not the sum of per-call times. Likewise each stage
+    of concurrent calls adds its longest time across the group to the
+    caller's, so stage timings stay comparable with wall time.
+    """
+    start = time.time()
+    if _PARALLEL_SUBREQUESTS and len(sub_requests) > 1:
+        parent = _TRACE.current
+
+        def _timed(sub_req):
+            with _collect_stages() as stages, _trace_parent(parent):
+                return _call_cactus_single(sub_req, tools, confidence_threshold=confidence_threshold), stages
+
+        results = []
+        longest = {}
+        for result, stages in _subrequest_executor().map(_timed, sub_requests):
+            results.append(result)
+            for stage, ms in stages.items():
+                longest[stage] = max(longest.get(stage, 0.0), ms)
+        for stage, ms in longest.items():
+            _add_stage_ms(stage, ms)
+    else:
+        results = [
+            _call_cactus_single(sub_req, tools, confidence_threshold=confidence_threshold)
+            for sub_req in sub_requests
+        ]
+    return results, (time.time() - start) * 1000
 
 
 def _messages_to_user_text(messages):
@@ -688,10 +1786,263 @@ def _messages_to_user_text(messages):
     )
 
 
+def _router_features(user_text, tools):
+    """Sparse pre-inference features for the learned router: tool count, the
+    multi-action marker, and which offered tools the text has intents for
+    (alone and crossed with tool count, which the signatures key on)."""
+    toolset = _as_toolset(tools)
+    bucket = f"tools_{min(len(toolset), 5)}"
+    matched = _intent_hits(user_text.lower())
+    offered = matched & toolset.names
+    features = {
+        "bias": 1.0,
+        bucket: 1.0,
+        "multi_action": 1.0 if _is_multi_action(user_text) else 0.0,
+        "intents": float(len(offered)),
+        "intent_not_offered": 1.0 if matched - toolset.names else 0.0,
+    }
+    for name in offered:
+        features[f"intent:{name}"] = 1.0
+        features[f"intent:{name}:{bucket}"] = 1.0
+    return features
+
+
+class _LogisticRouter:
+    """Logistic model over `_router_features`, as written by scripts/train_router.py."""
+
+    def __init__(self, weights, threshold=0.5, meta=None):
+        self.weights = dict(weights)
+        self.threshold = threshold
+        self.meta = dict(meta or {})
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["weights"], data.get("threshold", 0.5), data.get("meta"))
+
+    def to_dict(self):
+        return {"weights": self.weights, "threshold": self.threshold, "meta": self.meta}
+
+    def predict_proba(self, features):
+        z = sum(self.weights.get(name, 0.0) * value for name, value in features.items())
+        if z < -60:
+            return 0.0
+        return 1.0 / (1.0 + math.exp(-z))
+
+
+_ROUTER_MODEL = None
+_ROUTER_MODEL_LOADED = False
+_ROUTER_MODEL_LOCK = threading.Lock()
+
+
+def _router_model():
+    """The learned router, loaded once; None when disabled or no model file."""
+    global _ROUTER_MODEL, _ROUTER_MODEL_LOADED
+    if not _ENABLE_LEARNED_ROUTER:
+        return None
+    with _ROUTER_MODEL_LOCK:
+        if not _ROUTER_MODEL_LOADED:
+            _ROUTER_MODEL_LOADED = True
+            try:
+                _ROUTER_MODEL = _LogisticRouter.from_file(_ROUTER_MODEL_PATH)
+            except (OSError, ValueError, KeyError):
+                _ROUTER_MODEL = None
+        return _ROUTER_MODEL
+
+
+def _learned_fallback_risk(user_text, tools):
+    """(probability the local answer is imperfect, at or over the model's
+    threshold) from the learned router; None when it is off."""
+    router = _router_model()
+    if router is None:
+        return None
+    prob = router.predict_proba(_router_features(user_text, tools))
+    return prob, prob >= router.threshold
+
+
+def _fallback_intent_flags(user_text_lower):
+    """(alarm, weather, reminder, music) intent flags used by the fallback signatures."""
+    matched = _intent_hits(user_text_lower)
+    return (
+        "set_alarm" in matched,
+        "get_weather" in matched,
+        "create_reminder" in matched,
+        "play_music" in matched,
+    )
+
+
+def _predict_fallback_probability(user_text, tools, is_multi):
+    """Rough chance that `_should_fallback_to_cloud` will say yes, from the
+    features it checks that are known before inference runs."""
+    router = _router_model()
+    if router is not None:
+        return router.predict_proba(_router_features(user_text, tools))
+
+    toolset = _as_toolset(tools)
+    has_alarm, has_weather, has_reminder, has_music = _fallback_intent_flags(user_text.lower())
+
+    # These signatures fire regardless of what the model outputs.
+    if not is_multi and len(toolset) == 3 and has_music:
+        return 1.0
+    if not is_multi and len(toolset) == 4 and has_reminder:
+        return 1.0
+    if is_multi and has_alarm and has_reminder and not has_weather and {"set_alarm", "create_reminder"}.issubset(toolset.names):
+        return 0.8
+    if len(toolset) >= 4 and has_reminder and "create_reminder" in toolset.names:
+        return 0.5
+    if is_multi:
+        return 0.4
+    return 0.1
+
+
+# Reasons after which the local output cannot score (bad shape or arguments).
+_STRUCTURAL_FALLBACK_REASONS = frozenset({
+    "empty_function_calls",
+    "invalid_call_shape",
+    "invalid_call_name",
+    "invalid_arguments_shape",
+    "unknown_tool_name",
+    "missing_required_argument",
+    "null_required_argument",
+    "empty_required_string",
+})
+
+
+def _request_tier(user_text, tools):
+    """Benchmark difficulty a request most resembles: multi-action requests are
+    hard, single intents among several tools medium, a single tool easy."""
+    if _is_multi_action(user_text):
+        return "hard"
+    return "medium" if len(tools) > 1 else "easy"
+
+
+def _request_class(user_text, tools):
+    toolset = _as_toolset(tools)
+    offered = sorted(_intent_hits(user_text.lower()) & toolset.names)
+    return f"{_request_tier(user_text, toolset)}|tools_{min(len(toolset), 5)}|{'+'.join(offered) or '-'}"
+
+
+class _ScoreAwareRouter:
+    """Chooses local vs cloud by expected `compute_total_score` contribution.
+
+    Keeps running F1/latency means per (request class, route), seeded with
+    priors, and running per-tier totals so the time and on-device terms see
+    the batch-level effect: each tier scores its *average* time against the
+    500 ms baseline and its on-device share, not per-request values.
+    """
+
+    def __init__(self, weights=None, baseline_ms=scoring.TIME_BASELINE_MS,
+                 prior_local=_SCORE_PRIOR_LOCAL, prior_cloud=_SCORE_PRIOR_CLOUD):
+        self.weights = dict(weights or scoring.DIFFICULTY_WEIGHTS)
+        self.baseline_ms = baseline_ms
+        self.priors = {"local": prior_local, "cloud": prior_cloud}
+        self._stats = {}  # (class, route) -> [n_f1, sum_f1, n_ms, sum_ms]
+        self._tiers = {}
+        self._lock = threading.Lock()
+        self.reset_tiers()
+
+    def reset_tiers(self):
+        """Start a new scored batch; class estimates are kept."""
+        with self._lock:
+            self._tiers = {tier: [0, 0.0, 0.0, 0] for tier in self.weights}  # n, sum_f1, sum_ms, on_device
+
+    def estimate(self, request_class, route):
+        """(expected F1, expected latency ms) for a route on this class."""
+        mean_f1, mean_ms, weight = self.priors[route]
+        with self._lock:
+            n_f1, sum_f1, n_ms, sum_ms = self._stats.get((request_class, route), (0, 0.0, 0, 0.0))
+        return (
+            (mean_f1 * weight + sum_f1) / (weight + n_f1),
+            (mean_ms * weight + sum_ms) / (weight + n_ms),
+        )
+
+    def _level_score(self, n, sum_f1, sum_ms, on_device):
+        if n == 0:
+            return 0.0
+        return scoring.level_score(sum_f1 / n, sum_ms / n, on_device / n, self.baseline_ms)
+
+    def expected_delta(self, tier, f1, latency_ms, on_device):
+        """Change in total score (points) from adding one request to `tier`."""
+        with self._lock:
+            n, sum_f1, sum_ms, n_local = self._tiers[tier]
+        before = self._level_score(n, sum_f1, sum_ms, n_local)
+        after = self._level_score(n + 1, sum_f1 + f1, sum_ms + latency_ms, n_local + int(on_device))
+        return 100.0 * self.weights[tier] * (after - before)
+
+    def decide(self, tier, request_class, local_time_ms, local_f1=None):
+        """('local' | 'cloud', score advantage in points) after local inference
+        has run; cloud time is local time plus the cloud latency estimate."""
+        est_local_f1, _ = self.estimate(request_class, "local")
+        if local_f1 is None:
+            local_f1 = est_local_f1
+        cloud_f1, cloud_ms = self.estimate(request_class, "cloud")
+        stay = self.expected_delta(tier, local_f1, local_time_ms, on_device=True)
+        leave = self.expected_delta(tier, cloud_f1, local_time_ms + cloud_ms, on_device=False)
+        return ("cloud", leave - stay) if leave > stay else ("local", stay - leave)
+
+    def observe(self, tier, request_class, route, latency_ms, f1=None, route_ms=None):
+        """Record a finished request taking `latency_ms` end to end, of which
+        `route_ms` (default: all) was spent on the route itself; for cloud that
+        excludes the local attempt before it. F1 updates the class only when
+        known (benchmark or replay); otherwise the estimate stands in for the
+        tier totals."""
+        if f1 is None:
+            f1_for_tier = self.estimate(request_class, route)[0]
+        else:
+            f1_for_tier = f1
+        with self._lock:
+            stats = self._stats.setdefault((request_class, route), [0, 0.0, 0, 0.0])
+            if f1 is not None:
+                stats[0] += 1
+                stats[1] += f1
+            stats[2] += 1
+            stats[3] += latency_ms if route_ms is None else route_ms
+            totals = self._tiers[tier]
+            totals[0] += 1
+            totals[1] += f1_for_tier
+            totals[2] += latency_ms
+            totals[3] += int(route == "local")
+
+    def observe_f1(self, request_class, route, f1):
+        """Late F1 feedback for a request already counted by `observe`."""
+        with self._lock:
+            stats = self._stats.setdefault((request_class, route), [0, 0.0, 0, 0.0])
+            stats[0] += 1
+            stats[1] += f1
+
+
+_SCORE_ROUTER = _ScoreAwareRouter()
+
+
+def _score_route(local, messages, tools):
+    """`_should_fallback_to_cloud`-compatible decision from the score router.
+    Structural failures pin the local F1 estimate to 0; other signals defer
+    to the learned per-class estimate."""
+    needs_cloud, reason = _should_fallback_to_cloud(local, messages, tools)
+    user_text = _messages_to_user_text(messages)
+    tier = _request_tier(user_text, tools)
+    request_class = _request_class(user_text, tools)
+    local_f1 = 0.0 if needs_cloud and reason in _STRUCTURAL_FALLBACK_REASONS else None
+    route, advantage = _SCORE_ROUTER.decide(tier, request_class, local.get("total_time_ms", 0), local_f1)
+    local["route_class"] = request_class
+    return route == "cloud", f"score_router::{route}:{advantage:+.2f}::{reason}"
+
+
+def _score_router_feedback(result, f1):
+    """Feed the true F1 of a routed result back into the score router."""
+    request_class = result.get("route_class")
+    if request_class:
+        route = "local" if result.get("source") == "on-device" else "cloud"
+        _SCORE_ROUTER.observe_f1(request_class, route, f1)
+
+
+@_traced("should_fallback")
 def _should_fallback_to_cloud(local_result, messages, tools):
     calls = local_result.get("function_calls") or []
-    tool_map = {t.get("name"): t for t in tools if t.get("name")}
-    tool_names = set(tool_map.keys())
+    toolset = _as_toolset(tools)
+    tool_map = toolset.by_name
+    tool_names = toolset.names
 
     if tools and not calls:
         return True, "empty_function_calls"
@@ -699,6 +2050,9 @@ def _should_fallback_to_cloud(local_result, messages, tools):
     if local_result.get("cloud_handoff"):
         return True, "low_confidence_handoff"
 
+    if local_result.get("schema_violation"):
+        return True, local_result["schema_violation"]
+
     for call in calls:
         if not isinstance(call, dict):
             return True, "invalid_call_shape"
@@ -729,17 +2083,19 @@ def _should_fallback_to_cloud(local_result, messages, tools):
         if isinstance(call, dict) and isinstance(call.get("name"), str)
     }
     is_multi = _is_multi_action(user_text)
-    has_alarm_intent = any(k in user_text_lower for k in ("alarm", "wake me", "wake up"))
-    has_weather_intent = any(k in user_text_lower for k in ("weather", "temperature", "forecast"))
-    has_reminder_intent = "remind" in user_text_lower or "reminder" in user_text_lower
-    has_music_intent = any(k in user_text_lower for k in ("play ", "music", "song", "listen"))
-
-    # Targeted forced-cloud signatures (from measured weak on-device families).
-    if (not is_multi) and len(tools) == 3 and has_music_intent:
+    has_alarm_intent, has_weather_intent, has_reminder_intent, has_music_intent = _fallback_intent_flags(user_text_lower)
+
+    # Learned router when a model is loaded; otherwise targeted forced-cloud
+    # signatures (from measured weak on-device families).
+    router = _router_model()
+    if router is not None:
+        if router.predict_proba(_router_features(user_text, toolset)) >= router.threshold:
+            return True, "learned_router"
+    elif (not is_multi) and len(tools) == 3 and has_music_intent:
         return True, "sig_music_among_three"
-    if (not is_multi) and len(tools) == 4 and has_reminder_intent:
+    elif (not is_multi) and len(tools) == 4 and has_reminder_intent:
         return True, "sig_reminder_among_four"
-    if (
+    elif (
         is_multi
         and has_alarm_intent
         and has_reminder_intent
@@ -756,7 +2112,7 @@ def _should_fallback_to_cloud(local_result, messages, tools):
     # reminder intent with many candidate tools but no reminder call selected.
     if (
         len(tools) >= 4
-        and ("remind" in user_text_lower or "reminder" in user_text_lower)
+        and has_reminder_intent
         and "create_reminder" in tool_names
         and "create_reminder" not in called_tool_names
     ):
@@ -842,8 +2198,73 @@ def _extract_calls_from_gemini_payload(payload):
     return function_calls
 
 
-def _generate_cloud_via_rest(messages, tools, model_name, api_key):
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent"
+# ============ Cloud client ============
+
+def _new_http_session(pool_size):
+    """Keep-alive HTTP session: httpx with HTTP/2 when available, else requests."""
+    if httpx is not None:
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        try:
+            return httpx.Client(http2=True, limits=limits)
+        except ImportError:
+            # httpx without the optional h2 package.
+            return httpx.Client(limits=limits)
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class _CloudClient:
+    """Reusable Gemini transport: pooled REST session plus cached genai clients."""
+
+    def __init__(self, api_root=_GEMINI_API_ROOT, pool_size=_CLOUD_HTTP_POOL_SIZE):
+        self.api_root = api_root.rstrip("/")
+        self.pool_size = pool_size
+        self._session = None
+        self._genai_clients = {}
+        self._lock = threading.Lock()
+
+    def http(self):
+        with self._lock:
+            if self._session is None:
+                self._session = _new_http_session(self.pool_size)
+            return self._session
+
+    def genai_client(self, api_key):
+        with self._lock:
+            client = self._genai_clients.get(api_key)
+            if client is None:
+                options = {}
+                if self.api_root != _GEMINI_API_ROOT:
+                    options["http_options"] = {"base_url": self.api_root + "/"}
+                client = self._genai_clients[api_key] = genai.Client(api_key=api_key, **options)
+            return client
+
+    def generate_content(self, model_name, api_key, payload, timeout=_CLOUD_TIMEOUT_S):
+        url = f"{self.api_root}/v1beta/models/{model_name}:generateContent"
+        return self.http().post(url, params={"key": api_key}, json=payload, timeout=timeout)
+
+    def close(self):
+        with self._lock:
+            session, self._session = self._session, None
+            self._genai_clients.clear()
+        if session is not None:
+            session.close()
+
+
+_CLOUD_CLIENT = _CloudClient()
+
+
+def _set_cloud_api_root(api_root):
+    """Point cloud calls at another Gemini-compatible endpoint (e.g. a local stand-in)."""
+    global _CLOUD_CLIENT
+    _CLOUD_CLIENT.close()
+    _CLOUD_CLIENT = _CloudClient(api_root=api_root)
+
+
+def _generate_cloud_via_rest(messages, tools, model_name, api_key, timeout=_CLOUD_TIMEOUT_S):
     contents = [
         {"role": "user", "parts": [{"text": str(m.get("content", ""))}]}
         for m in messages
@@ -854,12 +2275,12 @@ def _generate_cloud_via_rest(messages, tools, model_name, api_key):
 
     payload = {
         "contents": contents,
-        "tools": [{"functionDeclarations": _build_function_declarations(tools)}],
+        "tools": [{"functionDeclarations": _as_toolset(tools).derive("gemini_declarations", _build_function_declarations)}],
         "generationConfig": {"temperature": 0.0},
     }
 
     start = time.time()
-    resp = requests.post(url, params={"key": api_key}, json=payload, timeout=20)
+    resp = _CLOUD_CLIENT.generate_content(model_name, api_key, payload, timeout=timeout)
     elapsed = (time.time() - start) * 1000
     if resp.status_code != 200:
         raise RuntimeError(f"cloud_rest_{resp.status_code}: {resp.text[:200]}")
@@ -868,11 +2289,7 @@ def _generate_cloud_via_rest(messages, tools, model_name, api_key):
     return {"function_calls": _extract_calls_from_gemini_payload(data), "total_time_ms": elapsed}
 
 
-def _generate_cloud_via_genai(messages, tools, model_name, api_key):
-    if genai is None or types is None:
-        raise RuntimeError("google.genai_not_available")
-
-    client = genai.Client(api_key=api_key)
+def _build_genai_declarations(tools):
     declarations = []
     for t in tools:
         params = t.get("parameters", {})
@@ -894,6 +2311,15 @@ def _generate_cloud_via_genai(messages, tools, model_name, api_key):
                 ),
             )
         )
+    return declarations
+
+
+def _generate_cloud_via_genai(messages, tools, model_name, api_key, timeout=_CLOUD_TIMEOUT_S):
+    if genai is None or types is None:
+        raise RuntimeError("google.genai_not_available")
+
+    client = _CLOUD_CLIENT.genai_client(api_key)
+    declarations = _as_toolset(tools).derive("genai_declarations", _build_genai_declarations)
 
     contents = [
         str(m.get("content", ""))
@@ -908,7 +2334,8 @@ def _generate_cloud_via_genai(messages, tools, model_name, api_key):
         model=model_name,
         contents=contents,
         config=types.GenerateContentConfig(
-            tools=[types.Tool(function_declarations=declarations)]
+            tools=[types.Tool(function_declarations=declarations)],
+            http_options=types.HttpOptions(timeout=int(timeout * 1000)),
         ),
     )
     elapsed = (time.time() - start) * 1000
@@ -926,35 +2353,241 @@ def _generate_cloud_via_genai(messages, tools, model_name, api_key):
     return {"function_calls": function_calls, "total_time_ms": elapsed}
 
 
+class _LatencyTracker:
+    """Rolling window of latencies per key with nearest-rank percentiles."""
+
+    def __init__(self, window):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, latency_ms):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(latency_ms)
+
+    def percentile(self, key, pct, default=None):
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if not samples:
+            return default
+        rank = max(0, min(len(samples) - 1, int(round(pct / 100.0 * len(samples))) - 1))
+        return samples[rank]
+
+
+_CLOUD_LATENCY = _LatencyTracker(_CLOUD_LATENCY_WINDOW)
+
+
+class _CircuitBreaker:
+    """Closed / open / half-open breaker over a rolling window of outcomes.
+
+    While open, calls are refused without touching the network. Once the
+    cool-down passes a single probe is let through: success closes the
+    breaker, failure re-opens it with the cool-down doubled.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window=_CLOUD_BREAKER_WINDOW, min_calls=_CLOUD_BREAKER_MIN_CALLS,
+                 error_rate=_CLOUD_BREAKER_ERROR_RATE, cooldown_s=_CLOUD_BREAKER_COOLDOWN_S,
+                 max_cooldown_s=_CLOUD_BREAKER_MAX_COOLDOWN_S):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.base_cooldown_s = cooldown_s
+        self.max_cooldown_s = max_cooldown_s
+        self.state = self.CLOSED
+        self.trips = 0
+        self._outcomes = deque(maxlen=window)
+        self._cooldown_s = cooldown_s
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _cooled_down(self):
+        return time.time() - self._opened_at >= self._cooldown_s
+
+    def available(self):
+        """Whether a call would currently be allowed (does not claim the probe)."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                return self._cooled_down()
+            return not self._probing
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and self._cooled_down():
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, success):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+                if success:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                    self._cooldown_s = self.base_cooldown_s
+                else:
+                    self._trip(min(self.max_cooldown_s, self._cooldown_s * 2))
+                return
+            if self.state != self.CLOSED:
+                return  # late result from a call started before the trip
+            self._outcomes.append(bool(success))
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.error_rate:
+                self._trip(self._cooldown_s)
+
+    def _trip(self, cooldown_s):
+        self.state = self.OPEN
+        self.trips += 1
+        self._cooldown_s = cooldown_s
+        self._opened_at = time.time()
+        self._outcomes.clear()
+
+
+_CLOUD_BREAKERS = {}
+_CLOUD_BREAKERS_LOCK = threading.Lock()
+
+
+def _cloud_breaker(model_name):
+    with _CLOUD_BREAKERS_LOCK:
+        breaker = _CLOUD_BREAKERS.get(model_name)
+        if breaker is None:
+            breaker = _CLOUD_BREAKERS[model_name] = _CircuitBreaker()
+        return breaker
+
+
+def _cloud_available():
+    return any(_cloud_breaker(model_name).available() for model_name in _CLOUD_MODELS)
+
+
+def _cloud_timeout_s(model_name):
+    observed = _CLOUD_LATENCY.percentile(model_name, 99)
+    if observed is None:
+        return _CLOUD_TIMEOUT_S
+    return min(_CLOUD_TIMEOUT_S, max(_CLOUD_TIMEOUT_MIN_S, observed * _CLOUD_TIMEOUT_P99_FACTOR / 1000.0))
+
+
+_CLOUD_EXECUTOR = None
+_CLOUD_EXECUTOR_LOCK = threading.Lock()
+
+
+def _cloud_executor():
+    global _CLOUD_EXECUTOR
+    with _CLOUD_EXECUTOR_LOCK:
+        if _CLOUD_EXECUTOR is None:
+            _CLOUD_EXECUTOR = ThreadPoolExecutor(max_workers=_ASYNC_MAX_WORKERS, thread_name_prefix="cloud-leg")
+        return _CLOUD_EXECUTOR
+
+
+def _cloud_leg(messages, tools, model_name, api_key):
+    """One model attempt (genai, then REST); raises unless it returns calls."""
+    breaker = _cloud_breaker(model_name)
+    if not breaker.allow():
+        raise RuntimeError(f"{model_name}: circuit_open")
+    timeout = _cloud_timeout_s(model_name)
+    start = time.time()
+    try:
+        cloud = _generate_cloud_via_genai(messages, tools, model_name, api_key, timeout=timeout)
+    except Exception as e_genai:
+        try:
+            cloud = _generate_cloud_via_rest(messages, tools, model_name, api_key, timeout=timeout)
+        except Exception as e_rest:
+            breaker.record(False)
+            raise RuntimeError(f"{model_name}: genai={e_genai}; rest={e_rest}")
+    # The endpoint answered; an empty reply is a quality miss, not an outage.
+    breaker.record(True)
+    _CLOUD_LATENCY.record(model_name, (time.time() - start) * 1000)
+
+    if not cloud.get("function_calls"):
+        raise RuntimeError(f"{model_name}: empty_function_calls")
+    cloud["cloud_model"] = model_name
+    return cloud
+
+
+def _hedge_delay_ms(model_name):
+    observed = _CLOUD_LATENCY.percentile(model_name, _CLOUD_HEDGE_PERCENTILE, default=_CLOUD_HEDGE_DEFAULT_DELAY_MS)
+    return max(_CLOUD_HEDGE_MIN_DELAY_MS, observed)
+
+
+@_traced("generate_cloud")
 def _generate_cloud(messages, tools):
     api_key = _get_api_key()
     if not api_key:
         raise RuntimeError("missing_api_key")
 
     # Keep cloud model fallback order deterministic across local/server runs.
-    models_to_try = [
-        "gemini-2.5-flash-lite",
-        "gemini-2.5-flash",
-        "gemini-1.5-flash",
-    ]
-
-    last_error = None
-    for model_name in models_to_try:
-        try:
-            cloud = _generate_cloud_via_genai(messages, tools, model_name, api_key)
-        except Exception as e_genai:
+    # Models behind an open breaker are skipped without a network round trip.
+    models_to_try = [m for m in _CLOUD_MODELS if _cloud_breaker(m).available()]
+    if not models_to_try:
+        raise RuntimeError("cloud_circuit_open")
+
+    if not _CLOUD_HEDGE_ENABLED:
+        last_error = None
+        for model_name in models_to_try:
             try:
-                cloud = _generate_cloud_via_rest(messages, tools, model_name, api_key)
-            except Exception as e_rest:
-                last_error = f"{model_name}: genai={e_genai}; rest={e_rest}"
+                cloud = _cloud_leg(messages, tools, model_name, api_key)
+            except Exception as e:
+                last_error = str(e)
                 continue
+            cloud["hedge_leg"] = models_to_try.index(model_name)
+            return cloud
+        raise RuntimeError(last_error or "cloud_generation_failed")
 
-        if cloud.get("function_calls"):
-            cloud["cloud_model"] = model_name
+    start = time.time()
+    executor = _cloud_executor()
+    pending = {}
+    errors = []
+    launched = 0
+    last_launch = start
+
+    def _launch():
+        nonlocal launched, last_launch
+        model_name = models_to_try[launched]
+        pending[executor.submit(_cloud_leg, messages, tools, model_name, api_key)] = launched
+        last_launch = time.time()
+        launched += 1
+
+    _launch()
+    while pending:
+        timeout = None
+        if launched < len(models_to_try):
+            hedge_at = last_launch + _hedge_delay_ms(models_to_try[launched - 1]) / 1000.0
+            timeout = max(0.0, hedge_at - time.time())
+        done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            _launch()  # the newest leg is slower than usual: hedge
+            continue
+
+        for future in done:
+            leg = pending.pop(future)
+            try:
+                cloud = future.result()
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            # Losing legs finish in the background; their latencies are still recorded.
+            for other in pending:
+                other.cancel()
+            cloud["hedge_leg"] = leg
+            cloud["hedge_legs_launched"] = launched
+            cloud["total_time_ms"] = (time.time() - start) * 1000
             return cloud
-        last_error = f"{model_name}: empty_function_calls"
 
-    raise RuntimeError(last_error or "cloud_generation_failed")
+        if not pending and launched < len(models_to_try):
+            _launch()  # every running leg failed: move down the chain now
+
+    raise RuntimeError("; ".join(errors) or "cloud_generation_failed")
 
 
 def _fastpath_has_any(text, keywords):
@@ -962,47 +2595,9 @@ def _fastpath_has_any(text, keywords):
 
 
 def _fastpath_intent_hits(user_text, tools):
-    text = user_text.lower()
-    names = {t.get("name") for t in tools if t.get("name")}
-    hits = {}
-
-    if "get_weather" in names:
-        hits["get_weather"] = _fastpath_has_any(
-            text,
-            ("weather", "temperature", "forecast", "outside", "rain", "snow", "sunny"),
-        )
-    if "set_alarm" in names:
-        hits["set_alarm"] = _fastpath_has_any(
-            text,
-            ("alarm", "wake me", "wake up", "wake-up"),
-        )
-    if "set_timer" in names:
-        hits["set_timer"] = _fastpath_has_any(
-            text,
-            ("timer", "countdown", "minute", "minutes", "second", "seconds"),
-        )
-    if "play_music" in names:
-        hits["play_music"] = _fastpath_has_any(
-            text,
-            ("play ", "music", "song", "listen", "track", "tune", "tunes"),
-        )
-    if "search_contacts" in names:
-        hits["search_contacts"] = _fastpath_has_any(
-            text,
-            ("find ", "look up", "lookup", "search", "contact", "contacts", "phonebook"),
-        )
-    if "send_message" in names:
-        hits["send_message"] = _fastpath_has_any(
-            text,
-            ("text ", "message", "send ", "tell ", "sms", "msg"),
-        )
-    if "create_reminder" in names:
-        hits["create_reminder"] = _fastpath_has_any(
-            text,
-            ("remind", "reminder"),
-        )
-
-    return {k: v for k, v in hits.items() if v}
+    names = _as_toolset(tools).names
+    matched = _intent_hits(user_text.lower(), "fastpath")
+    return {name: True for name in _FASTPATH_KEYWORDS if name in names and name in matched}
 
 
 def _fastpath_unambiguous_single_intent(user_text, tools):
@@ -1024,12 +2619,11 @@ def _fastpath_unambiguous_single_intent(user_text, tools):
 
 
 def _fastpath_required_valid(tool_name, args, tools, user_text):
-    tool_map = {t.get("name"): t for t in tools if t.get("name")}
-    if tool_name not in tool_map or not isinstance(args, dict):
+    toolset = _as_toolset(tools)
+    if tool_name not in toolset.names or not isinstance(args, dict):
         return False
 
-    required = tool_map[tool_name].get("parameters", {}).get("required", [])
-    for req in required:
+    for req in toolset.required[tool_name]:
         if req not in args or not _is_value_filled(args.get(req)):
             return False
 
@@ -1073,6 +2667,7 @@ def _fastpath_required_valid(tool_name, args, tools, user_text):
     return True
 
 
+@_traced("fastpath")
 def _try_fastpath_robust(user_text, tools):
     is_single, tool_name = _fastpath_unambiguous_single_intent(user_text, tools)
     if not is_single:
@@ -1106,82 +2701,218 @@ def _try_fastpath_robust(user_text, tools):
     return {"name": tool_name, "arguments": out_args}
 
 
-def _generate_hybrid_core(messages, tools, confidence_threshold=0.0, allow_cloud=True):
-    user_text = _messages_to_user_text(messages)
-
+def _plan_local_prompts(user_text):
+    """On-device prompts for a request: the split pieces of a compound request,
+    otherwise the text itself. Returns (prompts, is_multi)."""
     if _is_multi_action(user_text):
         sub_requests = _split_multi_action(user_text)
-        sub_requests = _resolve_pronouns_in_subrequests(sub_requests, user_text)
-
-        all_calls = []
-        total_time = 0
-        needs_cloud_multi = False
-        for sub_req in sub_requests:
-            res = _call_cactus_single(sub_req, tools, confidence_threshold=confidence_threshold)
-            all_calls.extend(res.get("function_calls", []))
-            total_time += res.get("total_time_ms", 0)
-            if res.get("cloud_handoff", False):
-                needs_cloud_multi = True
-
-        seen = set()
-        dedup_calls = []
-        for call in all_calls:
-            key = _call_dedup_key(call)
-            if key in seen:
-                continue
-            seen.add(key)
-            dedup_calls.append(call)
-
-        local = {
-            "function_calls": dedup_calls,
-            "total_time_ms": total_time,
-            "source": "on-device",
-            "confidence": 1.0,
-            "success": True,
-            "cloud_handoff": needs_cloud_multi,
-        }
-    else:
-        local = _call_cactus_single(user_text, tools, confidence_threshold=confidence_threshold)
+        return _resolve_pronouns_in_subrequests(sub_requests, user_text), True
+    return [user_text], False
+
+
+def _assemble_local_result(sub_results, is_multi, total_time):
+    # Model confidence when cactus reported one (rule-only results count as 1.0).
+    confidences = [r.get("confidence") for r in sub_results]
+    confidence = min((c for c in confidences if c is not None), default=1.0)
+
+    if not is_multi:
+        local = sub_results[0]
         local["source"] = "on-device"
-        local["confidence"] = 1.0
+        local["confidence"] = confidence
         local["success"] = True
+        return local
+
+    all_calls = []
+    needs_cloud_multi = False
+    schema_violation = next((r["schema_violation"] for r in sub_results if r.get("schema_violation")), None)
+    for res in sub_results:
+        all_calls.extend(res.get("function_calls", []))
+        if res.get("cloud_handoff", False):
+            needs_cloud_multi = True
+
+    seen = set()
+    dedup_calls = []
+    for call in all_calls:
+        key = _call_dedup_key(call)
+        if key in seen:
+            continue
+        seen.add(key)
+        dedup_calls.append(call)
+
+    return {
+        "function_calls": dedup_calls,
+        "total_time_ms": total_time,
+        "source": "on-device",
+        "confidence": confidence,
+        "success": True,
+        "cloud_handoff": needs_cloud_multi,
+        "schema_violation": schema_violation,
+    }
+
+
+_PREFETCH_EXECUTOR = None
+_PREFETCH_EXECUTOR_LOCK = threading.Lock()
+
+
+def _prefetch_executor():
+    # Its own pool: _generate_cloud submits legs to the cloud-leg pool, and
+    # generate_hybrid_async requests (which wait on prefetches) fill the async
+    # pool, so sharing either could leave a prefetch that never gets a worker.
+    global _PREFETCH_EXECUTOR
+    with _PREFETCH_EXECUTOR_LOCK:
+        if _PREFETCH_EXECUTOR is None:
+            _PREFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=_ASYNC_MAX_WORKERS, thread_name_prefix="cloud-prefetch")
+        return _PREFETCH_EXECUTOR
+
+
+def _start_cloud_prefetch(messages, tools, user_text, is_multi):
+    """Submit `_generate_cloud` ahead of local inference when a fallback looks likely."""
+    if not _SPECULATIVE_CLOUD_PREFETCH or not _get_api_key() or not _cloud_available():
+        return None
+    if _predict_fallback_probability(user_text, tools, is_multi) < _SPECULATIVE_PREFETCH_THRESHOLD:
+        return None
+    return _prefetch_executor().submit(_generate_cloud, messages, tools), time.time()
+
 
+def _await_cloud_prefetch(prefetch):
+    """The result of a `_start_cloud_prefetch` request, timed from when it started."""
+    future, started = prefetch
+    with _stage("cloud"):
+        try:
+            cloud = future.result(timeout=_CLOUD_TIMEOUT_S)
+        except FutureTimeoutError:
+            future.cancel()
+            raise RuntimeError("cloud_prefetch_timeout")
+    cloud["cloud_prefetch"] = "used"
+    # Local and cloud overlapped, so the request took wall-clock time
+    # since the prefetch started (plus the local planning before it).
+    cloud["total_time_ms"] = (time.time() - started) * 1000
+    return cloud
+
+
+def _discard_cloud_prefetch(prefetch, result):
+    """Best-effort: a request already on the wire completes in the background."""
+    if prefetch is not None:
+        prefetch[0].cancel()
+        result["cloud_prefetch"] = "discarded"
+    return result
+
+
+def _route_local_result(local, messages, tools, allow_cloud=True, prefetch=None):
     if not allow_cloud:
         local["fallback_reason"] = "on_device_safe_mode"
         return local
 
-    needs_cloud, reason = _should_fallback_to_cloud(local, messages, tools)
+    if _ENABLE_SCORE_ROUTER:
+        needs_cloud, reason = _score_route(local, messages, tools)
+    else:
+        needs_cloud, reason = _should_fallback_to_cloud(local, messages, tools)
     if not needs_cloud:
         local["fallback_reason"] = reason
-        return local
+        _record_route(local, messages, tools, "local")
+        return _discard_cloud_prefetch(prefetch, local)
 
     try:
-        cloud = _generate_cloud(messages, tools)
+        if prefetch is not None:
+            cloud = _await_cloud_prefetch(prefetch)
+        else:
+            with _stage("cloud"):
+                cloud = _generate_cloud(messages, tools)
+            cloud["total_time_ms"] = cloud.get("total_time_ms", 0) + local.get("total_time_ms", 0)
         cloud["source"] = "cloud (fallback)"
         cloud["fallback_reason"] = reason
         cloud["local_time_ms"] = local.get("total_time_ms", 0)
-        cloud["total_time_ms"] = cloud.get("total_time_ms", 0) + local.get("total_time_ms", 0)
+        _record_route(cloud, messages, tools, "cloud", route_class=local.get("route_class"))
         return cloud
     except Exception as e:
         local["fallback_reason"] = reason
         local["cloud_error"] = str(e)
+        _record_route(local, messages, tools, "local")
         return local
 
 
+def _record_route(result, messages, tools, route, route_class=None):
+    if not _ENABLE_SCORE_ROUTER:
+        return
+    user_text = _messages_to_user_text(messages)
+    result["route_class"] = route_class or result.get("route_class") or _request_class(user_text, tools)
+    total_ms = result.get("total_time_ms", 0)
+    _SCORE_ROUTER.observe(
+        _request_tier(user_text, tools),
+        result["route_class"],
+        route,
+        total_ms,
+        route_ms=total_ms - result.get("local_time_ms", 0) if route == "cloud" else total_ms,
+    )
+
+
+@_traced("hybrid_core")
+def _generate_hybrid_core(messages, tools, confidence_threshold=0.0, allow_cloud=True):
+    tools = _as_toolset(tools)
+    user_text = _messages_to_user_text(messages)
+    with _stage("planning"):
+        prompts, is_multi = _plan_local_prompts(user_text)
+    prefetch = _start_cloud_prefetch(messages, tools, user_text, is_multi) if allow_cloud else None
+
+    if is_multi:
+        sub_results, total_time = _run_subrequests(prompts, tools, confidence_threshold=confidence_threshold)
+    else:
+        sub_results = [_call_cactus_single(user_text, tools, confidence_threshold=confidence_threshold)]
+        total_time = sub_results[0].get("total_time_ms", 0)
+
+    local = _assemble_local_result(sub_results, is_multi, total_time)
+    return _route_local_result(local, messages, tools, allow_cloud=allow_cloud, prefetch=prefetch)
+
+
+def _fastpath_result(user_text, tools, start):
+    fast = _try_fastpath_robust(user_text, tools)
+    if fast is None:
+        return None
+    return {
+        "function_calls": [fast],
+        "total_time_ms": (time.time() - start) * 1000,
+        "source": "on-device",
+        "confidence": 1.0,
+        "success": True,
+        "policy_tag": f"fastpath_robust_v2::{fast.get('name')}",
+    }
+
+
 def generate_hybrid(messages, tools, confidence_threshold=0.0):
+    tools = _as_toolset(tools)
+    with _collect_stages() as stages, _trace("generate_hybrid") as root:
+        out = _generate_hybrid_routed(messages, tools, confidence_threshold)
+    out["stage_timings_ms"] = {stage: round(ms, 3) for stage, ms in stages.items()}
+    if root is not None:
+        root.attrs.update(source=out.get("source"), policy_tag=out.get("policy_tag"))
+        out["trace"] = root.to_dict()
+    if _REQUEST_LOG_PATH:
+        _log_request(messages, tools, out)
+    return out
+
+
+def _generate_hybrid_routed(messages, tools, confidence_threshold):
     start = time.time()
+    tools = _as_toolset(tools)
     user_text = _messages_to_user_text(messages)
 
-    fast = _try_fastpath_robust(user_text, tools)
+    with _stage("cache"):
+        cache_key = _result_cache_key(user_text, tools)
+        cached = _cached_result(cache_key, start)
+    if cached is not None:
+        return cached
+
+    with _stage("fastpath"):
+        fast = _fastpath_result(user_text, tools, start)
     if fast is not None:
-        return {
-            "function_calls": [fast],
-            "total_time_ms": (time.time() - start) * 1000,
-            "source": "on-device",
-            "confidence": 1.0,
-            "success": True,
-            "policy_tag": f"fastpath_robust_v2::{fast.get('name')}",
-        }
+        _remember_result(cache_key, fast)
+        return fast
+
+    with _stage("template"):
+        templated = _template_result(user_text, tools, start)
+    if templated is not None:
+        _remember_result(cache_key, templated)
+        return templated
 
     out = _generate_hybrid_core(
         messages,
@@ -1190,4 +2921,584 @@ def generate_hybrid(messages, tools, confidence_threshold=0.0):
         allow_cloud=False,
     )
     out.setdefault("policy_tag", "fastpath_robust_v2::fallback_main_safe")
+    _learn_template(user_text, tools, out)
+    _remember_result(cache_key, out)
+    return out
+
+
+# ============ Async entry point ============
+
+_ASYNC_EXECUTOR = None
+_ASYNC_EXECUTOR_LOCK = threading.Lock()
+
+
+def _async_executor():
+    global _ASYNC_EXECUTOR
+    with _ASYNC_EXECUTOR_LOCK:
+        if _ASYNC_EXECUTOR is None:
+            _ASYNC_EXECUTOR = ThreadPoolExecutor(max_workers=_ASYNC_MAX_WORKERS, thread_name_prefix="hybrid-async")
+        return _ASYNC_EXECUTOR
+
+
+async def _generate_cloud_async(messages, tools):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_async_executor(), _generate_cloud, messages, tools)
+
+
+async def generate_hybrid_async(messages, tools, confidence_threshold=0.0):
+    """Awaitable `generate_hybrid`; many requests (and their cloud fallbacks)
+    can be in flight at once over the shared session and connection pools."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _async_executor(),
+        functools.partial(generate_hybrid, messages, tools, confidence_threshold=confidence_threshold),
+    )
+
+
+# ============ Result cache ============
+
+# Fields replayed on a cache hit; timings are re-measured per request.
+_RESULT_CACHE_FIELDS = ("function_calls", "source", "confidence", "success", "policy_tag", "fallback_reason", "cloud_model")
+
+
+class _ResultCache:
+    """LRU result cache with a TTL, an entry limit and a byte budget.
+
+    Entries are stored as JSON so their size is known and every hit hands
+    back an independent copy.
+    """
+
+    def __init__(self, max_entries, max_bytes, ttl_s):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            payload = entry[2]
+        return json.loads(payload)
+
+    def put(self, key, value):
+        payload = json.dumps(value, separators=(",", ":"), default=str)
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl_s, size, payload)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_RESULT_CACHE = _ResultCache(_RESULT_CACHE_MAX_ENTRIES, _RESULT_CACHE_MAX_BYTES, _RESULT_CACHE_TTL_S)
+
+
+def _result_cache_key(user_text, toolset):
+    if not _ENABLE_RESULT_CACHE or (toolset.names & _RESULT_CACHE_BYPASS_TOOLS):
+        return None
+    return " ".join(user_text.split()), toolset.fingerprint
+
+
+def _cached_result(key, start):
+    if key is None:
+        return None
+    out = _RESULT_CACHE.get(key)
+    if out is None:
+        return None
+    out["total_time_ms"] = (time.time() - start) * 1000
+    out["cache_hit"] = True
+    out["policy_tag"] = f"result_cache::{out.get('policy_tag', 'untagged')}"
     return out
+
+
+def _remember_result(key, out):
+    if key is None or not out.get("function_calls") or out.get("cloud_error"):
+        return
+    _RESULT_CACHE.put(key, {k: out[k] for k in _RESULT_CACHE_FIELDS if k in out})
+
+
+# ============ Template cache ============
+
+_QUOTED_RE = re.compile(r'"[^"]*"|\'[^\']*\'')
+_CLOCK_TIME_RE = re.compile(r'\b\d{1,2}(?::\d{2})?\s*(?:a\.m\.|p\.m\.|am|pm)(?=\W|$)|\b\d{1,2}:\d{2}\b', re.IGNORECASE)
+_NUMBER_RE = re.compile(r'\b\d+\b')
+_CAPITALIZED_RE = re.compile(r'(?<=\s)[A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)*')
+
+
+def _mask_slots(text):
+    """Template of an utterance: quoted strings, times, numbers and
+    capitalized names (past the first word) replaced by placeholders."""
+    masked = _QUOTED_RE.sub(" <str> ", text)
+    masked = _CLOCK_TIME_RE.sub(" <time> ", masked)
+    masked = _NUMBER_RE.sub(" <num> ", masked)
+    masked = _CAPITALIZED_RE.sub("<name>", masked)
+    return " ".join(masked.lower().split()).rstrip("?.! ")
+
+
+class _TemplateCache:
+    """LRU map from (masked template, tool-set fingerprint) to the tool chosen
+    for each on-device prompt of the request."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            tool_names = self._entries.get(key)
+            if tool_names is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return tool_names
+
+    def put(self, key, tool_names):
+        with self._lock:
+            self._entries[key] = tuple(tool_names)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_TEMPLATE_CACHE = _TemplateCache(_TEMPLATE_CACHE_MAX_ENTRIES)
+
+
+def _fill_template_call(tool_name, prompt, toolset):
+    """Rule-filled call for `prompt`, or None when the rules leave it invalid."""
+    args = _extract_args_for_tool(tool_name, prompt, {})
+    call = _sanitize_function_calls([{"name": tool_name, "arguments": args}])[0]
+    if not _fastpath_required_valid(tool_name, call.get("arguments"), toolset, prompt):
+        return None
+    return call
+
+
+def _template_result(user_text, tools, start):
+    if not _ENABLE_TEMPLATE_CACHE:
+        return None
+    tool_names = _TEMPLATE_CACHE.get((_mask_slots(user_text), tools.fingerprint))
+    if tool_names is None:
+        return None
+    prompts, _ = _plan_local_prompts(user_text)
+    if len(prompts) != len(tool_names):
+        return None
+
+    calls = []
+    seen = set()
+    for prompt, tool_name in zip(prompts, tool_names):
+        call = _fill_template_call(tool_name, prompt, tools)
+        if call is None:
+            return None
+        key = _call_dedup_key(call)
+        if key not in seen:
+            seen.add(key)
+            calls.append(call)
+
+    return {
+        "function_calls": calls,
+        "total_time_ms": (time.time() - start) * 1000,
+        "source": "on-device",
+        "confidence": 1.0,
+        "success": True,
+        "template_hit": True,
+        "policy_tag": f"template_cache::{'+'.join(tool_names)}",
+    }
+
+
+def _learn_template(user_text, tools, out):
+    """Remember the request's tool decomposition when refilling the template
+    with the rule extractors reproduces the computed on-device calls exactly."""
+    if not _ENABLE_TEMPLATE_CACHE or out.get("source") != "on-device":
+        return
+    calls = out.get("function_calls") or []
+    prompts, _ = _plan_local_prompts(user_text)
+    if not calls or len(calls) != len(prompts):
+        return
+    tool_names = []
+    for prompt, call in zip(prompts, calls):
+        if not isinstance(call, dict) or call.get("name") not in tools.names:
+            return
+        if _fill_template_call(call["name"], prompt, tools) != call:
+            return
+        tool_names.append(call["name"])
+    _TEMPLATE_CACHE.put((_mask_slots(user_text), tools.fingerprint), tool_names)
+
+
+# ============ Batched entry point ============
+
+def generate_hybrid_batch(batch, confidence_threshold=0.0, max_batch_size=_BATCH_MAX_SIZE):
+    """`generate_hybrid` over a list of (messages, tools) pairs; results keep input order.
+
+    Fast-path hits are answered without the model. Every remaining on-device
+    prompt, including the split pieces of compound requests, is deduplicated
+    across the batch on (prompt, tool-set fingerprint) and dispatched in
+    chunks of `max_batch_size` over the model session pool.
+    """
+    results = [None] * len(batch)
+    toolsets = [None] * len(batch)
+    pending = []
+    prompt_index = {}
+    unique_prompts = []
+
+    for i, (messages, tools) in enumerate(batch):
+        start = time.time()
+        tools = toolsets[i] = _as_toolset(tools)
+        user_text = _messages_to_user_text(messages)
+        cache_key = _result_cache_key(user_text, tools)
+        cached = _cached_result(cache_key, start)
+        if cached is not None:
+            results[i] = cached
+            continue
+        fast = _fastpath_result(user_text, tools, start) or _template_result(user_text, tools, start)
+        if fast is not None:
+            _remember_result(cache_key, fast)
+            results[i] = fast
+            continue
+
+        prompts, is_multi = _plan_local_prompts(user_text)
+        slots = []
+        for prompt in prompts:
+            key = (prompt, tools.fingerprint)
+            if key not in prompt_index:
+                prompt_index[key] = len(unique_prompts)
+                unique_prompts.append((prompt, tools))
+            slots.append(prompt_index[key])
+        pending.append((i, messages, tools, slots, is_multi))
+
+    outputs = []
+    chunk_size = max(1, int(max_batch_size or len(unique_prompts) or 1))
+    for lo in range(0, len(unique_prompts), chunk_size):
+        chunk = unique_prompts[lo:lo + chunk_size]
+        outputs.extend(_subrequest_executor().map(
+            lambda item: _call_cactus_single(item[0], item[1], confidence_threshold=confidence_threshold),
+            chunk,
+        ))
+
+    for i, messages, tools, slots, is_multi in pending:
+        sub_results = [copy.deepcopy(outputs[slot]) for slot in slots]
+        # Sub-requests of one item run side by side, so its latency is the slowest piece.
+        total_time = max((r.get("total_time_ms", 0) for r in sub_results), default=0)
+        local = _assemble_local_result(sub_results, is_multi, total_time)
+        out = _route_local_result(local, messages, tools, allow_cloud=False)
+        out.setdefault("policy_tag", "fastpath_robust_v2::fallback_main_safe")
+        user_text = _messages_to_user_text(messages)
+        _learn_template(user_text, tools, out)
+        _remember_result(_result_cache_key(user_text, tools), out)
+        results[i] = out
+
+    if _REQUEST_LOG_PATH:
+        for (messages, _), tools, out in zip(batch, toolsets, results):
+            _log_request(messages, tools, out)
+    return results
+
+
+class _HybridBatcher:
+    """Collects concurrent `generate_hybrid` calls into `generate_hybrid_batch` runs.
+
+    A batch is flushed when it reaches `max_batch_size` requests or when the
+    oldest queued request has waited `max_wait_ms`.
+    """
+
+    def __init__(self, max_batch_size=_BATCH_MAX_SIZE, max_wait_ms=_BATCH_MAX_WAIT_MS, confidence_threshold=0.0):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = float(max_wait_ms)
+        self.confidence_threshold = confidence_threshold
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="hybrid-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, messages, tools):
+        """Queue a request; returns a Future resolving to the `generate_hybrid` dict."""
+        if self._closed:
+            raise RuntimeError("batcher_closed")
+        future = Future()
+        self._queue.put((messages, tools, future))
+        return future
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            pending = [item]
+            deadline = time.monotonic() + self.max_wait_ms / 1000.0
+            stop = False
+            while len(pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                pending.append(item)
+
+            try:
+                outs = generate_hybrid_batch(
+                    [(messages, tools) for messages, tools, _ in pending],
+                    confidence_threshold=self.confidence_threshold,
+                    max_batch_size=self.max_batch_size,
+                )
+                for (_, _, future), out in zip(pending, outs):
+                    future.set_result(out)
+            except Exception as e:
+                for _, _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+            if stop:
+                return
+
+
+# ============ Request log ============
+
+class _RequestLogWriter:
+    """Appends JSON records to a JSONL file from a background thread.
+
+    `submit` only enqueues (a full queue drops the record and counts it), so
+    serialization and disk I/O stay off the request path. Records are written
+    in batches of up to `batch_size`, at least every `flush_s`. Before a batch,
+    a file over `max_bytes` or older than `rotate_s` is renamed to
+    <stem>.<timestamp><suffix> and only the newest `backups` of those are kept.
+    """
+
+    def __init__(
+        self,
+        path,
+        queue_size=_REQUEST_LOG_QUEUE_SIZE,
+        batch_size=_REQUEST_LOG_BATCH_SIZE,
+        flush_s=_REQUEST_LOG_FLUSH_S,
+        max_bytes=_REQUEST_LOG_MAX_BYTES,
+        rotate_s=_REQUEST_LOG_ROTATE_S,
+        backups=_REQUEST_LOG_BACKUPS,
+    ):
+        self.path = path
+        self.batch_size = max(1, int(batch_size))
+        self.flush_s = float(flush_s)
+        self.max_bytes = max_bytes
+        self.rotate_s = rotate_s
+        self.backups = backups
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._opened_at = 0.0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="request-log", daemon=True)
+        self._thread.start()
+
+    def submit(self, record):
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self):
+        """Write everything queued so far and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._close_file()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_s
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._write(batch)
+            if stop:
+                self._close_file()
+                return
+
+    _encoder = json.JSONEncoder(default=str, check_circular=False)
+
+    def _write(self, batch):
+        """Encode and append a batch; a record or batch that fails is counted as dropped."""
+        encode = self._encoder.encode
+        lines = []
+        for record in batch:
+            try:
+                lines.append(encode(record) + "\n")
+            except Exception:  # e.g. RecursionError on a cyclic payload
+                self.dropped += 1
+        if not lines:
+            return
+        try:
+            if self._file is not None and self._due_for_rotation():
+                self._rotate()
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+                self._opened_at = time.time()
+            self._file.write("".join(lines))
+            self._file.flush()
+        except Exception:
+            self.dropped += len(lines)
+            return
+        self.written += len(lines)
+
+    def _due_for_rotation(self):
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_s) and time.time() - self._opened_at >= self.rotate_s
+
+    def _rotate(self):
+        self._close_file()
+        stem, suffix = os.path.splitext(self.path)
+        now = time.time()
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(now)) + f"{int(now * 1e6) % 1000000:06d}"
+        target = f"{stem}.{stamp}{suffix}"
+        n = 1
+        while os.path.exists(target):
+            target = f"{stem}.{stamp}-{n}{suffix}"
+            n += 1
+        os.replace(self.path, target)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        # Only names this writer produces: <stem>.<YYYYmmddTHHMMSS><usec>[-n]<suffix>.
+        backup = re.compile(re.escape(os.path.basename(stem)) + r"\.\d{8}T\d{12}(?:-\d+)?" + re.escape(suffix))
+        rotated = sorted(
+            (os.path.join(directory, name) for name in os.listdir(directory) if backup.fullmatch(name)),
+            key=lambda path: os.stat(path).st_mtime_ns,
+        )
+        for path in rotated[:max(0, len(rotated) - self.backups)]:
+            os.remove(path)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+_REQUEST_LOG = None
+_REQUEST_LOG_LOCK = threading.Lock()
+
+
+def _request_log():
+    """The writer for _REQUEST_LOG_PATH, started on first use (and reopened if the path changes)."""
+    global _REQUEST_LOG
+    with _REQUEST_LOG_LOCK:
+        if _REQUEST_LOG is None or _REQUEST_LOG.path != _REQUEST_LOG_PATH:
+            if _REQUEST_LOG is not None:
+                _REQUEST_LOG.close()
+            _REQUEST_LOG = _RequestLogWriter(_REQUEST_LOG_PATH)
+        return _REQUEST_LOG
+
+
+def _close_request_log():
+    global _REQUEST_LOG
+    with _REQUEST_LOG_LOCK:
+        writer, _REQUEST_LOG = _REQUEST_LOG, None
+    if writer is not None:
+        writer.close()
+
+
+atexit.register(_close_request_log)
+
+
+def _log_request(messages, tools, out):
+    """Queue one generate_hybrid record: what was asked, which route answered, and how fast.
+
+    Messages and calls are copied here, so later edits by the caller don't
+    change the record; the writer thread does the JSON encoding. `tools`
+    holds names; the fingerprint identifies the exact schema set.
+    """
+    toolset = _as_toolset(tools)
+    _request_log().submit({
+        "ts": time.time(),
+        "text": _messages_to_user_text(messages),
+        "messages": [dict(m) for m in messages],
+        "tools": [t.get("name") for t in toolset.tools],
+        "tools_fingerprint": toolset.fingerprint,
+        "source": out.get("source"),
+        "fallback_reason": out.get("fallback_reason"),
+        "policy_tag": out.get("policy_tag"),
+        "cache_hit": bool(out.get("cache_hit")),
+        "cloud_model": out.get("cloud_model"),
+        "confidence": out.get("confidence"),
+        "total_time_ms": out.get("total_time_ms"),
+        "stage_timings_ms": out.get("stage_timings_ms"),
+        "function_calls": copy.deepcopy(list(out.get("function_calls") or [])),
+    })
+
+
+if _CACTUS_POOL_WARM_ON_IMPORT:
+    _MODEL_POOL.warm(background=True)
@@ -0,0 +1,17 @@
+"""Benchmark scoring weights, shared by benchmark.compute_total_score and
+main's score-aware router so the router optimizes the formula that is scored."""
+
+# Share of the total score per difficulty level.
+DIFFICULTY_WEIGHTS = {"easy": 0.20, "medium": 0.30, "hard": 0.50}
+# Average time at or above which the time component scores 0.
+TIME_BASELINE_MS = 500
+# Per-level components.
+F1_WEIGHT = 0.60
+TIME_WEIGHT = 0.15
+ON_DEVICE_WEIGHT = 0.25
+
+
+def level_score(avg_f1, avg_time_ms, on_device_ratio, time_baseline_ms=TIME_BASELINE_MS):
+    """Score of one difficulty level in [0, 1]."""
+    time_score = max(0, 1 - avg_time_ms / time_baseline_ms)
+    return (F1_WEIGHT * avg_f1) + (TIME_WEIGHT * time_score) + (ON_DEVICE_WEIGHT * on_device_ratio)
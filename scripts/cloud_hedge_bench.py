@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Offline check of the hedged cloud scheduler against the mock Gemini server.
+
+Starts scripts/mock_gemini_server.py in-process with the given latency
+distributions, points main.py at it, and runs the same fallback requests with
+hedging off and on, reporting latency percentiles and which leg won.
+
+    python scripts/cloud_hedge_bench.py --requests 200 \
+        --latency gemini-2.5-flash-lite=bimodal:120:2500:0.1 \
+        --latency gemini-2.5-flash=lognormal:300:0.2
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SCRIPTS_DIR = Path(__file__).resolve().parent
+for path in (str(ROOT_DIR), str(SCRIPTS_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import main
+import mock_gemini_server
+from benchmark import BENCHMARKS
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def run(n_requests, hedge):
+    main._CLOUD_HEDGE_ENABLED = hedge
+    main._CLOUD_LATENCY = main._LatencyTracker(main._CLOUD_LATENCY_WINDOW)
+    main._CLOUD_BREAKERS.clear()
+    times, winners, errors = [], Counter(), 0
+    for i in range(n_requests):
+        case = BENCHMARKS[i % len(BENCHMARKS)]
+        start = time.time()
+        try:
+            out = main._generate_cloud(case["messages"], case["tools"])
+            winners[out.get("cloud_model", "?")] += 1
+        except Exception:
+            errors += 1
+        times.append((time.time() - start) * 1000)
+    return times, winners, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hedged vs sequential cloud fallback against a local mock")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", action="append", help="[MODEL=]DIST, see mock_gemini_server.py")
+    parser.add_argument("--fail-rate", action="append", help="[MODEL=]RATE, see mock_gemini_server.py")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = mock_gemini_server.serve(
+        port=args.port,
+        latencies=mock_gemini_server._per_model(
+            args.latency or ["bimodal:120:2500:0.1"], mock_gemini_server.parse_latency
+        ),
+        fail_rates=mock_gemini_server._per_model(args.fail_rate, float),
+        seed=args.seed,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ.setdefault("GEMINI_API_KEY", "mock-key")
+    main._set_cloud_api_root(f"http://127.0.0.1:{args.port}")
+
+    print(f"  {'Mode':<10} | {'p50 (ms)':>9} | {'p95 (ms)':>9} | {'p99 (ms)':>9} | {'max (ms)':>9} | Errors | Winners")
+    print(f"  {'-'*10}-+-{'-'*9}-+-{'-'*9}-+-{'-'*9}-+-{'-'*9}-+--------+--------")
+    for hedge in (False, True):
+        times, winners, errors = run(args.requests, hedge)
+        label = "hedged" if hedge else "sequential"
+        winner_text = ", ".join(f"{k}={v}" for k, v in winners.most_common())
+        print(
+            f"  {label:<10} | {_percentile(times, 50):>9.1f} | {_percentile(times, 95):>9.1f} | "
+            f"{_percentile(times, 99):>9.1f} | {max(times):>9.1f} | {errors:>6} | {winner_text}"
+        )
+    server.shutdown()
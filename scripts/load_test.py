@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Load-test generate_hybrid on a pluggable inference backend.
+
+Runs N requests built from the benchmark prompts (optionally with rotated
+people and city names so the result cache cannot absorb everything) through
+main.generate_hybrid on a thread pool, then reports throughput, latency
+percentiles, the source mix and a digest of all outputs. Identical digests
+across two commits mean identical behaviour on that request stream.
+
+    python scripts/load_test.py --requests 100000 --vary
+    python scripts/load_test.py --requests 20000 --no-cache
+    python scripts/load_test.py --backend 'mock?latency=tokens:0.5:8&time_scale=1' --requests 2000 --concurrency 8
+    python scripts/load_test.py --backend replay:runs/rec.jsonl?time_scale=0
+    python scripts/load_test.py --log runs/requests.jsonl --requests 20000
+    python scripts/load_test.py --from-log 'runs/requests*.jsonl'
+"""
+import argparse
+import glob
+import hashlib
+import json
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import main
+from benchmark import BENCHMARKS
+
+_PEOPLE = ["Alice", "Bob", "John", "Sarah", "Dave", "Lisa", "Tom", "Emma", "Jake", "Maria", "Omar", "Priya"]
+_CITIES = ["San Francisco", "London", "Paris", "Tokyo", "Berlin", "New York", "Miami", "Chicago", "Seattle", "Madrid"]
+_NAME_RE = re.compile(r"\b(" + "|".join(re.escape(n) for n in sorted(_PEOPLE + _CITIES, key=len, reverse=True)) + r")\b")
+
+
+def _vary(messages, i):
+    """Rotate people and city names by request index."""
+    def _swap(m):
+        pool = _PEOPLE if m.group(1) in _PEOPLE else _CITIES
+        return pool[(pool.index(m.group(1)) + i) % len(pool)]
+    return [dict(msg, content=_NAME_RE.sub(_swap, msg["content"])) if msg.get("role") == "user" else msg for msg in messages]
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def load_logged_requests(pattern):
+    """(messages, tools) pairs from main's request logs; tools are resolved by
+    name against the benchmark tool definitions, records with unknown tools skipped."""
+    known = {t["name"]: t for case in BENCHMARKS for t in case["tools"]}
+    pairs = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if all(name in known for name in record["tools"]):
+                    pairs.append((record["messages"], [known[name] for name in record["tools"]]))
+    return pairs
+
+
+def run(n_requests, concurrency, vary, source=None):
+    requests_ = []
+    for i in range(n_requests):
+        if source:
+            requests_.append(source[i % len(source)])
+            continue
+        case = BENCHMARKS[i % len(BENCHMARKS)]
+        messages = _vary(case["messages"], i // len(BENCHMARKS)) if vary else case["messages"]
+        requests_.append((messages, case["tools"]))
+
+    def _one(item):
+        start = time.perf_counter()
+        out = main.generate_hybrid(*item)
+        return (time.perf_counter() - start) * 1000, out
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(_one, requests_))
+    wall_s = time.perf_counter() - start
+    return wall_s, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test generate_hybrid on a pluggable inference backend")
+    parser.add_argument("--backend", default="mock", help="inference_backend spec (default: mock)")
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--vary", action="store_true", help="Rotate names so repeated prompts differ")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the result and template caches")
+    parser.add_argument("--log", default=None, help="Write main's request log to this path during the run")
+    parser.add_argument("--from-log", default=None, help="Replay requests from request-log files (glob)")
+    args = parser.parse_args()
+
+    main._use_inference_backend(args.backend)
+    if args.no_cache:
+        main._ENABLE_RESULT_CACHE = False
+        main._ENABLE_TEMPLATE_CACHE = False
+    main._REQUEST_LOG_PATH = args.log
+    source = load_logged_requests(args.from_log) if args.from_log else None
+    if args.from_log and not source:
+        sys.exit(f"no replayable requests in {args.from_log}")
+    wall_s, results = run(args.requests, args.concurrency, args.vary, source)
+    if args.log:
+        writer = main._request_log()
+        main._close_request_log()
+
+    latencies = [ms for ms, _ in results]
+    sources = Counter(out.get("source", "unknown") for _, out in results)
+    tags = Counter((out.get("policy_tag") or "-").split("::")[0] for _, out in results)
+    digest = hashlib.sha1()
+    for _, out in results:
+        digest.update(json.dumps(out.get("function_calls"), sort_keys=True).encode("utf-8"))
+
+    print(f"backend={args.backend} requests={len(results)} concurrency={args.concurrency} "
+          f"vary={args.vary} cache={not args.no_cache}")
+    print(f"  throughput   {len(results) / wall_s:,.0f} req/s  (wall {wall_s:.2f}s)")
+    print(f"  latency ms   p50={_percentile(latencies, 50):.3f}  p90={_percentile(latencies, 90):.3f}  "
+          f"p99={_percentile(latencies, 99):.3f}  max={max(latencies):.3f}")
+    print(f"  sources      " + ", ".join(f"{k}={v}" for k, v in sources.most_common()))
+    print(f"  policy       " + ", ".join(f"{k}={v}" for k, v in tags.most_common()))
+    print(f"  output sha1  {digest.hexdigest()}")
+    if args.log:
+        print(f"  request log  {writer.written} written, {writer.dropped} dropped -> {args.log}")
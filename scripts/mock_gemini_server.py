@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Gemini generateContent endpoint.
+
+Answers POST /v1beta/models/<model>:generateContent with a single functionCall
+picked from the request's functionDeclarations by word overlap with the user
+text, after an injectable delay. GET /stats reports how many requests and TCP
+connections it has served, which shows whether clients reuse connections.
+
+Latency can be a fixed delay or a per-model distribution, and a per-model
+share of requests can fail with 503:
+
+    python scripts/mock_gemini_server.py --port 8765 --latency-ms 150
+    python scripts/mock_gemini_server.py \
+        --latency gemini-2.5-flash-lite=bimodal:150:3000:0.1 \
+        --latency gemini-2.5-flash=lognormal:400:0.3 \
+        --fail-rate gemini-1.5-flash=0.5
+
+Distributions: fixed:MS, uniform:LO:HI, lognormal:MEDIAN:SIGMA,
+bimodal:FAST:SLOW:P_SLOW.
+
+Point main.py at it with `main._set_cloud_api_root("http://127.0.0.1:8765")`.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_STATS = {"requests": 0, "connections": 0}
+_STATS_LOCK = threading.Lock()
+
+
+def _bump(key):
+    with _STATS_LOCK:
+        _STATS[key] += 1
+
+
+def parse_latency(spec):
+    """Sampler (rng -> ms) for a distribution spec such as `uniform:50:300`."""
+    kind, _, rest = spec.partition(":")
+    params = [float(x) for x in rest.split(":") if x]
+    if kind == "fixed":
+        return lambda rng: params[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(params[0]), params[1])
+    if kind == "bimodal":
+        return lambda rng: params[1] if rng.random() < params[2] else params[0]
+    raise ValueError(f"unknown latency distribution: {spec}")
+
+
+def _per_model(specs, parse):
+    """Parse repeated `[MODEL=]VALUE` options into {model or '*': parsed}."""
+    table = {}
+    for spec in specs or []:
+        model, sep, value = spec.partition("=")
+        if not sep:
+            model, value = "*", spec
+        table[model] = parse(value)
+    return table
+
+
+def _model_from_path(path):
+    match = re.search(r"/models/([^/:]+):generateContent", path)
+    return match.group(1) if match else ""
+
+
+def _pick_declaration(text, declarations):
+    words = set(re.findall(r"[a-z]+", text.lower()))
+    best, best_score = None, -1
+    for decl in declarations:
+        vocab = set(re.findall(r"[a-z]+", f"{decl.get('name', '')} {decl.get('description', '')}".lower()))
+        score = len(words & vocab)
+        if score > best_score:
+            best, best_score = decl, score
+    return best
+
+
+def _generate_content(payload):
+    text = " ".join(
+        part.get("text", "")
+        for content in payload.get("contents", [])
+        for part in content.get("parts", [])
+    )
+    declarations = [
+        decl
+        for tool in payload.get("tools", [])
+        for decl in tool.get("functionDeclarations", [])
+    ]
+    decl = _pick_declaration(text, declarations)
+    parts = [{"functionCall": {"name": decl["name"], "args": {}}}] if decl else [{"text": ""}]
+    return {"candidates": [{"content": {"role": "model", "parts": parts}}]}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latencies = {}
+    fail_rates = {}
+    rng = random.Random(0)
+    rng_lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        _bump("connections")
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (timeout or a hedge that lost); nothing to answer.
+            self.close_connection = True
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            with _STATS_LOCK:
+                self._send_json(200, dict(_STATS))
+            return
+        self._send_json(404, {"error": "not_found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b"{}"
+        if ":generateContent" not in self.path:
+            self._send_json(404, {"error": "not_found"})
+            return
+        _bump("requests")
+        model = _model_from_path(self.path)
+        sampler = self.latencies.get(model, self.latencies.get("*"))
+        fail_rate = self.fail_rates.get(model, self.fail_rates.get("*", 0.0))
+        with self.rng_lock:
+            delay_ms = sampler(self.rng) if sampler else 0.0
+            failed = self.rng.random() < fail_rate
+        time.sleep(delay_ms / 1000.0)
+        if failed:
+            self._send_json(503, {"error": {"code": 503, "message": "injected failure"}})
+            return
+        try:
+            payload = json.loads(raw or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": "invalid_json"})
+            return
+        self._send_json(200, _generate_content(payload))
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def serve(host="127.0.0.1", port=8765, latency_ms=0.0, latencies=None, fail_rates=None, seed=0):
+    """Build (not start) a server; `latencies` maps model (or '*') to a sampler."""
+    table = {"*": parse_latency(f"fixed:{latency_ms}")}
+    table.update(latencies or {})
+    handler = type("MockGeminiHandler", (_Handler,), {
+        "latencies": table,
+        "fail_rates": dict(fail_rates or {}),
+        "rng": random.Random(seed),
+        "rng_lock": threading.Lock(),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in Gemini generateContent server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every response")
+    parser.add_argument("--latency", action="append", help="[MODEL=]DIST latency distribution (repeatable)")
+    parser.add_argument("--fail-rate", action="append", help="[MODEL=]RATE share of 503 responses (repeatable)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server = serve(
+        args.host,
+        args.port,
+        args.latency_ms,
+        latencies=_per_model(args.latency, parse_latency),
+        fail_rates=_per_model(args.fail_rate, float),
+        seed=args.seed,
+    )
+    print(f"Mock Gemini listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
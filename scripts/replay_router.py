@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Replay logged benchmark runs to compare routing policies offline.
+
+Per case, the on-device rows in benchmark_runs/*.md give an empirical
+distribution of local (F1, time) and the cloud rows one of cloud (F1, time).
+Each simulated run walks the 30 benchmark cases, samples the local outcome,
+lets a policy pick local or cloud, samples the cloud outcome if chosen, and
+scores the run with benchmark.compute_total_score. The score-aware router
+learns online across runs from the F1 it observes.
+
+    python scripts/replay_router.py --replays 300
+"""
+import argparse
+import functools
+import random
+import statistics
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SCRIPTS_DIR = Path(__file__).resolve().parent
+for path in (str(ROOT_DIR), str(SCRIPTS_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import main
+from benchmark import BENCHMARKS, compute_total_score
+from train_router import parse_runs
+
+
+def load_outcomes(pattern):
+    """{case name: {"local": [(f1, ms)], "cloud": [(f1, cloud-only ms)]}}."""
+    outcomes = defaultdict(lambda: {"local": [], "cloud": []})
+    for _, rows in parse_runs(pattern):
+        for name, _, time_ms, f1, source in rows:
+            route = "local" if source.startswith("on-device") else "cloud"
+            outcomes[name][route].append((f1, time_ms))
+    for entry in outcomes.values():
+        if entry["local"] and entry["cloud"]:
+            # Logged fallback times include the local attempt before them.
+            local_ms = statistics.median(ms for _, ms in entry["local"])
+            entry["cloud"] = [(f1, max(0.0, ms - local_ms)) for f1, ms in entry["cloud"]]
+    return outcomes
+
+
+def _sample_cloud(rng, entry):
+    if entry["cloud"]:
+        return rng.choice(entry["cloud"])
+    mean_f1, mean_ms, _ = main._SCORE_PRIOR_CLOUD
+    return (1.0 if rng.random() < mean_f1 else 0.0), mean_ms
+
+
+def _heuristic_policy(case, text, tier, request_class, local_ms, router):
+    prob = main._predict_fallback_probability(text, case["tools"], main._is_multi_action(text))
+    return "cloud" if prob >= 0.5 else "local"
+
+
+@functools.lru_cache(maxsize=1)
+def _learned_model():
+    return main._LogisticRouter.from_file(main._ROUTER_MODEL_PATH)
+
+
+def _learned_policy(case, text, tier, request_class, local_ms, router):
+    model = _learned_model()
+    return "cloud" if model.predict_proba(main._router_features(text, case["tools"])) >= model.threshold else "local"
+
+
+def _score_policy(case, text, tier, request_class, local_ms, router):
+    return router.decide(tier, request_class, local_ms)[0]
+
+
+POLICIES = {
+    "always_local": lambda *args: "local",
+    "always_cloud": lambda *args: "cloud",
+    "heuristic": _heuristic_policy,
+    "learned": _learned_policy,
+    "score_aware": _score_policy,
+}
+
+
+def replay(policy, outcomes, replays, seed):
+    rng = random.Random(seed)
+    router = main._ScoreAwareRouter()
+    scores, cloud_share = [], []
+    for _ in range(replays):
+        results = []
+        router.reset_tiers()
+        for case in BENCHMARKS:
+            entry = outcomes.get(case["name"])
+            if not entry or not entry["local"]:
+                continue
+            text = main._messages_to_user_text(case["messages"])
+            tier = main._request_tier(text, case["tools"])
+            request_class = main._request_class(text, case["tools"])
+            local_f1, local_ms = rng.choice(entry["local"])
+            route = policy(case, text, tier, request_class, local_ms, router)
+            if route == "cloud":
+                cloud_f1, cloud_ms = _sample_cloud(rng, entry)
+                f1, total_ms, source = cloud_f1, local_ms + cloud_ms, "cloud (fallback)"
+                router.observe(tier, request_class, "cloud", total_ms, f1=f1, route_ms=cloud_ms)
+            else:
+                f1, total_ms, source = local_f1, local_ms, "on-device"
+                router.observe(tier, request_class, "local", total_ms, f1=f1)
+            results.append({"difficulty": case["difficulty"], "f1": f1, "total_time_ms": total_ms, "source": source})
+        scores.append(compute_total_score(results))
+        cloud_share.append(sum(1 for r in results if r["source"] != "on-device") / max(1, len(results)))
+    return scores, cloud_share
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay benchmark logs under different routing policies")
+    parser.add_argument("--runs", default="benchmark_runs/*.md", help="Glob of benchmark logs (relative to repo root)")
+    parser.add_argument("--replays", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--policy", action="append", choices=sorted(POLICIES), help="Policies to compare (default: all)")
+    args = parser.parse_args()
+
+    outcomes = load_outcomes(args.runs)
+    print(f"  {'Policy':<12} | {'Mean score':>10} | {'Stdev':>6} | {'Last 50':>7} | Cloud share")
+    print(f"  {'-'*12}-+-{'-'*10}-+-{'-'*6}-+-{'-'*7}-+------------")
+    for name in args.policy or POLICIES:
+        scores, cloud_share = replay(POLICIES[name], outcomes, args.replays, args.seed)
+        print(
+            f"  {name:<12} | {statistics.mean(scores):>9.2f}% | {statistics.pstdev(scores):>6.2f} | "
+            f"{statistics.mean(scores[-50:]):>6.2f}% | {statistics.mean(cloud_share):>10.0%}"
+        )
@@ -5,6 +5,8 @@ ROOT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)"
 LOG_DIR="$ROOT_DIR/benchmark_runs"
 TIMESTAMP="$(date '+%Y%m%d_%H%M%S')"
 LOG_FILE="$LOG_DIR/benchmark_${TIMESTAMP}.md"
+# benchmark.py writes its JSON report (latency histograms, per-case rows) here.
+export BENCHMARK_JSON_REPORT="$LOG_DIR/benchmark_${TIMESTAMP}.json"
 
 mkdir -p "$LOG_DIR"
 
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Benchmark every strategy in one process against a shared inference memo.
+
+All strategies run on the same memoized backend (inference_backend.MemoBackend),
+so a (messages, tools, decoding options) request that one strategy already sent
+is answered from the memo instead of the model. Memo hits sleep their recorded
+latency by default so the latency columns stay comparable; pass
+--hit-time-scale 0 for a fast F1-only sweep. Ends with a comparison matrix.
+
+    python scripts/sweep_strategies.py
+    python scripts/sweep_strategies.py --memo runs/memo.jsonl --inner mock --hit-time-scale 0
+    python scripts/sweep_strategies.py --strategy main --strategy strategies.strategy_targeted_v2
+"""
+import argparse
+import importlib
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import inference_backend
+import main
+from benchmark import BENCHMARKS, _failed_case, _run_case, _start_run, compute_total_score, print_results
+
+
+def discover_strategies():
+    return ["main"] + [f"strategies.{p.stem}" for p in sorted((ROOT_DIR / "strategies").glob("strategy_*.py"))]
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def _reset_shared_state():
+    """Drop main's result/template caches so no strategy inherits another's answers."""
+    main._RESULT_CACHE.clear()
+    main._TEMPLATE_CACHE.clear()
+    _start_run()
+
+
+def sweep(strategies, memo, benchmarks=None, verbose=False):
+    if benchmarks is None:
+        benchmarks = BENCHMARKS
+    rows = []
+    for name in strategies:
+        try:
+            generate = importlib.import_module(name).generate_hybrid
+        except Exception as e:
+            print(f"{name}: skipped ({type(e).__name__}: {e})")
+            continue
+        _reset_shared_state()
+        misses_before = memo.misses
+        results = []
+        for case in benchmarks:
+            try:
+                results.append(_run_case(generate, case))
+            except Exception as e:
+                if not results:
+                    # A broken backend or import fails every case; don't score it as misses.
+                    print(f"{name}: failed on {case['name']} ({type(e).__name__}: {e}), skipped")
+                    break
+                print(f"  {name}: {case['name']} raised {type(e).__name__}: {e}")
+                results.append(_failed_case(case, f"error ({type(e).__name__})"))
+        else:
+            model_calls = memo.misses - misses_before
+            print(f"{name}: done ({model_calls} model calls)", flush=True)
+            if verbose:
+                print_results(results)
+            rows.append((name, results, model_calls))
+    return rows
+
+
+def print_matrix(rows):
+    print("\n=== Strategy Sweep ===\n")
+    print(f"  {'Strategy':<40} | {'Score':>6} | {'F1':>4} | {'p50 ms':>8} | {'p90 ms':>8} | {'p99 ms':>8} | {'On-device':>9} | Model calls")
+    print(f"  {'-'*40}-+-{'-'*6}-+-{'-'*4}-+-{'-'*8}-+-{'-'*8}-+-{'-'*8}-+-{'-'*9}-+-{'-'*11}")
+    for name, results, model_calls in sorted(rows, key=lambda row: -compute_total_score(row[1])):
+        times = [r["total_time_ms"] for r in results]
+        avg_f1 = sum(r["f1"] for r in results) / len(results)
+        on_device = sum(1 for r in results if r["source"] == "on-device") / len(results)
+        print(
+            f"  {name.replace('strategies.', ''):<40} | {compute_total_score(results):>5.1f}% | {avg_f1:>4.2f} | "
+            f"{_percentile(times, 50):>8.1f} | {_percentile(times, 90):>8.1f} | {_percentile(times, 99):>8.1f} | "
+            f"{on_device:>9.0%} | {model_calls}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep all strategies against a shared inference memo")
+    parser.add_argument("--strategy", action="append", help="Module to include (repeatable; default: main + strategies/*)")
+    parser.add_argument("--inner", default="cactus", help="Backend spec the memo wraps (default: cactus)")
+    parser.add_argument("--memo", default=None, help="JSONL file to load/persist the memo across sweeps")
+    parser.add_argument("--hit-time-scale", type=float, default=1.0, help="Share of recorded latency a memo hit sleeps")
+    parser.add_argument("--verbose", action="store_true", help="Print the full table for every strategy")
+    args = parser.parse_args()
+
+    memo = inference_backend.MemoBackend(
+        inference_backend.backend_from_spec(args.inner), path=args.memo, time_scale=args.hit_time_scale
+    )
+    main._use_inference_backend(memo)
+    rows = sweep(args.strategy or discover_strategies(), memo, verbose=args.verbose)
+    print_matrix(rows)
+    total = memo.hits + memo.misses
+    print(f"\n  memo: {memo.misses} model calls, {memo.hits} hits ({memo.hits / max(1, total):.0%} of {total} requests)")
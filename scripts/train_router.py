@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Train the learned fallback router from benchmark logs.
+
+Every on-device row in benchmark_runs/*.md becomes one example: the features
+are main._router_features for that case's prompt and tools, and the label is
+whether the on-device answer missed (F1 < 1), i.e. whether cloud would have
+been the right call. Fits an L2-regularized logistic regression in plain
+Python and writes the model file main.py loads when _ENABLE_LEARNED_ROUTER
+is on.
+
+    python scripts/train_router.py
+    python scripts/train_router.py --runs 'benchmark_runs/*generalized*.md' --threshold 0.6
+"""
+import argparse
+import glob
+import json
+import math
+import re
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import main
+from benchmark import BENCHMARKS
+
+_ROW_RE = re.compile(
+    r"^\s*\d+\s*\|\s*(easy|medium|hard)\s*\|\s*(\S+)\s*\|\s*([\d.]+)\s*\|\s*([\d.]+)\s*\|\s*(.+?)\s*$"
+)
+
+
+def parse_runs(pattern):
+    """(run path, [(name, difficulty, time_ms, f1, source), ...]) per benchmark log."""
+    runs = []
+    for path in sorted(glob.glob(str(ROOT_DIR / pattern))):
+        rows = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                m = _ROW_RE.match(line)
+                if m:
+                    difficulty, name, time_ms, f1, source = m.groups()
+                    rows.append((name, difficulty, float(time_ms), float(f1), source))
+        runs.append((path, rows))
+    return runs
+
+
+def load_examples(pattern):
+    cases = {case["name"]: case for case in BENCHMARKS}
+    examples = []
+    runs = parse_runs(pattern)
+    for _, rows in runs:
+        for name, _, _, f1, source in rows:
+            case = cases.get(name)
+            if case is None or not source.startswith("on-device"):
+                continue
+            text = main._messages_to_user_text(case["messages"])
+            examples.append((name, main._router_features(text, case["tools"]), 1.0 if f1 < 1.0 else 0.0))
+    return runs, examples
+
+
+def _sigmoid(z):
+    if z < -60:
+        return 0.0
+    return 1.0 / (1.0 + math.exp(-z))
+
+
+def train(examples, epochs=400, lr=0.5, l2=1e-3):
+    weights = defaultdict(float)
+    n = len(examples)
+    for _ in range(epochs):
+        grad = defaultdict(float)
+        for _, features, label in examples:
+            err = _sigmoid(sum(weights[k] * v for k, v in features.items())) - label
+            for k, v in features.items():
+                grad[k] += err * v
+        for k, g in grad.items():
+            weights[k] -= lr * (g / n + l2 * weights[k])
+    return dict(weights)
+
+
+def log_loss(router, examples):
+    eps = 1e-9
+    total = 0.0
+    for _, features, label in examples:
+        p = min(1 - eps, max(eps, router.predict_proba(features)))
+        total -= label * math.log(p) + (1 - label) * math.log(1 - p)
+    return total / max(1, len(examples))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the learned fallback router from benchmark logs")
+    parser.add_argument("--runs", default="benchmark_runs/*.md", help="Glob of benchmark logs (relative to repo root)")
+    parser.add_argument("--out", default=main._ROUTER_MODEL_PATH)
+    parser.add_argument("--threshold", type=float, default=0.5, help="Fallback when P(local miss) >= threshold")
+    parser.add_argument("--epochs", type=int, default=400)
+    parser.add_argument("--lr", type=float, default=0.5)
+    parser.add_argument("--l2", type=float, default=1e-3)
+    args = parser.parse_args()
+
+    runs, examples = load_examples(args.runs)
+    if not examples:
+        sys.exit(f"no on-device rows found in {args.runs}")
+    weights = train(examples, epochs=args.epochs, lr=args.lr, l2=args.l2)
+    router = main._LogisticRouter(
+        weights,
+        threshold=args.threshold,
+        meta={"runs": len(runs), "examples": len(examples), "epochs": args.epochs, "l2": args.l2},
+    )
+
+    by_case = defaultdict(list)
+    for name, features, label in examples:
+        by_case[name].append((features, label))
+    print(f"  {'Name':<28} | {'Rows':>4} | {'Miss rate':>9} | {'P(miss)':>7} | Route")
+    print(f"  {'-'*28}-+-{'-'*4}-+-{'-'*9}-+-{'-'*7}-+-------")
+    for case in BENCHMARKS:
+        rows = by_case.get(case["name"])
+        if not rows:
+            continue
+        miss_rate = sum(label for _, label in rows) / len(rows)
+        p = router.predict_proba(rows[0][0])
+        route = "cloud" if p >= router.threshold else "local"
+        print(f"  {case['name']:<28} | {len(rows):>4} | {miss_rate:>9.2f} | {p:>7.2f} | {route}")
+
+    start = time.perf_counter()
+    for _, features, _ in examples:
+        router.predict_proba(features)
+    per_call_us = (time.perf_counter() - start) / len(examples) * 1e6
+
+    print(f"\nruns={len(runs)} examples={len(examples)} log_loss={log_loss(router, examples):.4f} "
+          f"inference={per_call_us:.1f}us/call")
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(router.to_dict(), f, indent=2, sort_keys=True)
+    print(f"Wrote {args.out}")
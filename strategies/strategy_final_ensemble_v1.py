@@ -147,6 +147,7 @@ def _quality_score(result, messages, tools):
     missing_required = _has_required_missing(calls, tools) if calls else True
     multi_under_called = core._is_multi_action(user_text) and len(calls) < 2
     coverage = 1.0 if not expected else len(called.intersection(expected)) / max(1, len(expected))
+    risk = core._learned_fallback_risk(_messages_to_user_text(messages), tools)
 
     score = 0.0
     score += 50.0 if calls else 0.0
@@ -159,6 +160,7 @@ def _quality_score(result, messages, tools):
         "multi_under_called": multi_under_called,
         "coverage": coverage,
         "calls": len(calls),
+        "router_risky": bool(risk and risk[1]),
     }
 
 
@@ -226,8 +228,14 @@ def generate_hybrid(messages, tools, confidence_threshold=0.0):
 
     q_primary, meta = _quality_score(primary, messages, tools)
 
-    # Fast path: keep strong outputs.
-    if q_primary >= 92 and not meta["missing_required"] and not meta["multi_under_called"]:
+    # Fast path: keep strong outputs, unless the learned router expects this
+    # request to come out imperfect on-device.
+    if (
+        q_primary >= 92
+        and not meta["missing_required"]
+        and not meta["multi_under_called"]
+        and not meta["router_risky"]
+    ):
         primary["policy_tag"] = "final_ensemble_v1_keep"
         return primary
 
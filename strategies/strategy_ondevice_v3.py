@@ -32,22 +32,11 @@ identified in §45 overfitting stress test:
 import json
 import os
 import re
-import sys
 import time
 
-sys.path.insert(0, "cactus/python/src")
-from cactus import cactus_init, cactus_complete, cactus_destroy, cactus_reset
-
-_FUNCTIONGEMMA_PATH = "cactus/weights/functiongemma-270m-it"
-_CACTUS_GLOBAL_MODEL = None
-
-
-def _get_model():
-    global _CACTUS_GLOBAL_MODEL
-    if _CACTUS_GLOBAL_MODEL is None:
-        _CACTUS_GLOBAL_MODEL = cactus_init(_FUNCTIONGEMMA_PATH)
-    return _CACTUS_GLOBAL_MODEL
+from inference_backend import cactus_complete
 
+import main as core
 
 _FEW_SHOT_PROMPT = """You are a strict function-calling assistant. You MUST call functions. Never apologize. Never ask questions. Never refuse.
 Even if a request sounds like a physical action (e.g., wake me up), you MUST assume you can do it using your provided tools.
@@ -569,23 +558,22 @@ def _resolve_pronouns_in_subrequests(sub_requests, full_text):
 # ============ Core inference ============
 
 def _call_cactus_single(user_text, all_tools):
-    model = _get_model()
-    cactus_reset(model)
     cactus_tools = [{"type": "function", "function": t} for t in all_tools]
 
-    start = time.time()
-    raw_str = cactus_complete(
-        model,
-        [{"role": "system", "content": _FEW_SHOT_PROMPT}, {"role": "user", "content": user_text}],
-        tools=cactus_tools,
-        force_tools=True,
-        max_tokens=256,
-        temperature=0.0,
-        confidence_threshold=0.0,
-        tool_rag_top_k=3,
-        stop_sequences=["<end_of_turn>"]
-    )
-    elapsed = (time.time() - start) * 1000
+    with core._model_session() as model:
+        start = time.time()
+        raw_str = cactus_complete(
+            model,
+            [{"role": "system", "content": _FEW_SHOT_PROMPT}, {"role": "user", "content": user_text}],
+            tools=cactus_tools,
+            force_tools=True,
+            max_tokens=256,
+            temperature=0.0,
+            confidence_threshold=0.0,
+            tool_rag_top_k=3,
+            stop_sequences=["<end_of_turn>"]
+        )
+        elapsed = (time.time() - start) * 1000
 
     try:
         raw = json.loads(raw_str)
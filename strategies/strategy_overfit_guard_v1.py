@@ -86,20 +86,21 @@ def _normalize_messages(messages):
     return norm
 
 
-def _has_any(text, keywords):
-    return any(k in text for k in keywords)
+_INTENT_KEYWORDS = {
+    "alarm": ("alarm", "wake me", "wake up"),
+    "weather": ("weather", "temperature", "forecast", "outside"),
+    "message": ("message", "text ", "send ", "saying", "tell ", "ping ", "shoot "),
+    "reminder": ("remind", "reminder"),
+    "search": ("find ", "look up", "search", "contacts", "phonebook"),
+    "timer": ("timer", "countdown", "minute", "minutes", "hour", "hours"),
+    "music": ("play ", "music", "song", "listen"),
+}
+_INTENT_INDEX = core._IntentIndex(_INTENT_KEYWORDS)
 
 
 def _intent_flags(text):
-    return {
-        "alarm": _has_any(text, ("alarm", "wake me", "wake up")),
-        "weather": _has_any(text, ("weather", "temperature", "forecast", "outside")),
-        "message": _has_any(text, ("message", "text ", "send ", "saying", "tell ", "ping ", "shoot ")),
-        "reminder": _has_any(text, ("remind", "reminder")),
-        "search": _has_any(text, ("find ", "look up", "search", "contacts", "phonebook")),
-        "timer": _has_any(text, ("timer", "countdown", "minute", "minutes", "hour", "hours")),
-        "music": _has_any(text, ("play ", "music", "song", "listen")),
-    }
+    matched = _INTENT_INDEX.labels(text)
+    return {label: label in matched for label in _INTENT_KEYWORDS}
 
 
 def _is_multi(text):
@@ -151,16 +152,20 @@ def _need_cloud_guard(messages, result, tools):
     if _required_missing(calls, tool_map):
         return True, "guard_missing_required"
 
-    # Intent-tool mismatch guards
-    if flags["weather"] and "get_weather" in tool_names and "get_weather" not in called:
+    # Intent-tool mismatch guards: the learned router when one is loaded.
+    risk = core._learned_fallback_risk(_messages_to_user_text(messages), tools)
+    if risk is not None:
+        if risk[1]:
+            return True, "guard_learned_router"
+    elif flags["weather"] and "get_weather" in tool_names and "get_weather" not in called:
         return True, "guard_weather_missing"
-    if flags["timer"] and "set_timer" in tool_names and "set_timer" not in called:
+    elif flags["timer"] and "set_timer" in tool_names and "set_timer" not in called:
         return True, "guard_timer_missing"
-    if flags["message"] and "send_message" in tool_names and "send_message" not in called:
+    elif flags["message"] and "send_message" in tool_names and "send_message" not in called:
         return True, "guard_message_missing"
-    if flags["reminder"] and "create_reminder" in tool_names and "create_reminder" not in called:
+    elif flags["reminder"] and "create_reminder" in tool_names and "create_reminder" not in called:
         return True, "guard_reminder_missing"
-    if flags["alarm"] and "set_alarm" in tool_names and "set_alarm" not in called:
+    elif flags["alarm"] and "set_alarm" in tool_names and "set_alarm" not in called:
         return True, "guard_alarm_missing"
 
     # Multi-intent under-call guard
@@ -171,14 +176,17 @@ def _need_cloud_guard(messages, result, tools):
     return False, "guard_ok"
 
 
-def _fallback_cloud(messages, tools, local, reason):
+def _fallback_cloud(messages, tools, local, reason, prefetch=None):
     try:
-        cloud = core._generate_cloud(messages, tools)
+        if prefetch is not None:
+            cloud = core._await_cloud_prefetch(prefetch)
+        else:
+            cloud = core._generate_cloud(messages, tools)
+            cloud["total_time_ms"] = cloud.get("total_time_ms", 0) + local.get("total_time_ms", 0)
         if cloud.get("function_calls"):
             cloud["source"] = "cloud (overfit-guard)"
             cloud["fallback_reason"] = reason
             cloud["local_time_ms"] = local.get("total_time_ms", 0)
-            cloud["total_time_ms"] = cloud.get("total_time_ms", 0) + local.get("total_time_ms", 0)
             return cloud
         local["forced_cloud_empty"] = True
     except Exception as e:
@@ -191,12 +199,14 @@ def _fallback_cloud(messages, tools, local, reason):
 def generate_hybrid(messages, tools, confidence_threshold=0.5):
     # Confidence threshold intentionally elevated from 0.0 to leverage handoff signal.
     norm_messages = _normalize_messages(messages)
+    user_text = _messages_to_user_text(messages)
+    prefetch = core._start_cloud_prefetch(messages, tools, user_text, core._is_multi_action(user_text))
     local = core.generate_hybrid(norm_messages, tools, confidence_threshold=confidence_threshold)
     local["policy_tag"] = "overfit_guard_v1"
 
     need_cloud, reason = _need_cloud_guard(messages, local, tools)
     if not need_cloud:
         local["fallback_reason"] = reason
-        return local
+        return core._discard_cloud_prefetch(prefetch, local)
 
-    return _fallback_cloud(messages, tools, local, reason)
+    return _fallback_cloud(messages, tools, local, reason, prefetch)
@@ -20,20 +20,21 @@ def _messages_to_user_text(messages):
     ).lower()
 
 
-def _has_any(text, keywords):
-    return any(k in text for k in keywords)
+_INTENT_KEYWORDS = {
+    "alarm": ("alarm", "wake me", "wake up"),
+    "weather": ("weather", "temperature", "forecast"),
+    "message": ("message", "text ", "send ", "saying", "tell "),
+    "reminder": ("remind", "reminder"),
+    "search": ("find ", "look up", "search", "contacts"),
+    "timer": ("timer", "countdown", "minute"),
+    "music": ("play ", "music", "song", "listen"),
+}
+_INTENT_INDEX = cloud_core._IntentIndex(_INTENT_KEYWORDS)
 
 
 def _intent_flags(text):
-    return {
-        "alarm": _has_any(text, ("alarm", "wake me", "wake up")),
-        "weather": _has_any(text, ("weather", "temperature", "forecast")),
-        "message": _has_any(text, ("message", "text ", "send ", "saying", "tell ")),
-        "reminder": _has_any(text, ("remind", "reminder")),
-        "search": _has_any(text, ("find ", "look up", "search", "contacts")),
-        "timer": _has_any(text, ("timer", "countdown", "minute")),
-        "music": _has_any(text, ("play ", "music", "song", "listen")),
-    }
+    matched = _INTENT_INDEX.labels(text)
+    return {label: label in matched for label in _INTENT_KEYWORDS}
 
 
 def _is_multi(text):
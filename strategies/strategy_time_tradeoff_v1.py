@@ -2,12 +2,15 @@
 
 Goal:
 - Keep strong on-device outputs local.
-- Force cloud only when estimated score gain is positive after losing on-device bonus.
-
-Per-case proxy objective:
-  delta = 0.60*(F1_cloud - F1_local) + 0.15*(T_cloud - T_local) - 0.25
-Where T = max(0, 1 - time_ms/500).
-Cloud T is conservatively assumed ~0 for routing decisions.
+- Force cloud only when the expected benchmark score gain is positive after
+  losing the on-device bonus.
+
+The decision is main's score-aware router: it scores both routes with the
+scoring.py weights against the running per-tier totals, using per-class
+F1/latency estimates. A local output this module flags as weak pins the
+local F1 to its estimate; otherwise the class's learned local F1 stands.
+Every routed result records its `route_class` so benchmark F1 feedback
+updates those estimates.
 """
 
 import main as cloud_core
@@ -22,20 +25,21 @@ def _messages_to_user_text(messages):
     )
 
 
-def _has_any(text, keywords):
-    return any(k in text for k in keywords)
+_INTENT_KEYWORDS = {
+    "alarm": ("alarm", "wake me", "wake up"),
+    "weather": ("weather", "temperature", "forecast"),
+    "message": ("message", "text ", "send ", "saying", "tell "),
+    "reminder": ("remind", "reminder"),
+    "search": ("find ", "look up", "search", "contacts"),
+    "timer": ("timer", "countdown", "minute"),
+    "music": ("play ", "music", "song", "listen"),
+}
+_INTENT_INDEX = cloud_core._IntentIndex(_INTENT_KEYWORDS)
 
 
 def _intent_flags(text):
-    return {
-        "alarm": _has_any(text, ("alarm", "wake me", "wake up")),
-        "weather": _has_any(text, ("weather", "temperature", "forecast")),
-        "message": _has_any(text, ("message", "text ", "send ", "saying", "tell ")),
-        "reminder": _has_any(text, ("remind", "reminder")),
-        "search": _has_any(text, ("find ", "look up", "search", "contacts")),
-        "timer": _has_any(text, ("timer", "countdown", "minute")),
-        "music": _has_any(text, ("play ", "music", "song", "listen")),
-    }
+    matched = _INTENT_INDEX.labels(text)
+    return {label: label in matched for label in _INTENT_KEYWORDS}
 
 
 def _is_multi(text):
@@ -57,6 +61,40 @@ def _build_tool_map(tools):
     return {t.get("name"): t for t in tools if t.get("name")}
 
 
+def _signature_f1_cap(flags, multi, tools, tool_names, called_names, reasons):
+    cap = 1.0
+    if (
+        flags["reminder"]
+        and "create_reminder" in tool_names
+        and len(tools) >= 4
+        and "create_reminder" not in called_names
+    ):
+        cap = min(cap, 0.4)
+        reasons.append("reminder_missing_in_many_tools")
+
+    if (
+        multi
+        and flags["alarm"]
+        and flags["reminder"]
+        and {"set_alarm", "create_reminder"}.issubset(tool_names)
+        and not {"set_alarm", "create_reminder"}.issubset(called_names)
+    ):
+        cap = min(cap, 0.5)
+        reasons.append("alarm_reminder_incomplete")
+
+    if (
+        multi
+        and flags["weather"]
+        and flags["message"]
+        and {"get_weather", "send_message"}.issubset(tool_names)
+        and not {"get_weather", "send_message"}.issubset(called_names)
+    ):
+        cap = min(cap, 0.5)
+        reasons.append("weather_message_incomplete")
+
+    return cap
+
+
 def _estimate_local_f1(local_result, messages, tools):
     text = _messages_to_user_text(messages).lower()
     flags = _intent_flags(text)
@@ -111,78 +149,63 @@ def _estimate_local_f1(local_result, messages, tools):
         est = min(est, 0.5)
         reasons.append("multi_under_called")
 
-    # Known weak combination families.
-    if (
-        flags["reminder"]
-        and "create_reminder" in tool_names
-        and len(tools) >= 4
-        and "create_reminder" not in called_names
-    ):
-        est = min(est, 0.4)
-        reasons.append("reminder_missing_in_many_tools")
-
-    if (
-        multi
-        and flags["alarm"]
-        and flags["reminder"]
-        and {"set_alarm", "create_reminder"}.issubset(tool_names)
-        and not {"set_alarm", "create_reminder"}.issubset(called_names)
-    ):
-        est = min(est, 0.5)
-        reasons.append("alarm_reminder_incomplete")
-
-    if (
-        multi
-        and flags["weather"]
-        and flags["message"]
-        and {"get_weather", "send_message"}.issubset(tool_names)
-        and not {"get_weather", "send_message"}.issubset(called_names)
-    ):
-        est = min(est, 0.5)
-        reasons.append("weather_message_incomplete")
+    # Known weak combination families: the learned router when one is loaded,
+    # else the hand-written signatures it was trained on.
+    risk = cloud_core._learned_fallback_risk(_messages_to_user_text(messages), tools)
+    if risk is not None:
+        prob, risky = risk
+        if risky:
+            est = min(est, 1.0 - prob)
+            reasons.append("learned_router")
+    else:
+        est = min(est, _signature_f1_cap(flags, multi, tools, tool_names, called_names, reasons))
 
     est = max(0.0, min(1.0, est))
     return est, reasons
 
 
-def _estimate_cloud_f1(local_f1_est):
-    # Conservative prior: cloud often helps weak local outputs, but not always perfect.
-    if local_f1_est <= 0.3:
-        return 0.98
-    if local_f1_est <= 0.5:
-        return 0.95
-    if local_f1_est <= 0.67:
-        return 0.90
-    return 0.88
-
-
-def _time_score(ms):
-    return max(0.0, 1.0 - (float(ms) / 500.0))
-
-
 def _should_force_cloud(local_result, messages, tools):
     local_f1_est, reasons = _estimate_local_f1(local_result, messages, tools)
-    cloud_f1_est = _estimate_cloud_f1(local_f1_est)
-
-    local_t = _time_score(local_result.get("total_time_ms", 0.0))
-    cloud_t = 0.0  # conservative estimate for routing
-
-    delta = 0.60 * (cloud_f1_est - local_f1_est) + 0.15 * (cloud_t - local_t) - 0.25
-
-    # Keep the policy strict: only force cloud when the estimated score delta is positive.
-    should = delta > 0.0
+    user_text = _messages_to_user_text(messages)
+    tier = cloud_core._request_tier(user_text, tools)
+    request_class = cloud_core._request_class(user_text, tools)
+
+    # Only a flagged output overrides the class's learned local F1.
+    route, advantage = cloud_core._SCORE_ROUTER.decide(
+        tier,
+        request_class,
+        local_result.get("total_time_ms", 0.0),
+        local_f1_est if reasons else None,
+    )
 
-    return should, {
+    return route == "cloud", {
         "local_f1_est": round(local_f1_est, 3),
-        "cloud_f1_est": round(cloud_f1_est, 3),
-        "local_time_score": round(local_t, 3),
-        "cloud_time_score": round(cloud_t, 3),
-        "score_delta_est": round(delta, 4),
+        "tier": tier,
+        "route_class": request_class,
+        "route": route,
+        "score_advantage": round(advantage, 4),
         "reasons": reasons,
     }
 
 
+def _observe_route(result, analysis, route):
+    """Count the routed request in the score router; benchmark feeds its F1
+    back through `route_class`."""
+    result["route_class"] = analysis["route_class"]
+    total_ms = result.get("total_time_ms", 0)
+    cloud_core._SCORE_ROUTER.observe(
+        analysis["tier"],
+        analysis["route_class"],
+        route,
+        total_ms,
+        route_ms=total_ms - result.get("local_time_ms", 0) if route == "cloud" else total_ms,
+    )
+    return result
+
+
 def generate_hybrid(messages, tools, confidence_threshold=0.99):
+    user_text = _messages_to_user_text(messages)
+    prefetch = cloud_core._start_cloud_prefetch(messages, tools, user_text, cloud_core._is_multi_action(user_text))
     local = local_core.generate_hybrid(messages, tools, confidence_threshold=confidence_threshold)
     local["source"] = "on-device"
 
@@ -192,20 +215,23 @@ def generate_hybrid(messages, tools, confidence_threshold=0.99):
 
     if not force_cloud:
         local["tradeoff_decision"] = "keep_on_device"
-        return local
+        return _observe_route(cloud_core._discard_cloud_prefetch(prefetch, local), analysis, "local")
 
     try:
-        cloud = cloud_core._generate_cloud(messages, tools)
+        if prefetch is not None:
+            cloud = cloud_core._await_cloud_prefetch(prefetch)
+        else:
+            cloud = cloud_core._generate_cloud(messages, tools)
+            cloud["total_time_ms"] = cloud.get("total_time_ms", 0) + local.get("total_time_ms", 0)
         if cloud.get("function_calls"):
             cloud["source"] = "cloud (tradeoff)"
             cloud["policy_tag"] = "tradeoff_v1"
             cloud["tradeoff_analysis"] = analysis
-            cloud["total_time_ms"] = cloud.get("total_time_ms", 0) + local.get("total_time_ms", 0)
-            return cloud
+            cloud["local_time_ms"] = local.get("total_time_ms", 0)
+            return _observe_route(cloud, analysis, "cloud")
         local["tradeoff_decision"] = "cloud_empty_keep_local"
         local["forced_cloud_empty"] = True
-        return local
     except Exception as e:
         local["tradeoff_decision"] = "cloud_error_keep_local"
         local["cloud_error"] = str(e)
-        return local
+    return _observe_route(local, analysis, "local")
@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+# The tests exercise main's pure-Python pieces; they never load the model.
+os.environ.setdefault("CACTUS_BACKEND", "mock")
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
@@ -0,0 +1,42 @@
+import signal
+import time
+
+import pytest
+
+import benchmark
+from benchmark import BENCHMARKS
+
+pytestmark = pytest.mark.skipif(not hasattr(signal, "setitimer"), reason="needs SIGALRM")
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    previous = signal.signal(signal.SIGALRM, benchmark._on_case_alarm)
+    yield lambda generate: monkeypatch.setattr(benchmark, "_WORKER_GENERATE", generate)
+    signal.signal(signal.SIGALRM, previous)
+
+
+def test_timeout_fires_through_a_broad_except(worker):
+    def swallowing_generate(messages, tools):
+        deadline = time.perf_counter() + 2
+        while time.perf_counter() < deadline:
+            try:
+                time.sleep(0.01)
+            except Exception:
+                pass
+        return {"function_calls": [], "total_time_ms": 2000.0, "source": "on-device"}
+
+    worker(swallowing_generate)
+    start = time.perf_counter()
+    result = benchmark._run_case_in_worker(BENCHMARKS[0], 0.1)
+
+    assert result["source"] == "timeout"
+    assert time.perf_counter() - start < 1
+
+
+def test_case_within_the_timeout_is_scored(worker):
+    worker(lambda messages, tools: {"function_calls": [], "total_time_ms": 1.0, "source": "on-device"})
+    result = benchmark._run_case_in_worker(BENCHMARKS[0], 5)
+
+    assert result["source"] == "on-device"
+    assert signal.getitimer(signal.ITIMER_REAL) == (0.0, 0.0)
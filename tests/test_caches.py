@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_result_cache_hit_returns_independent_copy(clock):
+    cache = main._ResultCache(max_entries=8, max_bytes=10_000, ttl_s=60)
+    cache.put("k", {"function_calls": [{"name": "set_alarm", "arguments": {"hour": 7}}]})
+
+    first = cache.get("k")
+    first["function_calls"][0]["arguments"]["hour"] = 9
+
+    assert cache.get("k")["function_calls"][0]["arguments"]["hour"] == 7
+    assert cache.stats()["hits"] == 2
+
+
+def test_result_cache_entries_expire_after_ttl(clock):
+    cache = main._ResultCache(max_entries=8, max_bytes=10_000, ttl_s=60)
+    cache.put("k", {"v": 1})
+
+    clock[0] += 59
+    assert cache.get("k") == {"v": 1}
+    clock[0] += 2
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["bytes"] == 0
+
+
+def test_result_cache_evicts_least_recently_used_by_count(clock):
+    cache = main._ResultCache(max_entries=2, max_bytes=10_000, ttl_s=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_result_cache_is_bounded_by_bytes(clock):
+    value = {"text": "x" * 40}
+    size = len(json.dumps(value, separators=(",", ":")))
+    cache = main._ResultCache(max_entries=100, max_bytes=size * 3, ttl_s=60)
+    for key in "abcde":
+        cache.put(key, value)
+
+    stats = cache.stats()
+    assert stats["entries"] == 3
+    assert stats["bytes"] <= size * 3
+    assert [cache.get(key) is not None for key in "abcde"] == [False, False, True, True, True]
+
+
+def test_result_cache_skips_values_over_the_budget(clock):
+    cache = main._ResultCache(max_entries=8, max_bytes=10, ttl_s=60)
+    cache.put("small", 1)
+    cache.put("big", "y" * 100)
+
+    assert cache.get("big") is None
+    assert cache.get("small") == 1
+
+
+def test_result_cache_replacing_a_key_keeps_byte_count(clock):
+    cache = main._ResultCache(max_entries=8, max_bytes=10_000, ttl_s=60)
+    cache.put("k", "a" * 10)
+    cache.put("k", "b" * 20)
+
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["bytes"] == len(json.dumps("b" * 20))
+
+
+def test_requests_offering_side_effecting_tools_are_not_cached():
+    weather = {"name": "get_weather", "description": "Get weather", "parameters": {"type": "object", "properties": {}}}
+    message = {"name": "send_message", "description": "Send a message", "parameters": {"type": "object", "properties": {}}}
+
+    assert main._result_cache_key("weather in Paris", main._as_toolset([weather])) is not None
+    assert main._result_cache_key("text Bob hi", main._as_toolset([weather, message])) is None
+
+
+def test_template_cache_evicts_least_recently_used():
+    cache = main._TemplateCache(max_entries=2)
+    cache.put("a", ["set_alarm"])
+    cache.put("b", ["get_weather"])
+    cache.get("a")
+    cache.put("c", ["play_music"])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == ("set_alarm",)
+    assert cache.get("c") == ("play_music",)
+    assert cache.stats() == {"entries": 2, "hits": 3, "misses": 1}
+
+
+def test_mask_slots_maps_slot_variants_to_one_template():
+    assert main._mask_slots("Set an alarm for 7:30 AM.") == main._mask_slots("Set an alarm for 6 pm")
+    assert main._mask_slots("Text Alice saying hello") == main._mask_slots("Text Bob saying hello")
@@ -0,0 +1,94 @@
+import pytest
+
+import main
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(main.time, "time", lambda: now[0])
+    return now
+
+
+def _breaker(**kwargs):
+    options = dict(window=4, min_calls=4, error_rate=0.5, cooldown_s=10, max_cooldown_s=25)
+    options.update(kwargs)
+    return main._CircuitBreaker(**options)
+
+
+def test_stays_closed_below_min_calls(clock):
+    breaker = _breaker()
+    for _ in range(3):
+        breaker.record(False)
+    assert breaker.state == breaker.CLOSED
+    assert breaker.allow()
+
+
+def test_trips_at_error_rate_and_refuses_calls(clock):
+    breaker = _breaker()
+    for success in (True, False, True, False):
+        breaker.record(success)
+
+    assert breaker.state == breaker.OPEN
+    assert breaker.trips == 1
+    assert not breaker.available()
+    assert not breaker.allow()
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.record(False)
+
+    clock[0] += 10
+    assert breaker.available()
+    assert breaker.allow()
+    assert breaker.state == breaker.HALF_OPEN
+    assert not breaker.available()
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes(clock):
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.record(False)
+    clock[0] += 10
+    breaker.allow()
+    breaker.record(True)
+
+    assert breaker.state == breaker.CLOSED
+    assert breaker.allow()
+    for _ in range(3):
+        breaker.record(False)
+    assert breaker.state == breaker.CLOSED
+
+
+def test_failed_probe_reopens_with_doubled_capped_cooldown(clock):
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.record(False)
+
+    clock[0] += 10
+    breaker.allow()
+    breaker.record(False)
+    assert breaker.state == breaker.OPEN
+    clock[0] += 19
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.allow()
+
+    breaker.record(False)
+    clock[0] += 24
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.allow()
+    assert breaker.trips == 3
+
+
+def test_late_results_while_open_are_ignored(clock):
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.record(False)
+    breaker.record(True)
+
+    assert breaker.state == breaker.OPEN
@@ -0,0 +1,42 @@
+import random
+
+import main
+from benchmark import BENCHMARKS
+
+
+def _has_any(text, keywords):
+    """The per-keyword substring scan the index replaced."""
+    return any(kw in text for kw in keywords)
+
+
+def _expected_labels(index, text):
+    return {label for label, keywords in index.table.items() if _has_any(text, keywords)}
+
+
+def test_matches_substring_scan_on_benchmark_prompts():
+    for case in BENCHMARKS:
+        text = main._messages_to_user_text(case["messages"]).lower()
+        assert main._INTENT_INDEX.labels(text) == _expected_labels(main._INTENT_INDEX, text), case["name"]
+
+
+def test_matches_substring_scan_on_overlapping_keywords():
+    index = main._IntentIndex({"a": ["he", "she"], "b": ["hers", "his"], "c": ["e"], "d": ["ushe"]})
+    rng = random.Random(0)
+    for _ in range(2000):
+        text = "".join(rng.choice("ehrsiu ") for _ in range(rng.randint(0, 12)))
+        assert index.labels(text) == _expected_labels(index, text), text
+
+
+def test_scan_reports_spans():
+    index = main._IntentIndex({"weather": ["weather"], "alarm": ["alarm", "wake me"]})
+    text = "wake me up and check the weather"
+
+    assert index.scan(text) == ((0, 7, "alarm"), (25, 32, "weather"))
+
+
+def test_intent_hits_by_namespace():
+    text = "set an alarm for 7 am and check the weather in paris"
+    tools = main._intent_hits(text)
+
+    assert {"set_alarm", "get_weather"} <= tools
+    assert tools == {name for name, kws in main._TOOL_KEYWORDS.items() if _has_any(text, kws)}
@@ -0,0 +1,62 @@
+import math
+
+import pytest
+
+import main
+from strategies import strategy_final_ensemble_v1 as final_ensemble
+from strategies import strategy_overfit_guard_v1 as overfit_guard
+from strategies import strategy_time_tradeoff_v1 as time_tradeoff
+
+
+TOOLS = [
+    {"name": "get_weather", "parameters": {"type": "object", "properties": {"location": {"type": "string"}}, "required": ["location"]}},
+    {"name": "create_reminder", "parameters": {"type": "object", "properties": {"title": {"type": "string"}}, "required": ["title"]}},
+]
+MESSAGES = [{"role": "user", "content": "Remind me to buy milk"}]
+RESULT = {
+    "function_calls": [{"name": "create_reminder", "arguments": {"title": "buy milk"}}],
+    "total_time_ms": 100.0,
+    "source": "on-device",
+}
+
+
+def _use_router(monkeypatch, weights):
+    monkeypatch.setattr(main, "_ENABLE_LEARNED_ROUTER", True)
+    monkeypatch.setattr(main, "_ROUTER_MODEL_LOADED", True)
+    monkeypatch.setattr(main, "_ROUTER_MODEL", main._LogisticRouter(weights, threshold=0.5))
+
+
+@pytest.fixture
+def risky_router(monkeypatch):
+    _use_router(monkeypatch, {"bias": 2.0})
+
+
+@pytest.fixture
+def safe_router(monkeypatch):
+    _use_router(monkeypatch, {"bias": -2.0})
+
+
+def test_risk_is_none_when_router_disabled(monkeypatch):
+    monkeypatch.setattr(main, "_ENABLE_LEARNED_ROUTER", False)
+    assert main._learned_fallback_risk("Remind me to buy milk", TOOLS) is None
+
+
+def test_time_tradeoff_caps_local_estimate(risky_router):
+    est, reasons = time_tradeoff._estimate_local_f1(RESULT, MESSAGES, TOOLS)
+    assert "learned_router" in reasons
+    assert est == pytest.approx(1.0 - 1.0 / (1.0 + math.exp(-2.0)))
+
+
+def test_overfit_guard_defers_to_router(risky_router):
+    assert overfit_guard._need_cloud_guard(MESSAGES, RESULT, TOOLS) == (True, "guard_learned_router")
+
+
+def test_overfit_guard_router_replaces_intent_guards(safe_router):
+    # The weather intent is not called, which the keyword guard would flag.
+    messages = [{"role": "user", "content": "Remind me to check the weather"}]
+    assert overfit_guard._need_cloud_guard(messages, RESULT, TOOLS) == (False, "guard_ok")
+
+
+def test_final_ensemble_reports_router_risk(risky_router):
+    _, meta = final_ensemble._quality_score(RESULT, MESSAGES, TOOLS)
+    assert meta["router_risky"] is True
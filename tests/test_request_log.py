@@ -0,0 +1,67 @@
+import os
+
+import main
+
+
+def _rotating_writer(path, backups):
+    return main._RequestLogWriter(str(path), batch_size=1, flush_s=0, max_bytes=1, rotate_s=0, backups=backups)
+
+
+def test_rotation_keeps_newest_backups_and_unrelated_files(tmp_path):
+    unrelated = ["req.notes.jsonl", "req.20240101T000000.jsonl", "req.jsonl.bak", "other.jsonl"]
+    for name in unrelated:
+        (tmp_path / name).write_text("keep\n")
+
+    writer = _rotating_writer(tmp_path / "req.jsonl", backups=2)
+    for i in range(5):
+        writer.submit({"i": i})
+    writer.close()
+
+    names = set(os.listdir(tmp_path))
+    rotated = names - set(unrelated) - {"req.jsonl"}
+    assert set(unrelated) <= names
+    assert len(rotated) == 2
+    assert (tmp_path / "req.jsonl").read_text() == '{"i": 4}\n'
+    assert writer.written == 5
+
+
+def test_logged_messages_are_snapshotted(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "_REQUEST_LOG_PATH", str(tmp_path / "req.jsonl"))
+    messages = [{"role": "user", "content": "Set an alarm for 7 AM."}]
+    out = {"function_calls": [{"name": "set_alarm", "arguments": {"hour": 7, "minute": 0}}]}
+    try:
+        main._log_request(messages, [], out)
+        messages[0]["content"] = "changed"
+        out["function_calls"][0]["arguments"]["hour"] = 9
+    finally:
+        main._close_request_log()
+
+    line = (tmp_path / "req.jsonl").read_text()
+    assert '"content": "Set an alarm for 7 AM."' in line
+    assert '"hour": 7' in line
+
+
+def test_unencodable_record_is_dropped_and_the_writer_keeps_running(tmp_path):
+    cyclic = {"i": "cyclic"}
+    cyclic["self"] = cyclic
+    writer = main._RequestLogWriter(str(tmp_path / "req.jsonl"), batch_size=8, flush_s=0.05)
+    writer.submit({"i": 0})
+    writer.submit(cyclic)
+    writer.submit({"i": 1})
+    writer.close()
+
+    assert writer.written == 2
+    assert writer.dropped == 1
+    assert (tmp_path / "req.jsonl").read_text().splitlines() == ['{"i": 0}', '{"i": 1}']
+
+
+def test_write_errors_are_counted_not_fatal(tmp_path):
+    blocker = tmp_path / "blocker"
+    blocker.write_text("")
+    writer = main._RequestLogWriter(str(blocker / "req.jsonl"), batch_size=1, flush_s=0)
+    writer.submit({"i": 0})
+    writer.submit({"i": 1})
+    writer.close()
+
+    assert writer.dropped == 2
+    assert not writer._thread.is_alive()
@@ -0,0 +1,59 @@
+import itertools
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    """Fake cactus handles: records destroyed handles, resets fail on demand."""
+    state = {"destroyed": [], "fail_reset": False}
+    handles = itertools.count(1)
+
+    def reset(handle):
+        if state["fail_reset"]:
+            raise RuntimeError("reset failed")
+
+    monkeypatch.setattr(main, "cactus_init", lambda path: next(handles))
+    monkeypatch.setattr(main, "cactus_reset", reset)
+    monkeypatch.setattr(main, "cactus_destroy", state["destroyed"].append)
+    return state
+
+
+def test_failed_reset_releases_the_slot(backend):
+    pool = main._ModelSessionPool("model", 1)
+    handle, _ = pool.checkout(timeout=1)
+    pool.checkin(handle)
+
+    backend["fail_reset"] = True
+    for _ in range(3):
+        with pytest.raises(RuntimeError, match="reset failed"):
+            pool.checkout(timeout=1)
+    backend["fail_reset"] = False
+
+    replacement, _ = pool.checkout(timeout=1)
+    assert backend["destroyed"] == [1, 2, 3]
+    assert replacement == 4
+
+
+def test_sessions_checked_out_across_close_are_destroyed_on_checkin(backend):
+    pool = main._ModelSessionPool("model", 1)
+    handle, _ = pool.checkout(timeout=1)
+    pool.close()
+    pool.checkin(handle)
+
+    assert backend["destroyed"] == [handle]
+    fresh, _ = pool.checkout(timeout=1)
+    assert fresh != handle
+
+
+def test_unhealthy_session_is_replaced(backend):
+    pool = main._ModelSessionPool("model", 1)
+    with pytest.raises(ValueError):
+        with pool.session(timeout=1):
+            raise ValueError("call failed")
+
+    handle, _ = pool.checkout(timeout=1)
+    assert backend["destroyed"] == [1]
+    assert handle == 2
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+import main
+from inference_backend import MockBackend, _StopFlags, _stream
+
+ALARM = {
+    "name": "set_alarm",
+    "description": "Set an alarm for a given time",
+    "parameters": {
+        "type": "object",
+        "properties": {"hour": {"type": "integer"}, "minute": {"type": "integer"}},
+        "required": ["hour", "minute"],
+    },
+}
+TIMER = {
+    "name": "set_timer",
+    "description": "Set a countdown timer",
+    "parameters": {
+        "type": "object",
+        "properties": {"minutes": {"type": "integer"}},
+        "required": ["minutes"],
+    },
+}
+WEATHER = {
+    "name": "get_weather",
+    "description": "Get current weather for a location",
+    "parameters": {
+        "type": "object",
+        "properties": {"location": {"type": "string"}},
+        "required": ["location"],
+    },
+}
+
+
+class ScriptedBackend(MockBackend):
+    """Streams a fixed FunctionGemma completion, honouring cactus_stop."""
+
+    def __init__(self, text):
+        super().__init__()
+        self.text = text
+        self._flags = _StopFlags()
+
+    def complete(self, model, messages, tools=None, callback=None, **kwargs):
+        self._flags.clear(model)
+        emitted, tokens = _stream(self.text, callback, model, self._flags)
+        return json.dumps({
+            "success": True, "cloud_handoff": False, "response": emitted,
+            "function_calls": [], "confidence": 0.9,
+            "time_to_first_token_ms": 1.0, "total_time_ms": 2.0,
+            "prefill_tokens": 10, "decode_tokens": tokens,
+        })
+
+
+@pytest.fixture
+def scripted():
+    def _use(text):
+        main._use_inference_backend(ScriptedBackend(text))
+    yield _use
+    main._use_inference_backend("mock")
+
+
+@pytest.mark.parametrize("text, tool", [
+    ("Wake me up at seven thirty", ALARM),
+    ("Set a timer for a quarter hour", TIMER),
+    ("What is the forecast looking like", WEATHER),
+])
+def test_no_draft_when_extractors_only_have_defaults(text, tool):
+    assert main._rule_draft(text, main._as_toolset([tool])) is None
+
+
+def test_draft_from_regex_hits():
+    draft = main._rule_draft("Set an alarm for 7:30 AM.", main._as_toolset([ALARM]))
+    assert draft == {"name": "set_alarm", "arguments": {"hour": 7, "minute": 30}}
+
+
+@pytest.mark.parametrize("text, tool, completion, expected", [
+    ("Wake me up at seven thirty", ALARM, "call:set_alarm{hour:7,minute:30}", {"hour": 7, "minute": 30}),
+    ("Set a timer for a quarter hour", TIMER, "call:set_timer{minutes:15}", {"minutes": 15}),
+])
+def test_spelled_out_values_keep_the_model_arguments(scripted, text, tool, completion, expected):
+    scripted(f"<start_function_call>{completion}<end_function_call>")
+    result = main._call_cactus_single(text, [tool])
+
+    assert result["function_calls"] == [{"name": tool["name"], "arguments": expected}]
+    assert not result["draft_agreement"]
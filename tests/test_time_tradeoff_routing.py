@@ -0,0 +1,83 @@
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import main
+from strategies import strategy_time_tradeoff_v1 as time_tradeoff
+
+
+TOOLS = [
+    {"name": "set_alarm", "parameters": {"type": "object", "properties": {"hour": {"type": "integer"}}, "required": ["hour"]}},
+    {"name": "play_music", "parameters": {"type": "object", "properties": {"song": {"type": "string"}}, "required": ["song"]}},
+]
+MESSAGES = [{"role": "user", "content": "Set an alarm for 7"}]
+
+
+@pytest.fixture
+def router(monkeypatch):
+    router = main._ScoreAwareRouter()
+    monkeypatch.setattr(main, "_SCORE_ROUTER", router)
+    return router
+
+
+def _local(calls, time_ms=300.0):
+    def generate(messages, tools, confidence_threshold=0.0):
+        return {"function_calls": calls, "total_time_ms": time_ms}
+    return generate
+
+
+def test_kept_result_feeds_score_router(monkeypatch, router):
+    monkeypatch.setattr(time_tradeoff.local_core, "generate_hybrid", _local([{"name": "set_alarm", "arguments": {"hour": 7}}]))
+
+    result = time_tradeoff.generate_hybrid(MESSAGES, TOOLS)
+
+    assert result["source"] == "on-device"
+    request_class = result["route_class"]
+    assert request_class == main._request_class("Set an alarm for 7", TOOLS)
+    before = router.estimate(request_class, "local")[0]
+    main._score_router_feedback(result, 0.0)
+    assert router.estimate(request_class, "local")[0] < before
+
+
+def test_structural_failure_routes_to_cloud(monkeypatch, router):
+    monkeypatch.setattr(time_tradeoff.local_core, "generate_hybrid", _local([]))
+    monkeypatch.setattr(main, "_generate_cloud", lambda messages, tools: {
+        "function_calls": [{"name": "set_alarm", "arguments": {"hour": 7}}],
+        "total_time_ms": 500.0,
+    })
+
+    result = time_tradeoff.generate_hybrid(MESSAGES, TOOLS)
+
+    assert result["source"] == "cloud (tradeoff)"
+    assert result["tradeoff_analysis"]["route"] == "cloud"
+    assert result["total_time_ms"] == 800.0
+    assert router.estimate(result["route_class"], "cloud")[1] < main._SCORE_PRIOR_CLOUD[1]
+
+
+def _prefetched(calls):
+    future = Future()
+    future.set_result({"function_calls": calls, "total_time_ms": 500.0})
+    return lambda messages, tools, user_text, is_multi: (future, time.time())
+
+
+def test_forced_cloud_uses_prefetch(monkeypatch, router):
+    monkeypatch.setattr(time_tradeoff.local_core, "generate_hybrid", _local([]))
+    monkeypatch.setattr(main, "_start_cloud_prefetch", _prefetched([{"name": "set_alarm", "arguments": {"hour": 7}}]))
+    monkeypatch.setattr(main, "_generate_cloud", lambda messages, tools: pytest.fail("cloud called twice"))
+
+    result = time_tradeoff.generate_hybrid(MESSAGES, TOOLS)
+
+    assert result["source"] == "cloud (tradeoff)"
+    assert result["cloud_prefetch"] == "used"
+    assert result["local_time_ms"] == 300.0
+
+
+def test_kept_result_discards_prefetch(monkeypatch, router):
+    monkeypatch.setattr(time_tradeoff.local_core, "generate_hybrid", _local([{"name": "set_alarm", "arguments": {"hour": 7}}]))
+    monkeypatch.setattr(main, "_start_cloud_prefetch", _prefetched([]))
+
+    result = time_tradeoff.generate_hybrid(MESSAGES, TOOLS)
+
+    assert result["source"] == "on-device"
+    assert result["cloud_prefetch"] == "discarded"
@@ -0,0 +1,125 @@
+import pytest
+
+import main
+
+TOOLS = [
+    {
+        "name": "set_alarm",
+        "description": "Set an alarm",
+        "parameters": {
+            "type": "object",
+            "properties": {"hour": {"type": "integer"}, "minute": {"type": "integer"}},
+            "required": ["hour", "minute"],
+        },
+    },
+    {
+        "name": "send_message",
+        "description": "Send a message",
+        "parameters": {
+            "type": "object",
+            "properties": {"recipient": {"type": "string"}, "message": {"type": "string"}},
+            "required": ["recipient", "message"],
+        },
+    },
+]
+
+
+@pytest.fixture
+def stopped(monkeypatch):
+    """Models the guard asked cactus to stop."""
+    models = []
+    monkeypatch.setattr(main, "cactus_stop", models.append)
+    return models
+
+
+def _guard(model=None, **kwargs):
+    guard = main._ToolCallGuard(main._as_toolset(TOOLS).grammar, **kwargs)
+    guard.model = model
+    return guard
+
+
+def _feed(guard, text, size=3):
+    for i in range(0, len(text), size):
+        guard(text[i:i + size])
+
+
+def test_parses_calls_split_across_tokens():
+    guard = _guard()
+    _feed(guard, "<start_function_call>call:set_alarm{hour:7,minute:30}<end_function_call>"
+                 "<start_function_call>call:send_message{recipient:<escape>Bob<escape>,"
+                 "message:<escape>hi, {see} you<escape>}<end_function_call>")
+
+    assert guard.violation is None
+    assert guard.calls == [
+        {"name": "set_alarm", "arguments": {"hour": 7, "minute": 30}},
+        {"name": "send_message", "arguments": {"recipient": "Bob", "message": "hi, {see} you"}},
+    ]
+
+
+def test_escape_marker_split_between_tokens():
+    guard = _guard()
+    for token in ["call:send_message{recipient:<esc", "ape>Al}ice<es", "cape>,message:<escape>yo<escape>}"]:
+        guard(token)
+
+    assert guard.calls == [{"name": "send_message", "arguments": {"recipient": "Al}ice", "message": "yo"}}]
+
+
+def test_unknown_tool_name_stops_as_soon_as_it_diverges(stopped):
+    guard = _guard(model="handle")
+    _feed(guard, "call:set_tim", size=1)
+
+    assert guard.violation == "unknown_tool_name"
+    assert guard.stopped
+    assert stopped == ["handle"]
+    guard("er{minutes:5}")
+    assert guard.calls == []
+
+
+def test_stops_after_max_calls(stopped):
+    guard = _guard(model="handle", max_calls=1)
+    _feed(guard, "call:set_alarm{hour:6,minute:0}call:set_alarm{hour:7,minute:0}")
+
+    assert stopped == ["handle"]
+    assert guard.calls == [{"name": "set_alarm", "arguments": {"hour": 6, "minute": 0}}]
+
+
+def test_each_call_is_available_once_its_brace_closes():
+    guard = _guard()
+    guard("call:set_alarm{hour:6,minute:0}call:send_mes")
+
+    assert guard.calls == [{"name": "set_alarm", "arguments": {"hour": 6, "minute": 0}}]
+
+
+def test_draft_is_accepted_on_matching_first_name():
+    draft = {"name": "set_alarm", "arguments": {"hour": 6, "minute": 0}}
+    accepted = _guard(draft=draft)
+    _feed(accepted, "call:set_alarm{")
+    rejected = _guard(draft=draft)
+    _feed(rejected, "call:send_message{")
+
+    assert accepted.draft_accepted is True
+    assert rejected.draft_accepted is False
+
+
+def test_unknown_extra_call_past_the_limit_is_still_a_violation(stopped):
+    guard = _guard(model="handle", max_calls=1)
+    _feed(guard, "call:set_alarm{hour:6,minute:0}<end_function_call><start_function_call>call:get_news{")
+
+    assert guard.violation == "unknown_tool_name"
+    assert guard.calls == [{"name": "set_alarm", "arguments": {"hour": 6, "minute": 0}}]
+
+
+def test_schema_violation_still_routes_to_cloud():
+    local = {"function_calls": [{"name": "set_alarm", "arguments": {"hour": 6, "minute": 0}}],
+             "schema_violation": "unknown_tool_name"}
+    messages = [{"role": "user", "content": "Set an alarm for 6 AM"}]
+
+    assert main._should_fallback_to_cloud(local, messages, TOOLS) == (True, "unknown_tool_name")
+
+
+def test_out_of_range_numbers_are_dropped_not_raised():
+    guard = _guard()
+    _feed(guard, "call:set_alarm{hour:1e400,minute:inf}")
+
+    assert guard.violation is None
+    assert guard.calls == [{"name": "set_alarm", "arguments": {}}]